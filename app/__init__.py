@@ -5,8 +5,9 @@ from flask_wtf.csrf import CSRFProtect
 from flask_mail import Mail
 from config import Config
 from datetime import timedelta
+from app.utils.db_engine import SesionClinica
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': SesionClinica})
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Por favor inicie sesión para acceder a esta página.'
@@ -30,10 +31,31 @@ def create_app(config_class=Config):
     if backup_dir:
         Path(backup_dir).mkdir(parents=True, exist_ok=True)
     
+    from app.utils.log_pipeline import log_pipeline
+    log_pipeline.init_app(app)
+
+    from app.utils.db_engine import aplicar_opciones, configurar_engines
+    aplicar_opciones(app)
     db.init_app(app)
+    configurar_engines(app, db)
     login_manager.init_app(app)
     csrf.init_app(app)
     mail.init_app(app)
+
+    from app.utils.report_cache import report_cache
+    report_cache.init_app(app)
+
+    from app.utils.pdf_assets import pdf_assets
+    pdf_assets.init_app(app)
+
+    from app.utils.charts import charts
+    charts.init_app(app)
+
+    from app.utils.perf import perf
+    perf.init_app(app, db)
+
+    from app.utils.metrics import metrics
+    metrics.init_app(app, db)
     
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -1,21 +1,21 @@
-from flask import flash, redirect, url_for, send_file, abort, current_app
+from flask import flash, redirect, url_for, send_file, abort, jsonify
 from flask_login import login_required, current_user
 from app.main import bp
-from app.models import Paciente, Consulta
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER
-from reportlab.pdfgen import canvas as rl_canvas
+from app import db
+from app.models import Consulta, PdfJob
+from app.utils.pdf_jobs import pdf_jobs
+from app.utils.pdf_cache import pdf_cache, grupo_consulta
+from app.utils.metrics import metrics
+from sqlalchemy import inspect as sa_inspect
 import io
 from datetime import datetime
 import os
 from zoneinfo import ZoneInfo
 
-# Importar generadores de gráficos
-from app.main.plot_generator import plot_genero, plot_edades_rangos, plot_consultas_mes, plot_enfermedades_comunes, plot_problemas_por_sistemas
+# Datos y gráficos del PDF de reportes
+from app.main.plot_generator import GRAFICOS_REPORTE, datos_reporte
+from app.utils.charts import charts
+from app.utils.db_engine import solo_lectura
 
 # Importar decorador de roles y variable de disponibilidad de ReportLab
 from .routes import role_required, REPORTLAB_AVAILABLE
@@ -28,180 +28,128 @@ def _fecha_guatemala_str(formato='%d/%m/%Y'):
         # Fallback: hora local del sistema
         return datetime.now().strftime(formato)
 
+# Versión de las plantillas de receta y consulta: incrementarla al cambiar el
+# diseño invalida los PDF guardados en la caché
+PLANTILLA_VERSION = {'receta': 1, 'consulta': 1}
+
+def _huella_consulta(consulta, tipo):
+    """Todo lo que se imprime en el PDF de una consulta (base de la clave de caché)."""
+    datos = {attr.key: getattr(consulta, attr.key) for attr in sa_inspect(Consulta).column_attrs}
+    paciente, medico, clinica = consulta.paciente, consulta.medico, consulta.clinica
+    datos['paciente'] = [paciente.nombre_completo, paciente.edad] if paciente else None
+    datos['medico'] = medico.nombre_completo if medico else None
+    datos['clinica'] = clinica.nombre if clinica else None
+    if tipo == 'receta':
+        # La receta lleva la fecha del día en que se imprime
+        datos['fecha_impresion'] = _fecha_guatemala_str()
+    return datos
+
+def _pdf_consulta(tipo, consulta, construir):
+    """Entrada de la caché para el PDF de ``tipo``; se construye solo si no existe."""
+    clave = pdf_cache.clave(grupo_consulta(consulta.id), tipo, PLANTILLA_VERSION[tipo],
+                            _huella_consulta(consulta, tipo))
+    return pdf_cache.obtener_o_generar(clave, lambda: construir(consulta))
+
+def _enviar_pdf_cacheado(entrada):
+    # Desde disco: ETag = clave de contenido, If-None-Match / Range los resuelve send_file
+    respuesta = send_file(
+        entrada.ruta,
+        as_attachment=True,
+        download_name=entrada.nombre,
+        mimetype='application/pdf',
+        etag=entrada.clave,
+        conditional=True
+    )
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+def _consulta_o_error(consulta_id):
+    consulta = db.session.get(Consulta, consulta_id)
+    if consulta is None:
+        raise LookupError(f'La consulta {consulta_id} no existe')
+    return consulta
+
 @bp.route('/exportar_reportes_pdf')
 @login_required
 @role_required('medico', 'admin')
+@solo_lectura
 def exportar_reportes_pdf():
     """Genera un PDF con un resumen de los reportes estadísticos."""
     if not REPORTLAB_AVAILABLE:
         flash('La librería ReportLab es necesaria para generar PDFs.', 'error')
         return redirect(url_for('main.reportes_medicos'))
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    # Alcance igual al de la UI
+    is_medico_scoped = getattr(current_user, 'rol', None) == 'medico' and getattr(current_user, 'clinica_actual_id', None)
+    clinica_scope_id = int(current_user.clinica_actual_id) if is_medico_scoped else None
+    if pdf_jobs.solicitado_async():
+        return pdf_jobs.respuesta_encolada('reportes', {'clinica_id': clinica_scope_id})
+
+    contenido, nombre_archivo = generar_pdf_reportes(clinica_scope_id)
+    return send_file(
+        io.BytesIO(contenido),
+        as_attachment=True,
+        download_name=nombre_archivo,
+        mimetype='application/pdf'
+    )
+
+@pdf_jobs.generador('reportes')
+@metrics.pdf('reportes')
+def generar_pdf_reportes(clinica_id=None):
+    """Construye el PDF de reportes estadísticos. Devuelve (contenido, nombre de archivo)."""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Image
+    from app.utils.pdf_document import ClinicaDocTemplate, ESTILOS
+
     story = []
-    styles = getSampleStyleSheet()
+    styles = ESTILOS
 
     # Título
     story.append(Paragraph("Reportes Médicos Estadísticos", styles['h1']))
     story.append(Spacer(1, 0.2 * inch))
 
-    # Alcance igual al de la UI
-    is_medico_scoped = getattr(current_user, 'rol', None) == 'medico' and getattr(current_user, 'clinica_actual_id', None)
-    if is_medico_scoped:
-        clinica_scope_id = int(current_user.clinica_actual_id)
-        # Subconjunto de pacientes por consultas en la clínica
-        pacientes_ids = [row[0] for row in 
-                         Consulta.query.with_entities(Consulta.paciente_id)
-                         .filter(Consulta.clinica_id == clinica_scope_id)
-                         .distinct()
-                         .all()
-                         if row[0] is not None]
-        pacientes_base_q = Paciente.query.filter(Paciente.id.in_(pacientes_ids))
-        consultas_base_q = Consulta.query.filter(Consulta.clinica_id == clinica_scope_id)
-    else:
-        clinica_scope_id = None
-        pacientes_base_q = Paciente.query
-        consultas_base_q = Consulta.query
+    # Fase 1: todos los datos en una pasada de consultas (la versión se lee antes)
+    version = charts.version_datos()
+    datos = datos_reporte(clinica_id)
+    # Fase 2: los cinco gráficos se dibujan en paralelo (pool de procesos)
+    graficos = charts.render_varios(GRAFICOS_REPORTE, clinica_id, datos=datos, version=version)
 
     # Resumen de estadísticas (coherente con la UI y el alcance)
     story.append(Paragraph("Resumen General", styles['h2']))
-    total_pacientes = pacientes_base_q.count()
-    total_consultas = consultas_base_q.count()
-    story.append(Paragraph(f"<b>Total de Pacientes Registrados:</b> {total_pacientes}", styles['Normal']))
-    story.append(Paragraph(f"<b>Total de Consultas Realizadas:</b> {total_consultas}", styles['Normal']))
+    story.append(Paragraph(f"<b>Total de Pacientes Registrados:</b> {datos['total_pacientes']}", styles['normal']))
+    story.append(Paragraph(f"<b>Total de Consultas Realizadas:</b> {datos['total_consultas']}", styles['normal']))
     story.append(Spacer(1, 0.3 * inch))
 
+    def add_grafico(tipo, width, height):
+        if graficos.get(tipo):
+            story.append(Image(io.BytesIO(graficos[tipo]), width=width, height=height))
+
     # Gráfico de Distribución por Género
     story.append(Paragraph("Distribución de Pacientes por Género", styles['h2']))
-    gender_plot_buf = plot_genero(clinica_scope_id)
-    if gender_plot_buf:
-        story.append(Image(gender_plot_buf, width=4*inch, height=3*inch))
+    add_grafico('genero', 4*inch, 3*inch)
     story.append(Spacer(1, 0.2 * inch))
 
     # Gráfico de Rango de Edades (mismos rangos que UI)
     story.append(Paragraph("Rango de Edades de Pacientes", styles['h2']))
-    edades_plot_buf = plot_edades_rangos(clinica_scope_id)
-    if edades_plot_buf:
-        story.append(Image(edades_plot_buf, width=6*inch, height=4*inch))
+    add_grafico('edades', 6*inch, 4*inch)
     story.append(Spacer(1, 0.2 * inch))
 
     # Gráfico de Consultas por Mes
     story.append(Paragraph("Consultas en los Últimos 6 Meses", styles['h2']))
-    consultas_plot_buf = plot_consultas_mes(clinica_scope_id)
-    if consultas_plot_buf:
-        story.append(Image(consultas_plot_buf, width=6*inch, height=4*inch))
+    add_grafico('consultas_mes', 6*inch, 4*inch)
 
     # Enfermedades más comunes (alineado con UI)
     story.append(Spacer(1, 0.2 * inch))
     story.append(Paragraph("Enfermedades Más Frecuentes", styles['h2']))
-    enf_buf = plot_enfermedades_comunes(clinica_scope_id)
-    if enf_buf:
-        story.append(Image(enf_buf, width=6*inch, height=4*inch))
+    add_grafico('enfermedades', 6*inch, 4*inch)
 
     # Problemas por sistemas médicos (alineado con UI)
     story.append(Spacer(1, 0.2 * inch))
     story.append(Paragraph("Problemas por Sistemas Médicos", styles['h2']))
-    sist_buf = plot_problemas_por_sistemas(clinica_scope_id)
-    if sist_buf:
-        story.append(Image(sist_buf, width=6*inch, height=4*inch))
-
-    # Construir el PDF
-    # Marca de agua (opcional para este PDF de reportes generales)
-    def _watermark(canv, doc):
-        # Buscar logo de marca de agua con nombres comunes
-        candidates = [
-            'logo_clinicas.jpg',
-            'logo_clinicas.JPG',
-            'logo_clinicas_familiares_cunori.jpg',
-            'logotipo-cunori-transparente.png',
-            'logo.png',
-            'logo.JPG'
-        ]
-        logo_path = None
-        for name in candidates:
-            path_try = os.path.join(current_app.root_path, 'static', 'img', name)
-            if os.path.exists(path_try):
-                logo_path = path_try
-                break
-        if not logo_path:
-            return
-        try:
-            canv.saveState()
-            # Intentar transparencia si está disponible
-            if hasattr(canv, 'setFillAlpha'):
-                canv.setFillAlpha(0.08)
-            page_w, page_h = doc.pagesize
-            w = page_w * 0.6
-            h = page_h * 0.6
-            x = (page_w - w) / 2
-            y = (page_h - h) / 2
-            canv.drawImage(logo_path, x, y, width=w, height=h, preserveAspectRatio=True, mask='auto')
-        finally:
-            if hasattr(canv, 'setFillAlpha'):
-                canv.setFillAlpha(1)
-            canv.restoreState()
-
-    def _header(canv, doc):
-        left_candidates = [
-            'logo_clinicas.jpg',
-            'logo_clinicas.JPG',
-            'logo_clinicas_familiares_cunori.jpg',
-            'logotipo-cunori-transparente.png',
-            'logo.png',
-            'logo.JPG'
-        ]
-        right_candidates = [
-            'escudo_guatemala.png',
-            'logotipo-cunori-transparente.png',
-            'logo.JPG'
-        ]
-        left_path = None
-        right_path = None
-        for nm in left_candidates:
-            p = os.path.join(current_app.root_path, 'static', 'img', nm)
-            if os.path.exists(p):
-                left_path = p
-                break
-        for nm in right_candidates:
-            p = os.path.join(current_app.root_path, 'static', 'img', nm)
-            if os.path.exists(p):
-                right_path = p
-                break
-        page_w, page_h = doc.pagesize
-        margin = 36
-        img_h = 28
-        img_w = 28
-        y = page_h - img_h - 10
-        try:
-            canv.saveState()
-            if left_path:
-                canv.drawImage(left_path, margin, y, width=img_w, height=img_h, preserveAspectRatio=True, mask='auto')
-            if right_path:
-                canv.drawImage(right_path, page_w - margin - img_w, y, width=img_w, height=img_h, preserveAspectRatio=True, mask='auto')
-            canv.setFont('Helvetica-Bold', 12)
-            canv.setFillColorRGB(0.1, 0.16, 0.23)
-            canv.drawCentredString(page_w/2, y + 8, 'Clínicas Familiares CUNORI-Shororagua')
-            # Línea bajo encabezado
-            canv.setLineWidth(0.5)
-            canv.setStrokeColorRGB(0.6, 0.6, 0.6)
-            canv.line(margin, y - 4, page_w - margin, y - 4)
-        finally:
-            canv.restoreState()
-
-    def _draw(canv, doc):
-        _header(canv, doc)
-        _watermark(canv, doc)
-
-    doc.build(story, onFirstPage=_draw, onLaterPages=_draw)
-    buffer.seek(0)
+    add_grafico('sistemas', 6*inch, 4*inch)
 
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name='reportes_estadisticos.pdf',
-        mimetype='application/pdf'
-    )
+    buffer = ClinicaDocTemplate('reportes').build_to(io.BytesIO(), story)
+    return buffer.getvalue(), 'reportes_estadisticos.pdf'
 
 @bp.route('/generar_receta_pdf/<int:consulta_id>')
 @login_required
@@ -213,33 +161,43 @@ def generar_receta_pdf(consulta_id):
         return redirect(url_for('main.consultas'))
 
     consulta = Consulta.query.get_or_404(consulta_id)
+    if pdf_jobs.solicitado_async():
+        return pdf_jobs.respuesta_encolada('receta', {'consulta_id': consulta_id})
+
+    return _enviar_pdf_cacheado(_pdf_consulta('receta', consulta, _construir_receta))
+
+@pdf_jobs.generador('receta')
+def generar_pdf_receta(consulta_id):
+    """PDF para la cola de trabajos (usa la caché). Devuelve (contenido, nombre de archivo)."""
+    entrada = _pdf_consulta('receta', _consulta_o_error(consulta_id), _construir_receta)
+    return entrada.ruta.read_bytes(), entrada.nombre
+
+@metrics.pdf('receta')
+def _construir_receta(consulta):
+    """Construye el PDF de la receta. Devuelve (contenido, nombre de archivo)."""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Table
+    from app.utils.pdf_document import ClinicaDocTemplate, ESTILOS, TABLAS
+
     paciente = consulta.paciente
     medico = consulta.medico
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
     story = []
-    styles = getSampleStyleSheet()
-    
-    # Estilo para el cuerpo del texto
-    body_style = ParagraphStyle(name='Body', parent=styles['Normal'], spaceAfter=10)
-    center_body = ParagraphStyle(name='CenterBody', parent=body_style, alignment=TA_CENTER)
+    styles = ESTILOS
+    body_style = styles['cuerpo']
     
     # Encabezado
     story.append(Paragraph("RECETA MÉDICA", styles['h1']))
     story.append(Spacer(1, 0.25 * inch))
 
     # Información del Paciente y Fecha
-    paciente_info_style = styles['Normal']
+    paciente_info_style = styles['normal']
     paciente_info = [
         [Paragraph(f"<b>Paciente:</b> {paciente.nombre_completo}", paciente_info_style), Paragraph(f"<b>Fecha:</b> {_fecha_guatemala_str()}", paciente_info_style)],
         [Paragraph(f"<b>Edad:</b> {paciente.edad} años", paciente_info_style), ""]
     ]
     paciente_table = Table(paciente_info, colWidths=[3.5*inch, 2.5*inch])
-    paciente_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-    ]))
+    paciente_table.setStyle(TABLAS['receta_paciente'])
     story.append(paciente_table)
     story.append(Spacer(1, 0.3 * inch))
     
@@ -280,135 +238,9 @@ def generar_receta_pdf(consulta_id):
     story.append(Paragraph(indicaciones_texto, body_style))
     story.append(Spacer(1, 0.5 * inch))
 
-    # (Se dibuja la firma solo en la última página via canvasmaker)
-
-    # Marca de agua
-    def _watermark(canv, doc):
-        candidates = [
-            'logo_clinicas.jpg',
-            'logo_clinicas.JPG',
-            'logo_clinicas_familiares_cunori.jpg',
-            'logotipo-cunori-transparente.png',
-            'logo.png',
-            'logo.JPG'
-        ]
-        logo_path = None
-        for name in candidates:
-            path_try = os.path.join(current_app.root_path, 'static', 'img', name)
-            if os.path.exists(path_try):
-                logo_path = path_try
-                break
-        if not logo_path:
-            return
-        try:
-            canv.saveState()
-            if hasattr(canv, 'setFillAlpha'):
-                canv.setFillAlpha(0.08)
-            try:
-                page_w, page_h = doc.pagesize
-            except Exception:
-                page_w, page_h = getattr(canv, '_pagesize', (letter[0], letter[1]))
-            w = page_w * 0.55
-            h = page_h * 0.55
-            x = (page_w - w) / 2
-            y = (page_h - h) / 2
-            canv.drawImage(logo_path, x, y, width=w, height=h, preserveAspectRatio=True, mask='auto')
-        finally:
-            if hasattr(canv, 'setFillAlpha'):
-                canv.setFillAlpha(1)
-            canv.restoreState()
-
-    def _header(canv, doc):
-        left_candidates = [
-            'logo_clinicas.jpg',
-            'logo_clinicas.JPG',
-            'logo_clinicas_familiares_cunori.jpg',
-            'logotipo-cunori-transparente.png',
-            'logo.png',
-            'logo.JPG'
-        ]
-        right_candidates = [
-            'escudo_guatemala.png',
-            'logotipo-cunori-transparente.png',
-            'logo.JPG'
-        ]
-        left_path = None
-        right_path = None
-        for nm in left_candidates:
-            p = os.path.join(current_app.root_path, 'static', 'img', nm)
-            if os.path.exists(p):
-                left_path = p
-                break
-        for nm in right_candidates:
-            p = os.path.join(current_app.root_path, 'static', 'img', nm)
-            if os.path.exists(p):
-                right_path = p
-                break
-        try:
-            page_w, page_h = doc.pagesize
-        except Exception:
-            page_w, page_h = getattr(canv, '_pagesize', (letter[0], letter[1]))
-        margin = 36
-        img_h = 28
-        img_w = 28
-        y = page_h - img_h - 10
-        try:
-            canv.saveState()
-            if left_path:
-                canv.drawImage(left_path, margin, y, width=img_w, height=img_h, preserveAspectRatio=True, mask='auto')
-            if right_path:
-                canv.drawImage(right_path, page_w - margin - img_w, y, width=img_w, height=img_h, preserveAspectRatio=True, mask='auto')
-            canv.setFont('Helvetica-Bold', 12)
-            canv.setFillColorRGB(0.1, 0.16, 0.23)
-            canv.drawCentredString(page_w/2, y + 8, 'Clínicas Familiares CUNORI-Shororagua')
-            canv.setLineWidth(0.5)
-            canv.setStrokeColorRGB(0.6, 0.6, 0.6)
-            canv.line(margin, y - 4, page_w - margin, y - 4)
-        finally:
-            canv.restoreState()
-
-    def _draw(canv, doc):
-        _header(canv, doc)
-        _watermark(canv, doc)
-
-    class LastPageSignatureCanvas(rl_canvas.Canvas):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-            self._saved_page_states = []
-        def showPage(self):
-            self._saved_page_states.append(dict(self.__dict__))
-            self._startPage()
-        def save(self):
-            total = len(self._saved_page_states)
-            for idx, state in enumerate(self._saved_page_states, start=1):
-                self.__dict__.update(state)
-                _draw(self, self)
-                if idx == total:
-                    self.saveState()
-                    page_w, page_h = self._pagesize
-                    margin = 72
-                    line_w = 200
-                    x1 = (page_w - line_w) / 2
-                    y = margin + 40
-                    self.setLineWidth(1)
-                    self.line(x1, y, x1 + line_w, y)
-                    self.setFont('Helvetica', 10)
-                    self.drawCentredString(page_w/2, y - 14, 'Firma y sello')
-                    self.setFont('Helvetica-Oblique', 10)
-                    self.drawCentredString(page_w/2, y - 28, 'Médico')
-                    self.restoreState()
-                super().showPage()
-            super().save()
-
-    doc.build(story, canvasmaker=LastPageSignatureCanvas)
-    buffer.seek(0)
-
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'receta_{paciente.nombre_completo.replace(" ", "_")}.pdf',
-        mimetype='application/pdf'
-    )
+    # La plantilla agrega la firma al pie de la última página
+    buffer = ClinicaDocTemplate('receta').build_to(io.BytesIO(), story)
+    return buffer.getvalue(), f'receta_{paciente.nombre_completo.replace(" ", "_")}.pdf'
 
 @bp.route('/generar_consulta_pdf/<int:consulta_id>')
 @login_required
@@ -419,18 +251,31 @@ def generar_consulta_pdf(consulta_id):
         return redirect(url_for('main.consultas'))
 
     consulta = Consulta.query.get_or_404(consulta_id)
+    if pdf_jobs.solicitado_async():
+        return pdf_jobs.respuesta_encolada('consulta', {'consulta_id': consulta_id})
+
+    return _enviar_pdf_cacheado(_pdf_consulta('consulta', consulta, _construir_consulta))
+
+@pdf_jobs.generador('consulta')
+def generar_pdf_consulta(consulta_id):
+    """PDF para la cola de trabajos (usa la caché). Devuelve (contenido, nombre de archivo)."""
+    entrada = _pdf_consulta('consulta', _consulta_o_error(consulta_id), _construir_consulta)
+    return entrada.ruta.read_bytes(), entrada.nombre
+
+@metrics.pdf('consulta')
+def _construir_consulta(consulta):
+    """Construye el informe de la consulta. Devuelve (contenido, nombre de archivo)."""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Table
+    from app.utils.pdf_document import ClinicaDocTemplate, ESTILOS, TABLAS
+
     paciente = consulta.paciente
     medico = consulta.medico
     clinica = consulta.clinica
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=36)
-    styles = getSampleStyleSheet()
-
-    title = ParagraphStyle('TitleX', parent=styles['Heading1'], spaceAfter=12)
-    heading = ParagraphStyle('HeadingX', parent=styles['Heading2'], spaceAfter=6)
-    small = ParagraphStyle('Small', parent=styles['Normal'], fontSize=10, spaceAfter=6)
-    small_center = ParagraphStyle('SmallCenter', parent=small, alignment=TA_CENTER)
+    title = ESTILOS['consulta_titulo']
+    heading = ESTILOS['consulta_seccion']
+    small = ESTILOS['pequeno']
 
     story = []
 
@@ -444,9 +289,7 @@ def generar_consulta_pdf(consulta_id):
         [Paragraph(f'<b>Médico:</b> {medico.nombre_completo if medico else "--"}', small), Paragraph(f'<b>Tipo consulta:</b> {consulta.tipo_consulta or "General"}', small)],
     ]
     t = Table(info, colWidths=[3.6*inch, 3.6*inch])
-    t.setStyle(TableStyle([
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-    ]))
+    t.setStyle(TABLAS['consulta_datos'])
     story.append(t)
     story.append(Spacer(1, 10))
 
@@ -499,11 +342,7 @@ def generar_consulta_pdf(consulta_id):
 
     if ef:
         ef_table = Table(ef, colWidths=[2.4*inch, 4.8*inch])
-        ef_table.setStyle(TableStyle([
-            ('GRID', (0,0), (-1,-1), 0.25, colors.lightgrey),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('BACKGROUND', (0,0), (0,-1), colors.whitesmoke)
-        ]))
+        ef_table.setStyle(TABLAS['consulta_examen'])
         story.append(ef_table)
     else:
         story.append(Paragraph('No registrados', small))
@@ -530,132 +369,44 @@ def generar_consulta_pdf(consulta_id):
     add_section('Dosificación', dosificacion_texto)
     add_section('Indicaciones', consulta.indicaciones)
 
-    # (Se dibuja la firma solo en la última página via canvasmaker)
-
-    # Marca de agua
-    def _watermark(canv, doc):
-        candidates = [
-            'logo_clinicas.jpg',
-            'logo_clinicas.JPG',
-            'logo_clinicas_familiares_cunori.jpg',
-            'logotipo-cunori-transparente.png',
-            'logo.png',
-            'logo.JPG'
-        ]
-        logo_path = None
-        for name in candidates:
-            path_try = os.path.join(current_app.root_path, 'static', 'img', name)
-            if os.path.exists(path_try):
-                logo_path = path_try
-                break
-        if not logo_path:
-            return
-        try:
-            canv.saveState()
-            if hasattr(canv, 'setFillAlpha'):
-                canv.setFillAlpha(0.08)
-            try:
-                page_w, page_h = doc.pagesize
-            except Exception:
-                page_w, page_h = getattr(canv, '_pagesize', (letter[0], letter[1]))
-            w = page_w * 0.6
-            h = page_h * 0.6
-            x = (page_w - w) / 2
-            y = (page_h - h) / 2
-            canv.drawImage(logo_path, x, y, width=w, height=h, preserveAspectRatio=True, mask='auto')
-        finally:
-            if hasattr(canv, 'setFillAlpha'):
-                canv.setFillAlpha(1)
-            canv.restoreState()
-
-    def _header(canv, doc):
-        left_candidates = [
-            'logo_clinicas.jpg',
-            'logo_clinicas.JPG',
-            'logo_clinicas_familiares_cunori.jpg',
-            'logotipo-cunori-transparente.png',
-            'logo.png',
-            'logo.JPG'
-        ]
-        right_candidates = [
-            'escudo_guatemala.png',
-            'logotipo-cunori-transparente.png',
-            'logo.JPG'
-        ]
-        left_path = None
-        right_path = None
-        for nm in left_candidates:
-            p = os.path.join(current_app.root_path, 'static', 'img', nm)
-            if os.path.exists(p):
-                left_path = p
-                break
-        for nm in right_candidates:
-            p = os.path.join(current_app.root_path, 'static', 'img', nm)
-            if os.path.exists(p):
-                right_path = p
-                break
-        try:
-            page_w, page_h = doc.pagesize
-        except Exception:
-            page_w, page_h = getattr(canv, '_pagesize', (letter[0], letter[1]))
-        margin = 36
-        img_h = 28
-        img_w = 28
-        y = page_h - img_h - 10
-        try:
-            canv.saveState()
-            if left_path:
-                canv.drawImage(left_path, margin, y, width=img_w, height=img_h, preserveAspectRatio=True, mask='auto')
-            if right_path:
-                canv.drawImage(right_path, page_w - margin - img_w, y, width=img_w, height=img_h, preserveAspectRatio=True, mask='auto')
-            canv.setFont('Helvetica-Bold', 12)
-            canv.setFillColorRGB(0.1, 0.16, 0.23)
-            canv.drawCentredString(page_w/2, y + 8, 'Clínicas Familiares CUNORI-Shororagua')
-            canv.setLineWidth(0.5)
-            canv.setStrokeColorRGB(0.6, 0.6, 0.6)
-            canv.line(margin, y - 4, page_w - margin, y - 4)
-        finally:
-            canv.restoreState()
-
-    def _draw(canv, doc):
-        _header(canv, doc)
-        _watermark(canv, doc)
-
-    class LastPageSignatureCanvas(rl_canvas.Canvas):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-            self._saved_page_states = []
-        def showPage(self):
-            self._saved_page_states.append(dict(self.__dict__))
-            self._startPage()
-        def save(self):
-            total = len(self._saved_page_states)
-            for idx, state in enumerate(self._saved_page_states, start=1):
-                self.__dict__.update(state)
-                _draw(self, self)
-                if idx == total:
-                    self.saveState()
-                    page_w, page_h = self._pagesize
-                    margin = 72
-                    line_w = 200
-                    x1 = (page_w - line_w) / 2
-                    y = margin + 40
-                    self.setLineWidth(1)
-                    self.line(x1, y, x1 + line_w, y)
-                    self.setFont('Helvetica', 10)
-                    self.drawCentredString(page_w/2, y - 14, 'Firma y sello')
-                    self.setFont('Helvetica-Oblique', 10)
-                    self.drawCentredString(page_w/2, y - 28, 'Médico')
-                    self.restoreState()
-                super().showPage()
-            super().save()
-
-    doc.build(story, canvasmaker=LastPageSignatureCanvas)
-    buffer.seek(0)
+    # La plantilla agrega la firma al pie de la última página
+    buffer = ClinicaDocTemplate('consulta').build_to(io.BytesIO(), story)
+    return buffer.getvalue(), f'consulta_{consulta.id}_{paciente.nombre_completo.replace(" ", "_")}.pdf'
+
+
+# ==================== TRABAJOS DE PDF EN SEGUNDO PLANO ====================
 
+def _job_visible(job_id):
+    job = db.session.get(PdfJob, job_id)
+    if job is None or not pdf_jobs.visible_para(job, current_user):
+        return None
+    return job
+
+@bp.route('/api/pdf/jobs/<job_id>')
+@login_required
+@role_required('medico', 'admin')
+def pdf_job_estado(job_id):
+    """Estado de un trabajo de PDF (para sondeo desde el navegador)."""
+    job = _job_visible(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    return jsonify({'success': True, **pdf_jobs.describir(job)})
+
+@bp.route('/api/pdf/jobs/<job_id>/descarga')
+@login_required
+@role_required('medico', 'admin')
+def pdf_job_descarga(job_id):
+    """Descarga el PDF de un trabajo completado."""
+    job = _job_visible(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    if job.estado != 'completado':
+        return jsonify({'success': False, 'estado': job.estado, 'error': 'El PDF aún no está listo'}), 409
+    if not job.ruta_archivo or not os.path.exists(job.ruta_archivo):
+        return jsonify({'success': False, 'error': 'El PDF ya no está disponible; vuelva a solicitarlo'}), 410
     return send_file(
-        buffer,
+        job.ruta_archivo,
         as_attachment=True,
-        download_name=f'consulta_{consulta.id}_{paciente.nombre_completo.replace(" ", "_")}.pdf',
+        download_name=job.nombre_archivo,
         mimetype='application/pdf'
     )
@@ -1,236 +1,223 @@
-import matplotlib
-matplotlib.use('Agg')  # Configurar el backend ANTES de importar pyplot
-import matplotlib.pyplot as plt
+"""
+Gráficos del PDF de reportes estadísticos.
+
+Cada gráfico se registra en el servicio ``charts`` (app/utils/charts.py) con su
+función de datos y su función de dibujo sobre una ``Figure``; las funciones
+``plot_*`` devuelven el PNG en un ``BytesIO`` (o None si no hay datos) y
+reutilizan el resultado mientras los datos no cambien.
+
+El PDF de reportes usa ``datos_reporte`` (todos los datos en una sola pasada de
+consultas) y ``charts.render_varios`` (dibujo en paralelo).
+"""
 import io
-from app import db
-from app.models import Paciente, Consulta
-from sqlalchemy import func, or_
-from collections import Counter
 import datetime
 from typing import Optional
 
-def _pacientes_ids_por_clinica(clinica_id: Optional[int]) -> list[int]:
+from sqlalchemy import func
+
+from app import db
+from app.models import Paciente, Consulta
+from app.utils.charts import charts
+from app.utils.rollups import rollups
+from app.utils.consulta_tags import conteo_por_sistema
+from .routes import RANGOS_EDAD_ETIQUETAS, _rango_edad_sql
+
+TOP_ENFERMEDADES = 10
+# Gráficos del PDF de reportes, en el orden en que aparecen
+GRAFICOS_REPORTE = ['genero', 'edades', 'consultas_mes', 'enfermedades', 'sistemas']
+
+
+def _pacientes_de_clinica(query, clinica_id: Optional[int]):
+    """Limita ``query`` a pacientes con consultas en la clínica (si se indica)."""
     if not clinica_id:
-        return []
-    rows = db.session.query(Consulta.paciente_id).filter(Consulta.clinica_id == clinica_id).distinct().all()
-    return [r[0] for r in rows if r[0] is not None]
+        return query
+    return query.filter(Paciente.id.in_(
+        db.session.query(Consulta.paciente_id).filter(Consulta.clinica_id == clinica_id)
+    ))
+
+
+def _rotar_etiquetas_x(ax):
+    for etiqueta in ax.get_xticklabels():
+        etiqueta.set_rotation(45)
+        etiqueta.set_horizontalalignment('right')
+
+
+# ----- Distribución por género -----
+
+def datos_genero(clinica_id: Optional[int] = None):
+    """[(sexo, pacientes)] sin los pacientes sin sexo registrado."""
+    q = db.session.query(Paciente.sexo, func.count(Paciente.id)).group_by(Paciente.sexo)
+    genero_dist = _pacientes_de_clinica(q, clinica_id).all()
+    return [(sexo, total) for sexo, total in genero_dist if sexo is not None] or None
+
+
+@charts.grafico('genero', datos=datos_genero)
+def dibujar_genero(fig, datos):
+    ax = fig.add_subplot()
+    ax.pie([v for _, v in datos], labels=[k for k, _ in datos], autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+    ax.set_title('Distribución de Pacientes por Género')
 
 
 def plot_genero(clinica_id: Optional[int] = None):
-    """Genera un gráfico de pastel de la distribución de pacientes por género.
+    """Gráfico de pastel de la distribución de pacientes por género.
     Si se pasa clinica_id, limita a pacientes con consultas en esa clínica.
     """
-    base_q = db.session.query(Paciente.sexo, func.count(Paciente.id))
-    if clinica_id:
-        ids = _pacientes_ids_por_clinica(clinica_id)
-        if not ids:
-            return None
-        base_q = base_q.filter(Paciente.id.in_(ids))
-    genero_dist = dict(base_q.group_by(Paciente.sexo).all())
-    
-    # Asegurarse de que haya datos
-    if not genero_dist:
+    return _buffer(charts.render('genero', clinica_id))
+
+
+# ----- Rangos de edad -----
+
+def datos_edades(clinica_id: Optional[int] = None):
+    """[(rango, pacientes)] con los mismos rangos que la UI, agrupados en SQL."""
+    rango = _rango_edad_sql()
+    q = db.session.query(rango, func.count(Paciente.id)).filter(Paciente.edad.isnot(None)).group_by(rango)
+    conteo = dict(_pacientes_de_clinica(q, clinica_id).all())
+    if not conteo:
         return None
+    return [(etiqueta, conteo.get(etiqueta, 0)) for etiqueta in RANGOS_EDAD_ETIQUETAS]
+
+
+@charts.grafico('edades', datos=datos_edades, figsize=(10, 6))
+def dibujar_edades(fig, datos):
+    ax = fig.add_subplot()
+    ax.bar([k for k, _ in datos], [v for _, v in datos])
+    _rotar_etiquetas_x(ax)
+    ax.set_title('Rango de Edades de Pacientes')
+    ax.set_xlabel('Rango de Edad')
+    ax.set_ylabel('Número de Pacientes')
+    fig.tight_layout()
 
-    labels = [k for k in genero_dist.keys() if k is not None]
-    sizes = [v for k, v in genero_dist.items() if k is not None]
-    
-    fig, ax = plt.subplots()
-    ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
-    ax.axis('equal')
-    plt.title('Distribución de Pacientes por Género')
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close(fig)
-    return buf
 
 def plot_edades_rangos(clinica_id: Optional[int] = None):
-    """Genera un gráfico de barras de la distribución de pacientes por rango de edad
+    """Gráfico de barras de la distribución de pacientes por rango de edad
     usando los mismos rangos que la UI. Respeta clinica_id si se proporciona.
     """
-    if clinica_id:
-        ids = _pacientes_ids_por_clinica(clinica_id)
-        pacientes = Paciente.query.filter(Paciente.id.in_(ids)).all() if ids else []
-    else:
-        pacientes = Paciente.query.all()
-    edades = [p.edad for p in pacientes if p.edad is not None]
-    
-    if not edades:
-        return None
+    return _buffer(charts.render('edades', clinica_id))
 
-    # Definir los mismos rangos que en la API/UI
-    rangos = [
-        (0, 5), (6, 10), (11, 15), (16, 20), (21, 25), (26, 30),
-        (31, 35), (36, 40), (41, 45), (46, 50), (51, 55), (56, 60),
-        (61, 65), (66, 70), (71, 75), (76, 80), (81, 85), (86, 90)
-    ]
-    labels = [f'{a}-{b}' for a, b in rangos] + ['90+']
-
-    dist_edades = Counter({label: 0 for label in labels})
-    for edad in edades:
-        placed = False
-        for a, b in rangos:
-            if a <= edad <= b:
-                dist_edades[f'{a}-{b}'] += 1
-                placed = True
-                break
-        if not placed and edad > 90:
-            dist_edades['90+'] += 1
-
-    sorted_labels = labels
-    sorted_values = [dist_edades[lbl] for lbl in sorted_labels]
-
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar(sorted_labels, sorted_values)
-    plt.xticks(rotation=45, ha="right")
-    plt.title('Rango de Edades de Pacientes')
-    plt.xlabel('Rango de Edad')
-    plt.ylabel('Número de Pacientes')
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close(fig)
-    return buf
 
-def plot_consultas_mes(clinica_id: Optional[int] = None):
-    """Genera un gráfico de línea de las consultas en los últimos 6 meses."""
+# ----- Consultas por mes -----
+
+def _add_months(dt: datetime.datetime, months: int) -> datetime.datetime:
+    year = dt.year + (dt.month - 1 + months) // 12
+    month = (dt.month - 1 + months) % 12 + 1
+    return datetime.datetime(year, month, 1)
+
+
+def datos_consultas_mes(clinica_id: Optional[int] = None):
+    """[('YYYY-MM', consultas)] de los últimos 6 meses (incluyendo el actual)."""
     now = datetime.datetime.now()
     first_of_this_month = datetime.datetime(now.year, now.month, 1)
+    month_starts = [_add_months(first_of_this_month, offset) for offset in range(-5, 1)]
 
-    def add_months(dt: datetime.datetime, months: int) -> datetime.datetime:
-        year = dt.year + (dt.month - 1 + months) // 12
-        month = (dt.month - 1 + months) % 12 + 1
-        return datetime.datetime(year, month, 1)
-
-    # Construir los inicios de los últimos 6 meses (incluyendo el mes actual)
-    month_starts = [add_months(first_of_this_month, offset) for offset in range(-5, 1)]
-
-    labels = []
-    values = []
-    for start in month_starts:
-        end = add_months(start, 1)
-        # Contar consultas cuyo timestamp cae en [start, end)
-        q = db.session.query(func.count(Consulta.id)) \
-            .filter(Consulta.fecha_consulta >= start) \
-            .filter(Consulta.fecha_consulta < end)
-        if clinica_id:
-            q = q.filter(Consulta.clinica_id == clinica_id)
-        count = q.scalar() or 0
-        labels.append(start.strftime('%Y-%m'))
-        values.append(count)
-
+    _, values = rollups.conteo_por_periodos(month_starts + [_add_months(first_of_this_month, 1)], clinica_id)
     # Si todos son cero, no graficar
     if not any(values):
         return None
+    return [(start.strftime('%Y-%m'), value) for start, value in zip(month_starts, values)]
+
+
+@charts.grafico('consultas_mes', datos=datos_consultas_mes)
+def dibujar_consultas_mes(fig, datos):
+    ax = fig.add_subplot()
+    ax.plot([k for k, _ in datos], [v for _, v in datos], marker='o')
+    ax.set_title('Consultas en los Últimos 6 Meses')
+    ax.set_xlabel('Mes')
+    ax.set_ylabel('Número de Consultas')
+    ax.grid(True)
+    _rotar_etiquetas_x(ax)
+    fig.tight_layout()
+
+
+def plot_consultas_mes(clinica_id: Optional[int] = None):
+    """Gráfico de línea de las consultas en los últimos 6 meses."""
+    return _buffer(charts.render('consultas_mes', clinica_id))
 
-    fig, ax = plt.subplots()
-    ax.plot(labels, values, marker='o')
-    plt.title('Consultas en los Últimos 6 Meses')
-    plt.xlabel('Mes')
-    plt.ylabel('Número de Consultas')
-    plt.grid(True)
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
 
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close(fig)
-    return buf
+# ----- Enfermedades más comunes -----
 
+def datos_enfermedades(clinica_id: Optional[int] = None):
+    conteo = rollups.diagnosticos_frecuentes(clinica_id, limite=TOP_ENFERMEDADES)
+    return [(' '.join(w.capitalize() for w in k.split()), v) for k, v in conteo] or None
 
-def plot_enfermedades_comunes(clinica_id: Optional[int] = None, top_n: int = 10):
-    """Genera un gráfico de barras con las enfermedades más comunes.
+
+@charts.grafico('enfermedades', datos=datos_enfermedades, figsize=(8, 4))
+def dibujar_enfermedades(fig, datos):
+    ax = fig.add_subplot()
+    ax.barh([k for k, _ in datos], [v for _, v in datos], color='#17a2b8')
+    ax.invert_yaxis()
+    ax.set_title('Enfermedades Más Comunes')
+    ax.set_xlabel('Casos')
+    fig.tight_layout()
+
+
+def plot_enfermedades_comunes(clinica_id: Optional[int] = None):
+    """Gráfico de barras con las enfermedades más comunes.
     Respeta el alcance por clínica si se proporciona clinica_id.
     """
-    q = Consulta.query.filter(Consulta.diagnostico.isnot(None))
-    if clinica_id:
-        q = q.filter(Consulta.clinica_id == clinica_id)
-    diagnos = [ (c.diagnostico or '').strip().lower() for c in q.all() if (c.diagnostico or '').strip() ]
-    if not diagnos:
-        return None
+    return _buffer(charts.render('enfermedades', clinica_id))
 
-    conteo = Counter(diagnos).most_common(top_n)
-    labels = [' '.join(w.capitalize() for w in k.split()) for k, _ in conteo]
-    values = [v for _, v in conteo]
 
-    fig, ax = plt.subplots(figsize=(8, 4))
-    ax.barh(labels, values, color='#17a2b8')
-    ax.invert_yaxis()
-    plt.title('Enfermedades Más Comunes')
-    plt.xlabel('Casos')
-    plt.tight_layout()
+# ----- Problemas por sistemas -----
 
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close(fig)
-    return buf
+def datos_sistemas(clinica_id: Optional[int] = None):
+    """[(sistema, casos)] desde las etiquetas por consulta (diagnóstico y motivo)."""
+    return list(conteo_por_sistema(clinica_id).items()) or None
+
+
+@charts.grafico('sistemas', datos=datos_sistemas, figsize=(8, 4))
+def dibujar_sistemas(fig, datos):
+    ax = fig.add_subplot()
+    ax.barh([k for k, _ in datos], [v for _, v in datos], color='#FF9F40')
+    ax.invert_yaxis()
+    ax.set_title('Problemas por Sistemas Médicos')
+    ax.set_xlabel('Casos')
+    fig.tight_layout()
 
 
 def plot_problemas_por_sistemas(clinica_id: Optional[int] = None):
-    """Genera un gráfico de barras para problemas por sistemas médicos.
-    Usa diagnóstico, motivo y revisión por sistemas para clasificar.
+    """Gráfico de barras para problemas por sistemas médicos."""
+    return _buffer(charts.render('sistemas', clinica_id))
+
+
+# ----- Datos del PDF de reportes en una pasada -----
+
+def datos_reporte(clinica_id: Optional[int] = None):
+    """Totales y datos de los gráficos de ``GRAFICOS_REPORTE``.
+
+    Género y rangos de edad salen del mismo GROUP BY y el total de consultas del
+    mismo SELECT que las consultas por mes, así que son 4 consultas en total.
     """
-    sistemas_keywords = {
-        'Respiratorio': ['tos', 'gripe', 'resfriado', 'bronquitis', 'asma', 'neumonía', 'congestion', 'respiratorio'],
-        'Cardiovascular': ['corazón', 'hipertensión', 'presión', 'cardiaco', 'cardiovascular', 'arritmia', 'palpitaciones'],
-        'Neurológico': ['dolor de cabeza', 'cefalea', 'migraña', 'neurológico', 'mareo', 'vértigo'],
-        'Musculo Esquelético': ['dolor', 'espalda', 'articulaciones', 'músculo', 'hueso', 'artritis', 'lumbar'],
-        'Gastrointestinal': ['estómago', 'digestivo', 'diarrea', 'estreñimiento', 'gastritis', 'intestinal', 'dolor abdominal'],
-        'Genitourinario': ['urinario', 'riñón', 'vejiga', 'genital', 'infección urinaria', 'disuria', 'polaquiuria'],
-        'Endocrino': ['diabetes', 'tiroides', 'hormonal', 'endocrino', 'glucosa'],
-        'Dermatológico': ['piel', 'dermatitis', 'rash', 'alergia', 'eccema', 'erupción', 'acné'],
-        'Oftalmológico': ['ojo', 'visión', 'oftalmológico', 'conjuntivitis'],
-        'Otorrinolaringológico': ['oído', 'garganta', 'nariz', 'otitis', 'sinusitis'],
-        'Ginecológico': ['ginecológico', 'menstrual', 'embarazo', 'pélvico'],
-        'Pediátrico': ['niño', 'infantil', 'pediátrico', 'desarrollo']
-    }
+    rango = _rango_edad_sql()
+    q = db.session.query(Paciente.sexo, rango, func.count(Paciente.id)).group_by(Paciente.sexo, rango)
+    total_pacientes = 0
+    genero = {}
+    edades = {}
+    for sexo, rango_edad, total in _pacientes_de_clinica(q, clinica_id).all():
+        total_pacientes += total
+        if sexo is not None:
+            genero[sexo] = genero.get(sexo, 0) + total
+        if rango_edad is not None:
+            edades[rango_edad] = edades.get(rango_edad, 0) + total
 
-    q = Consulta.query.filter(
-        or_(
-            Consulta.diagnostico.isnot(None),
-            Consulta.motivo_consulta.isnot(None),
-            Consulta.revision_sistemas.isnot(None)
-        )
+    now = datetime.datetime.now()
+    first_of_this_month = datetime.datetime(now.year, now.month, 1)
+    month_starts = [_add_months(first_of_this_month, offset) for offset in range(-5, 1)]
+    total_consultas, values = rollups.conteo_por_periodos(
+        month_starts + [_add_months(first_of_this_month, 1)], clinica_id
     )
-    if clinica_id:
-        q = q.filter(Consulta.clinica_id == clinica_id)
-
-    sistemas_count = Counter()
-    for c in q.all():
-        texto = ' '.join([
-            (c.diagnostico or '').lower(),
-            (c.motivo_consulta or '').lower(),
-            (c.revision_sistemas or '').lower()
-        ])
-        if not texto.strip():
-            continue
-        for sistema, keywords in sistemas_keywords.items():
-            for kw in keywords:
-                if kw in texto:
-                    sistemas_count[sistema] += 1
-                    break
-
-    if not sistemas_count:
-        return None
 
-    labels = list(sistemas_count.keys())
-    values = [sistemas_count[l] for l in labels]
+    return {
+        'total_pacientes': total_pacientes,
+        'total_consultas': total_consultas,
+        'genero': list(genero.items()) or None,
+        'edades': [(etiqueta, edades.get(etiqueta, 0)) for etiqueta in RANGOS_EDAD_ETIQUETAS] if edades else None,
+        'consultas_mes': [(start.strftime('%Y-%m'), value) for start, value in zip(month_starts, values)]
+                         if any(values) else None,
+        'enfermedades': datos_enfermedades(clinica_id),
+        'sistemas': datos_sistemas(clinica_id),
+    }
 
-    fig, ax = plt.subplots(figsize=(8, 4))
-    ax.barh(labels, values, color='#FF9F40')
-    ax.invert_yaxis()
-    plt.title('Problemas por Sistemas Médicos')
-    plt.xlabel('Casos')
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close(fig)
-    return buf
+
+def _buffer(contenido):
+    return io.BytesIO(contenido) if contenido else None
@@ -5,26 +5,32 @@ from app.main import bp
 from app.models import Clinica, Paciente, Consulta, SignosVitales, Usuario, HistorialRoles, HistorialAsignacionClinica # Asegúrate de importar HistorialAsignacionClinica si usas current_user.id
 from app.main.forms import DiagnosticoForm, RecetaForm, ConsultaForm, MotivoConsultaForm, BusquedaPacienteForm
 from app.pacientes.forms import BusquedaPacienteForm, SignosVitalesForm
+from app.utils.patient_search import patient_search
+from app.utils.rollups import rollups
+from app.utils.report_cache import report_cache
+from app.utils.clinical_text import subcategorias
+from app.utils.consulta_tags import conteo_por_sistema, conteo_por_subcategoria, tag_backfill
+from app.utils.pagination import Keyset, CursorInvalido
+from app.utils.pdf_jobs import pdf_jobs
+from app.utils.charts import charts, FORMATOS as FORMATOS_GRAFICO
+from app.utils.db_engine import solo_lectura
+from app.utils.metrics import metrics
 from datetime import datetime, timedelta
-from sqlalchemy import or_, func, extract, text
-from sqlalchemy.orm import joinedload
+from sqlalchemy import or_, and_, case, func, extract, text
+from sqlalchemy.orm import joinedload, load_only
 from functools import wraps
 from flask import abort
+import hashlib
 import io
 import json
+import logging
 import os
 from collections import defaultdict, Counter
 from sqlalchemy import asc, desc
-try:
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+# ReportLab se importa al generar el primer PDF (ver app/utils/lazy.py)
+from app.utils.lazy import REPORTLAB_AVAILABLE
+
+logger = logging.getLogger(__name__)
 
 def role_required(*roles):
     def decorator(f):
@@ -84,6 +90,55 @@ def filtered_pacientes_query():
         #     .filter(Consulta.clinica_id == current_user.clinica_actual_id).distinct()
     return Paciente.query
 
+
+# ===== Carga por lotes para resultados de búsqueda =====
+def consultas_por_paciente(paciente_ids):
+    """Consultas (visibles) de varios pacientes en una sola query, con médico y signos vitales.
+
+    Devuelve {paciente_id: [consultas ordenadas por fecha desc]}.
+    """
+    resultado = defaultdict(list)
+    if not paciente_ids:
+        return resultado
+    consultas = (filtered_consultas_query()
+        .filter(Consulta.paciente_id.in_(paciente_ids))
+        .options(joinedload(Consulta.medico), joinedload(Consulta.signos_vitales))
+        .order_by(Consulta.paciente_id, Consulta.fecha_consulta.desc())
+        .all())
+    for c in consultas:
+        resultado[c.paciente_id].append(c)
+    return resultado
+
+
+def ultimos_signos_vitales(paciente_ids):
+    """Signos vitales más recientes de cada paciente con una sola query (ROW_NUMBER).
+
+    Prioriza los registrados en una consulta; si no hay, usa los iniciales (sin consulta).
+    Devuelve {paciente_id: SignosVitales}.
+    """
+    if not paciente_ids:
+        return {}
+    pid = func.coalesce(Consulta.paciente_id, SignosVitales.paciente_id)
+    sin_consulta = case((SignosVitales.consulta_id.is_(None), 1), else_=0)
+    ranked = (db.session.query(
+            SignosVitales.id.label('sv_id'),
+            pid.label('paciente_id'),
+            func.row_number().over(
+                partition_by=pid,
+                order_by=(sin_consulta, SignosVitales.fecha_registro.desc(), SignosVitales.id.desc())
+            ).label('rn'))
+        .outerjoin(Consulta, Consulta.id == SignosVitales.consulta_id)
+        .filter(or_(
+            Consulta.paciente_id.in_(paciente_ids),
+            and_(SignosVitales.consulta_id.is_(None), SignosVitales.paciente_id.in_(paciente_ids))
+        ))
+        .subquery())
+    filas = (db.session.query(ranked.c.paciente_id, SignosVitales)
+        .join(SignosVitales, SignosVitales.id == ranked.c.sv_id)
+        .filter(ranked.c.rn == 1)
+        .all())
+    return {paciente_id: sv for paciente_id, sv in filas}
+
 @bp.route('/')
 @bp.route('/index')
 @login_required
@@ -108,7 +163,7 @@ def recepcion():
     redirect_resp = require_clinic_selected_redirect()
     if redirect_resp:
         return redirect_resp
-    pacientes = filtered_pacientes_query().all()
+    # Los pacientes se buscan bajo demanda (/api/pacientes/buscar); no se cargan aquí
     # Obtener clínicas visibles (médico solo ve su clínica)
     if current_user.rol == 'medico' and current_user.clinica_actual_id:
         clinicas = Clinica.query.filter(Clinica.id == current_user.clinica_actual_id).all()
@@ -182,7 +237,7 @@ def recepcion():
             return redirect(url_for('main.recepcion'))
     
     # Pasar None como valor predeterminado para tipo_consulta
-    return render_template('main/recepcion.html', title='Recepción', pacientes=pacientes, clinicas=clinicas, tipo_consulta=None)
+    return render_template('main/recepcion.html', title='Recepción', clinicas=clinicas, tipo_consulta=None)
 
 @bp.route('/api/search_patients', methods=['GET'])
 @login_required
@@ -190,17 +245,12 @@ def search_patients():
     query = request.args.get('query', '').strip()
     if query:
         base_q = filtered_pacientes_query()
-        patients = base_q.filter(
-            or_(
-                Paciente.nombre_completo.ilike(f"%{query}%"),
-                Paciente.dni.ilike(f"%{query}%")
-            )
-        ).all()
+        patients = patient_search.search(base_q, query).all()
+        consultas_map = consultas_por_paciente([p.id for p in patients])
         resultados = []
         for paciente in patients:
-            consultas = filtered_consultas_query().filter_by(paciente_id=paciente.id).order_by(Consulta.fecha_consulta.desc()).all()
             historial_consultas = []
-            for consulta in consultas:
+            for consulta in consultas_map.get(paciente.id, []):
                 consulta_data = {
                     'id': consulta.id,
                     'fecha': consulta.fecha_consulta.strftime('%d/%m/%Y %H:%M') if consulta.fecha_consulta else '',
@@ -272,6 +322,12 @@ def get_patient_info(patient_id):
             'fecha_nacimiento': patient.fecha_nacimiento.strftime('%Y-%m-%d') if patient.fecha_nacimiento else 'N/A',
             'telefono': patient.telefono,
             'direccion': patient.direccion,
+            'estado_civil': patient.estado_civil or '',
+            'religion': patient.religion or '',
+            'escolaridad': patient.escolaridad or '',
+            'ocupacion': patient.ocupacion or '',
+            'procedencia': patient.procedencia or '',
+            'numero_expediente': patient.numero_expediente or '',
             'signos_vitales': signos_vitales_data
         })
     return jsonify({}), 404
@@ -290,22 +346,11 @@ def get_vitals(patient_id):
         sv = consulta.signos_vitales if not isinstance(consulta.signos_vitales, list) else consulta.signos_vitales[0]
         return jsonify(sv.to_dict())
 
-    # 2) Fallback: Buscar en SignosVitales unido a Consulta por paciente, ordenado por fecha de registro
-    sv_directo = (SignosVitales.query
-        .join(Consulta, Consulta.id == SignosVitales.consulta_id)
-        .filter(Consulta.paciente_id == patient_id)
-        .order_by(SignosVitales.fecha_registro.desc())
-        .first())
-    if sv_directo:
-        return jsonify(sv_directo.to_dict())
-    
-    # 3) Último fallback: Buscar signos vitales iniciales (sin consulta)
-    sv_inicial = (SignosVitales.query
-        .filter(SignosVitales.paciente_id == patient_id, SignosVitales.consulta_id == None)
-        .order_by(SignosVitales.fecha_registro.desc())
-        .first())
-    if sv_inicial:
-        return jsonify(sv_inicial.to_dict())
+    # 2) Fallback: SignosVitales más recientes por consulta del paciente o, si no hay,
+    #    los signos vitales iniciales (sin consulta)
+    sv_reciente = ultimos_signos_vitales([patient_id]).get(patient_id)
+    if sv_reciente:
+        return jsonify(sv_reciente.to_dict())
 
     return jsonify({})
 
@@ -407,20 +452,11 @@ def registrar_paciente():
             clinica_id = current_user.clinica_actual_id if current_user.rol == 'medico' else request.form.get('clinica_id')
             # Nota: ya no usamos tipo_consulta al registrar paciente
             tipo_consulta = request.form.get('tipo_consulta', '').strip()
-            
-            # DEBUG: Log de todos los datos recibidos
-            print(f"DEBUG REGISTRO - Datos recibidos:")
-            print(f"  Nombre: '{nombre_completo}' (tipo: {type(nombre_completo)}, longitud: {len(nombre_completo) if nombre_completo else 'None'})")
-            try:
-                print(f"  Nombre codificado: {nombre_completo.encode('utf-8') if nombre_completo else 'None'}")
-            except Exception as e:
-                print(f"  ERROR en codificación del nombre: {e}")
-            print(f"  DPI: '{dni}'")
-            print(f"  Edad: '{edad}'")
-            print(f"  Sexo: '{sexo}'")
-            print(f"  Dirección: '{direccion}'")
-            print(f"  Teléfono: '{telefono}'")
-            print(f"  Tipo consulta: '{tipo_consulta}'")
+
+            logger.debug('Registro de paciente recibido', extra={
+                'nombre_completo': nombre_completo, 'dni': dni, 'edad': edad, 'sexo': sexo,
+                'clinica_id': clinica_id, 'tipo_consulta': tipo_consulta,
+            })
             
             # Verificar datos requeridos (sin exigir tipo_consulta)
             if not nombre_completo:
@@ -460,18 +496,10 @@ def registrar_paciente():
                 dni=dni if dni else None,
                 fecha_registro=datetime.utcnow()
             )
-            
-            print(f"DEBUG: Creando paciente con datos:")
-            print(f"  Nombre: {paciente.nombre_completo}")
-            print(f"  Edad: {paciente.edad} (tipo: {type(paciente.edad)})")
-            print(f"  Sexo: {paciente.sexo}")
-            print(f"  DPI: {paciente.dni}")
-            
+
             db.session.add(paciente)
             db.session.flush()  # Para obtener el ID del paciente
             
-            print(f"DEBUG: Paciente creado con ID: {paciente.id}")
-            
             # Si hay signos vitales, guardarlos como "iniciales" (sin crear consulta falsa)
             presion_arterial = request.form.get('presion_arterial', '').strip()
             frecuencia_cardiaca_str = request.form.get('frec_cardiaca', '').strip()
@@ -519,18 +547,10 @@ def registrar_paciente():
                         glucosa = None
                         
             except ValueError as e:
-                print(f"ERROR en conversión de signos vitales: {e}")
+                logger.warning('Signos vitales no numéricos en el registro: %s', e)
                 flash('Error en los valores de signos vitales. Verifica que sean números válidos.', 'warning')
                 # Continuar sin signos vitales en lugar de fallar
-            
-            # Debug signos vitales
-            print(f"DEBUG SIGNOS VITALES:")
-            print(f"  Presión: '{presion_arterial}'")
-            print(f"  FC: {frecuencia_cardiaca}")
-            print(f"  FR: {frecuencia_respiratoria}")
-            print(f"  Temp: {temperatura}")
-            print(f"  Sat: {saturacion}")
-            print(f"  Glucosa: {glucosa}")
+
             
             if any([presion_arterial, frecuencia_cardiaca, frecuencia_respiratoria, temperatura, saturacion, glucosa]):
                 # Crear signos vitales iniciales SIN consulta (no contamina reportes)
@@ -545,41 +565,22 @@ def registrar_paciente():
                     consulta_id=None  # Sin consulta para no contaminar reportes
                 )
                 db.session.add(signos_vitales)
-                print(f"DEBUG: Signos vitales agregados para paciente {paciente.id}")
-            
+
             db.session.commit()
-            print(f"DEBUG: COMMIT EXITOSO - Paciente {nombre_completo} guardado en BD")
-            
-            # VERIFICACIÓN ADICIONAL: Confirmar que el paciente existe en BD
-            paciente_verificacion = Paciente.query.filter_by(id=paciente.id).first()
-            if paciente_verificacion:
-                print(f"✅ VERIFICACIÓN EXITOSA: Paciente ID {paciente.id} existe en BD")
-                print(f"  Nombre en BD: {paciente_verificacion.nombre_completo}")
-                print(f"  DPI en BD: {paciente_verificacion.dni}")
-            else:
-                print(f"❌ ERROR: Paciente ID {paciente.id} NO se encuentra en BD después del commit")
-            
-            # Verificar búsqueda también
-            pacientes_visibles = filtered_pacientes_query().count()
-            print(f"DEBUG: Total pacientes visibles para este usuario: {pacientes_visibles}")
-            
+            logger.info('Paciente registrado', extra={
+                'paciente_id': paciente.id, 'clinica_id': clinica_id,
+                'con_signos_vitales': any([presion_arterial, frecuencia_cardiaca, frecuencia_respiratoria,
+                                           temperatura, saturacion, glucosa]),
+            })
+
             flash(f'Paciente {nombre_completo} registrado correctamente', 'success')
             
             # Permanecer en Recepción después de registrar paciente
             return redirect(url_for('main.recepcion'))
             
-        except Exception as e:
+        except Exception:
             db.session.rollback()
-            import traceback
-            error_details = traceback.format_exc()
-            print(f"ERROR COMPLETO al registrar paciente:")
-            print(f"  Error: {str(e)}")
-            print(f"  Traceback: {error_details}")
-            print(f"  Datos que causaron error:")
-            print(f"    Nombre: '{request.form.get('nombre_completo', 'N/A')}'")
-            print(f"    DPI: '{request.form.get('dni', 'N/A')}'")
-            print(f"    Edad: '{request.form.get('edad', 'N/A')}'")
-            print(f"    Sexo: '{request.form.get('sexo', 'N/A')}'")
+            logger.exception('Error al registrar paciente')
             flash(f'Error al registrar el paciente. Por favor revise los datos e intente de nuevo.', 'error')
             return redirect(url_for('main.recepcion'))
     
@@ -703,6 +704,7 @@ def actualizar_estado_clinica(clinica_id):
 
 @bp.route('/buscar_paciente_ajax', methods=['POST'])
 @login_required
+@solo_lectura
 def buscar_paciente_ajax():
     data = request.get_json()
     termino = data.get('termino_busqueda')
@@ -713,7 +715,7 @@ def buscar_paciente_ajax():
     # Limitar visibilidad según clínica si aplica
     base_q = filtered_pacientes_query()
     paciente = base_q.filter(
-        (Paciente.nombre_completo.ilike(f'%{termino}%')) |
+        patient_search.match_clause(termino) |
         (Paciente.id == termino if termino.isdigit() else False)
     ).first()
 
@@ -949,7 +951,7 @@ def consulta_diagnostico(consulta_id):
             # Busca el paciente por nombre o ID
             paciente_encontrado = filtered_pacientes_query().filter(
                 or_(
-                    Paciente.nombre_completo.ilike(f'%{query}%'),
+                    patient_search.match_clause(query),
                     Paciente.id.like(f'%{query}%')
                 )
             ).first()
@@ -1025,6 +1027,7 @@ def informe_medico(consulta_id):
 
 @bp.route('/api/pacientes/buscar')
 @login_required
+@solo_lectura
 def buscar_pacientes2():
     query = request.args.get('q', '')
     if not query or len(query) < 2:
@@ -1032,8 +1035,7 @@ def buscar_pacientes2():
     
     pacientes = filtered_pacientes_query().filter(
         or_(
-            Paciente.nombre_completo.ilike(f'%{query}%'),
-            Paciente.dni.ilike(f'%{query}%'),
+            patient_search.match_clause(query),
             Paciente.id == (int(query) if query.isdigit() else -1)
         )
     ).limit(10).all()
@@ -1054,6 +1056,7 @@ def buscar_pacientes2():
 
 @bp.route('/buscar_paciente_api', methods=['GET'])
 @login_required
+@solo_lectura
 def buscar_paciente_api():
     # Endpoint para buscar un paciente por término (nombre o ID) y devolver sus datos con signos vitales
     from flask import jsonify
@@ -1067,7 +1070,7 @@ def buscar_paciente_api():
     if termino.isdigit():
         paciente = base_q.filter(Paciente.id == int(termino)).first()
     else:
-        paciente = base_q.filter(Paciente.nombre_completo.ilike(f'%{termino}%')).first()
+        paciente = patient_search.search(base_q, termino).first()
     
     if not paciente:
         return jsonify({'error': 'Paciente no encontrado'}), 404
@@ -1681,8 +1684,13 @@ def obtener_historial_consulta(consulta_id):
 @bp.route('/api/buscar_pacientes')
 @login_required
 @role_required('medico', 'admin')
+@solo_lectura
 def buscar_pacientes():
-    """API endpoint para buscar pacientes por nombre o DNI"""
+    """API de autocompletado: resumen de pacientes por nombre, DNI o expediente.
+
+    El historial completo se obtiene aparte con /api/pacientes/<id>/historial
+    cuando se selecciona un paciente.
+    """
     query = request.args.get('q', '')
     if not query or len(query) < 2:
         return jsonify([])
@@ -1690,102 +1698,143 @@ def buscar_pacientes():
     # Base query: si es médico, limitar a pacientes con consultas en su clínica
     base_q = filtered_pacientes_query()
 
-    # Buscar pacientes que coincidan con el query en nombre completo o DNI
-    pacientes = base_q.filter(
-        or_(
-            Paciente.nombre_completo.ilike(f'%{query}%'),
-            Paciente.dni.ilike(f'%{query}%')
-        )
-    ).limit(10).all()
+    # Buscar pacientes que coincidan con el query en nombre completo, DNI o expediente
+    pacientes = patient_search.search(base_q, query).limit(10).all()
+
+    # Conteo y última visita de todos los resultados en una sola query
+    resumen = {}
+    paciente_ids = [p.id for p in pacientes]
+    if paciente_ids:
+        filas = (filtered_consultas_query()
+            .with_entities(Consulta.paciente_id, func.count(Consulta.id), func.max(Consulta.fecha_consulta))
+            .filter(Consulta.paciente_id.in_(paciente_ids))
+            .group_by(Consulta.paciente_id)
+            .all())
+        resumen = {pid: (total, ultima) for pid, total, ultima in filas}
     
     # Formatear los resultados para el frontend
     resultados = []
     for paciente in pacientes:
-        # Obtener consultas del paciente (filtradas por clínica si aplica)
-        consultas = filtered_consultas_query().filter_by(paciente_id=paciente.id).order_by(Consulta.fecha_consulta.desc()).all()
-        
-        # Formatear historial de consultas
-        historial_consultas = []
-        
-        # FIX: Consultar los signos vitales más recientes (incluye iniciales sin consulta)
-        # 1) Primero buscar por consultas
-        sv_recientes = (SignosVitales.query
-            .join(Consulta, Consulta.id == SignosVitales.consulta_id)
-            .filter(Consulta.paciente_id == paciente.id)
-            .order_by(SignosVitales.fecha_registro.desc())
-            .first())
-        
-        # 2) Si no hay, buscar signos iniciales (sin consulta)
-        if not sv_recientes:
-            sv_recientes = (SignosVitales.query
-                .filter(SignosVitales.paciente_id == paciente.id, SignosVitales.consulta_id == None)
-                .order_by(SignosVitales.fecha_registro.desc())
-                .first())
-        
-        signos_vitales = sv_recientes.to_dict() if sv_recientes else None
-        
-        for consulta in consultas:
-            # Eliminar la asignación anterior que podía fallar
-            
-            # Agregar consulta al historial
-            consulta_data = {
-                'id': consulta.id,
-                'fecha': consulta.fecha_consulta.strftime('%d/%m/%Y %H:%M') if consulta.fecha_consulta else '',
-                'tipo_consulta': consulta.tipo_consulta or 'General',
-                'medico': consulta.medico.nombre_completo if consulta.medico else 'No especificado',
-                'motivo_consulta': consulta.motivo_consulta or '',
-                'historia_enfermedad': consulta.historia_enfermedad or '',
-                'revision_sistemas': consulta.revision_sistemas or '',
-                'antecedentes': consulta.antecedentes or '',
-                'diagnostico': consulta.diagnostico or '',
-                'tratamiento': consulta.tratamiento or '',
-                'estado': getattr(consulta, 'estado', '') or '',
-                'signos_vitales': consulta.signos_vitales.to_dict() if consulta.signos_vitales else None,
-                # Examen físico
-                'presion_arterial': consulta.presion_arterial or '',
-                'frecuencia_respiratoria': consulta.frecuencia_respiratoria or '',
-                'temperatura': consulta.temperatura or '',
-                'peso': consulta.peso or '',
-                'talla': consulta.talla or '',
-                'frecuencia_cardiaca': consulta.frecuencia_cardiaca or '',
-                'saturacion_oxigeno': consulta.saturacion_oxigeno or '',
-                'imc': consulta.imc or '',
-                # Antecedentes gineco-obstétricos
-                'gestas': consulta.gestas or '',
-                'partos': consulta.partos or '',
-                'abortos': consulta.abortos or '',
-                'hijos_vivos': consulta.hijos_vivos or '',
-                'hijos_muertos': consulta.hijos_muertos or '',
-                'fecha_ultima_regla': consulta.fecha_ultima_regla.strftime('%d/%m/%Y') if consulta.fecha_ultima_regla else ''
-            }
-            historial_consultas.append(consulta_data)
-        
-        resultado = {
+        total, ultima = resumen.get(paciente.id, (0, None))
+        resultados.append({
             'id': paciente.id,
             'nombre_completo': paciente.nombre_completo,
+            'dni': paciente.dni or 'No registrado',
             'edad': paciente.edad,
             'genero': paciente.sexo,
-            'dni': paciente.dni or 'No registrado',
-            'telefono': paciente.telefono or 'No registrado',
-            'direccion': paciente.direccion or 'No registrada',
-            'estado_civil': paciente.estado_civil or '',
-            'religion': paciente.religion or '',
-            'escolaridad': paciente.escolaridad or '',
-            'ocupacion': paciente.ocupacion or '',
-            'procedencia': paciente.procedencia or '',
-            'numero_expediente': paciente.numero_expediente or '',
-            'signos_vitales': signos_vitales,
-            'historial_consultas': historial_consultas,
-            'total_consultas': len(historial_consultas),
-            'tiene_consulta_activa': len(historial_consultas) > 0
-        }
-        resultados.append(resultado)
+            'ultima_consulta': ultima.strftime('%d/%m/%Y %H:%M') if ultima else '',
+            'total_consultas': total,
+            'tiene_consulta_activa': total > 0
+        })
     
     return jsonify(resultados)
 
+
+# Campos disponibles en el historial paginado: nombre -> (columnas a cargar, serializador)
+HISTORIAL_CAMPOS = {
+    'tipo_consulta': (['tipo_consulta'], lambda c: c.tipo_consulta or 'General'),
+    'estado': (['estado'], lambda c: c.estado or ''),
+    'medico': ([], lambda c: c.medico.nombre_completo if c.medico else 'No especificado'),
+    'motivo_consulta': (['motivo_consulta'], lambda c: c.motivo_consulta or ''),
+    'historia_enfermedad': (['historia_enfermedad'], lambda c: c.historia_enfermedad or ''),
+    'revision_sistemas': (['revision_sistemas'], lambda c: c.revision_sistemas or ''),
+    'antecedentes': (['antecedentes'], lambda c: c.antecedentes or ''),
+    'diagnostico': (['diagnostico'], lambda c: c.diagnostico or ''),
+    'laboratorio': (['laboratorio'], lambda c: c.laboratorio or ''),
+    'tratamiento': (['tratamiento'], lambda c: c.tratamiento or ''),
+    'indicaciones': (['indicaciones'], lambda c: c.indicaciones or ''),
+    'signos_vitales': ([], lambda c: c.signos_vitales.to_dict() if c.signos_vitales else None),
+    'presion_arterial': (['presion_arterial'], lambda c: c.presion_arterial or ''),
+    'frecuencia_respiratoria': (['frecuencia_respiratoria'], lambda c: c.frecuencia_respiratoria or ''),
+    'temperatura': (['temperatura'], lambda c: c.temperatura or ''),
+    'peso': (['peso'], lambda c: c.peso or ''),
+    'talla': (['talla'], lambda c: c.talla or ''),
+    'frecuencia_cardiaca': (['frecuencia_cardiaca'], lambda c: c.frecuencia_cardiaca or ''),
+    'saturacion_oxigeno': (['saturacion_oxigeno'], lambda c: c.saturacion_oxigeno or ''),
+    'imc': (['imc'], lambda c: c.imc or ''),
+    'gestas': (['gestas'], lambda c: c.gestas or ''),
+    'partos': (['partos'], lambda c: c.partos or ''),
+    'abortos': (['abortos'], lambda c: c.abortos or ''),
+    'hijos_vivos': (['hijos_vivos'], lambda c: c.hijos_vivos or ''),
+    'hijos_muertos': (['hijos_muertos'], lambda c: c.hijos_muertos or ''),
+    'fecha_ultima_regla': (['fecha_ultima_regla'], lambda c: c.fecha_ultima_regla.strftime('%d/%m/%Y') if c.fecha_ultima_regla else ''),
+}
+HISTORIAL_PAGE_SIZE = 20
+HISTORIAL_PAGE_SIZE_MAX = 100
+
+
+HISTORIAL_ORDEN = Keyset(Consulta.fecha_consulta.desc(), Consulta.id.desc())
+
+
+@bp.route('/api/pacientes/<int:paciente_id>/historial')
+@login_required
+@role_required('medico', 'admin')
+@solo_lectura
+def historial_paciente(paciente_id):
+    """Historial de consultas paginado por cursor (fecha_consulta, id) y con proyección de campos.
+
+    Parámetros: cursor (opaco, devuelto como next_cursor), limit, fields=diagnostico,tratamiento
+    e id=<consulta_id> para traer solo esa consulta (p. ej. todos sus campos al expandirla).
+    """
+    paciente = filtered_pacientes_query().filter(Paciente.id == paciente_id).first()
+    if not paciente:
+        return jsonify({'error': 'Paciente no encontrado'}), 404
+
+    fields_param = request.args.get('fields', '').strip()
+    if fields_param:
+        campos = [f.strip() for f in fields_param.split(',') if f.strip()]
+        desconocidos = [f for f in campos if f not in HISTORIAL_CAMPOS]
+        if desconocidos:
+            return jsonify({'error': f"Campos no válidos: {', '.join(desconocidos)}"}), 400
+    else:
+        campos = list(HISTORIAL_CAMPOS)
+
+    columnas = [Consulta.id, Consulta.fecha_consulta, Consulta.paciente_id]
+    for campo in campos:
+        columnas.extend(getattr(Consulta, col) for col in HISTORIAL_CAMPOS[campo][0])
+    opciones = [load_only(*columnas)]
+    if 'medico' in campos:
+        opciones.append(joinedload(Consulta.medico).load_only(Usuario.nombre_completo))
+    if 'signos_vitales' in campos:
+        opciones.append(joinedload(Consulta.signos_vitales))
+
+    base_q = filtered_consultas_query().filter(Consulta.paciente_id == paciente.id)
+    q = base_q.options(*opciones)
+    consulta_id = request.args.get('id', type=int)
+    if consulta_id is not None:
+        q = q.filter(Consulta.id == consulta_id)
+
+    cursor = request.args.get('cursor')
+    try:
+        pagina = HISTORIAL_ORDEN.paginate(q, cursor, request.args.get('limit', type=int),
+                                          default=HISTORIAL_PAGE_SIZE, maximo=HISTORIAL_PAGE_SIZE_MAX)
+    except CursorInvalido:
+        return jsonify({'error': 'Cursor inválido'}), 400
+    consultas = pagina.items
+
+    historial = []
+    for c in consultas:
+        item = {
+            'id': c.id,
+            'fecha': c.fecha_consulta.strftime('%d/%m/%Y %H:%M') if c.fecha_consulta else ''
+        }
+        for campo in campos:
+            item[campo] = HISTORIAL_CAMPOS[campo][1](c)
+        historial.append(item)
+
+    respuesta = {
+        'paciente_id': paciente.id,
+        'historial': historial,
+        'next_cursor': pagina.next_cursor
+    }
+    if not cursor and consulta_id is None:
+        respuesta['total'] = base_q.count()
+    return jsonify(respuesta)
+
 @bp.route('/descargar_historial_pdf/<int:paciente_id>')
 @login_required
 @role_required('medico', 'admin')
+@solo_lectura
 def descargar_historial_pdf(paciente_id):
     """Generar y descargar PDF con el historial médico completo del paciente"""
     
@@ -1793,54 +1842,45 @@ def descargar_historial_pdf(paciente_id):
         flash('Error: La funcionalidad de PDF no está disponible. Instale reportlab.', 'error')
         return redirect(url_for('main.consultas'))
     
+    Paciente.query.get_or_404(paciente_id)
+    # Filtrar por clínica si es médico
+    clinica_id = current_user.clinica_actual_id if current_user.rol == 'medico' and current_user.clinica_actual_id else None
+    if pdf_jobs.solicitado_async():
+        return pdf_jobs.respuesta_encolada('historial', {'paciente_id': paciente_id, 'clinica_id': clinica_id})
+
+    contenido, nombre_archivo = generar_pdf_historial(paciente_id, clinica_id)
+
+    # Crear respuesta con el PDF
+    response = make_response(contenido)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
+
+
+@pdf_jobs.generador('historial')
+@metrics.pdf('historial')
+def generar_pdf_historial(paciente_id, clinica_id=None):
+    """Construye el PDF del historial del paciente. Devuelve (contenido, nombre de archivo)."""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Table
+    from app.utils.pdf_document import ClinicaDocTemplate, ESTILOS, TABLAS
+
     # Obtener paciente
-    paciente = Paciente.query.get_or_404(paciente_id)
+    paciente = db.session.get(Paciente, paciente_id)
+    if paciente is None:
+        raise LookupError(f'El paciente {paciente_id} no existe')
     
-    # Obtener consultas del paciente (filtrar por clínica si es médico)
+    # Obtener consultas del paciente
     consultas_q = Consulta.query.filter_by(paciente_id=paciente.id)
-    if current_user.rol == 'medico' and current_user.clinica_actual_id:
-        consultas_q = consultas_q.filter(Consulta.clinica_id == current_user.clinica_actual_id)
+    if clinica_id:
+        consultas_q = consultas_q.filter(Consulta.clinica_id == clinica_id)
     consultas = consultas_q.order_by(Consulta.fecha_consulta.desc()).all()
     
-    # Crear buffer para el PDF
-    buffer = io.BytesIO()
-    
-    # Crear documento PDF
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=inch,
-        leftMargin=inch,
-        topMargin=inch,
-        bottomMargin=inch
-    )
-    
-    # Estilos
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12,
-        textColor=colors.darkgreen
-    )
-    
-    subheading_style = ParagraphStyle(
-        'CustomSubHeading',
-        parent=styles['Heading3'],
-        fontSize=12,
-        spaceAfter=8,
-        textColor=colors.darkred
-    )
+    # Estilos precalculados (ver app/utils/pdf_document.py)
+    styles = ESTILOS
+    title_style = styles['historial_titulo']
+    heading_style = styles['historial_seccion']
+    subheading_style = styles['historial_subseccion']
     
     # Construir contenido del PDF
     story = []
@@ -1866,16 +1906,7 @@ def descargar_historial_pdf(paciente_id):
     ]
     
     paciente_table = Table(paciente_info, colWidths=[2*inch, 4*inch])
-    paciente_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
+    paciente_table.setStyle(TABLAS['historial_paciente'])
     
     story.append(paciente_table)
     story.append(Spacer(1, 30))
@@ -1885,7 +1916,7 @@ def descargar_historial_pdf(paciente_id):
     story.append(Spacer(1, 15))
     
     if not consultas:
-        story.append(Paragraph("No hay consultas registradas para este paciente.", styles['Normal']))
+        story.append(Paragraph("No hay consultas registradas para este paciente.", styles['normal']))
     else:
         # Iterar por cada consulta
         for i, consulta in enumerate(consultas, 1):
@@ -1901,21 +1932,13 @@ def descargar_historial_pdf(paciente_id):
             ]
             
             consulta_table = Table(consulta_info, colWidths=[2*inch, 4*inch])
-            consulta_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ]))
+            consulta_table.setStyle(TABLAS['historial_consulta'])
             story.append(consulta_table)
             story.append(Spacer(1, 10))
             
             # Signos vitales si existen
             if consulta.signos_vitales:
-                story.append(Paragraph("Signos Vitales:", ParagraphStyle('SignosTitle', parent=styles['Normal'], fontSize=10, textColor=colors.darkblue, fontName='Helvetica-Bold')))
+                story.append(Paragraph("Signos Vitales:", styles['etiqueta_signos']))
                 
                 signos_info = [
                     ['Presión Arterial:', consulta.signos_vitales.presion_arterial or '--'],
@@ -1927,262 +1950,104 @@ def descargar_historial_pdf(paciente_id):
                 ]
                 
                 signos_table = Table(signos_info, colWidths=[1.5*inch, 1.5*inch])
-                signos_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (0, -1), colors.lightyellow),
-                    ('FONTSIZE', (0, 0), (-1, -1), 8),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ]))
+                signos_table.setStyle(TABLAS['historial_signos'])
                 story.append(signos_table)
                 story.append(Spacer(1, 10))
             
             # Motivo de consulta
             if consulta.motivo_consulta:
-                story.append(Paragraph("Motivo de Consulta:", ParagraphStyle('MotivoTitle', parent=styles['Normal'], fontSize=10, textColor=colors.darkgreen, fontName='Helvetica-Bold')))
-                story.append(Paragraph(consulta.motivo_consulta, styles['Normal']))
+                story.append(Paragraph("Motivo de Consulta:", styles['etiqueta_motivo']))
+                story.append(Paragraph(consulta.motivo_consulta, styles['normal']))
                 story.append(Spacer(1, 8))
             
             # Historia de la enfermedad
             if consulta.historia_enfermedad:
-                story.append(Paragraph("Historia de la Enfermedad:", ParagraphStyle('HistoriaTitle', parent=styles['Normal'], fontSize=10, textColor=colors.darkorange, fontName='Helvetica-Bold')))
-                story.append(Paragraph(consulta.historia_enfermedad, styles['Normal']))
+                story.append(Paragraph("Historia de la Enfermedad:", styles['etiqueta_historia']))
+                story.append(Paragraph(consulta.historia_enfermedad, styles['normal']))
                 story.append(Spacer(1, 8))
             
             # Diagnóstico
             if consulta.diagnostico:
-                story.append(Paragraph("Diagnóstico:", ParagraphStyle('DiagnosticoTitle', parent=styles['Normal'], fontSize=10, textColor=colors.darkred, fontName='Helvetica-Bold')))
-                story.append(Paragraph(consulta.diagnostico, styles['Normal']))
+                story.append(Paragraph("Diagnóstico:", styles['etiqueta_diagnostico']))
+                story.append(Paragraph(consulta.diagnostico, styles['normal']))
                 story.append(Spacer(1, 8))
             
             # Tratamiento
             if consulta.tratamiento:
-                story.append(Paragraph("Tratamiento:", ParagraphStyle('TratamientoTitle', parent=styles['Normal'], fontSize=10, textColor=colors.darkblue, fontName='Helvetica-Bold')))
-                story.append(Paragraph(consulta.tratamiento, styles['Normal']))
+                story.append(Paragraph("Tratamiento:", styles['etiqueta_tratamiento']))
+                story.append(Paragraph(consulta.tratamiento, styles['normal']))
                 story.append(Spacer(1, 8))
             
             # Antecedentes si existen
             if consulta.antecedentes:
-                story.append(Paragraph("Antecedentes:", ParagraphStyle('AntecedentesTitle', parent=styles['Normal'], fontSize=10, textColor=colors.purple, fontName='Helvetica-Bold')))
-                story.append(Paragraph(consulta.antecedentes, styles['Normal']))
+                story.append(Paragraph("Antecedentes:", styles['etiqueta_antecedentes']))
+                story.append(Paragraph(consulta.antecedentes, styles['normal']))
                 story.append(Spacer(1, 8))
             
             # Separador entre consultas
             if i < len(consultas):
                 story.append(Spacer(1, 20))
-                story.append(Paragraph("─" * 80, styles['Normal']))
+                story.append(Paragraph("─" * 80, styles['normal']))
                 story.append(Spacer(1, 20))
     
-    # Removido pie de página con fecha/autor
-    # Nota: La firma se dibuja solo en la última página mediante canvasmaker abajo
-    
-    # Construir PDF con encabezado y marca de agua
-    def _watermark(canv, doc):
-        import os
-        candidates = ['logo_clinicas.jpg', 'logo_clinicas.JPG', 'logo_clinicas_familiares_cunori.jpg', 'logotipo-cunori-transparente.png', 'logo.png', 'logo.JPG']
-        logo_path = None
-        for name in candidates:
-            p = os.path.join(current_app.root_path, 'static', 'img', name)
-            if os.path.exists(p):
-                logo_path = p
-                break
-        if not logo_path:
-            return
-        try:
-            canv.saveState()
-            if hasattr(canv, 'setFillAlpha'):
-                canv.setFillAlpha(0.08)
-            try:
-                page_w, page_h = doc.pagesize
-            except Exception:
-                page_w, page_h = getattr(canv, '_pagesize', (letter[0], letter[1]))
-            w = page_w * 0.6
-            h = page_h * 0.6
-            x = (page_w - w) / 2
-            y = (page_h - h) / 2
-            canv.drawImage(logo_path, x, y, width=w, height=h, preserveAspectRatio=True, mask='auto')
-        finally:
-            if hasattr(canv, 'setFillAlpha'):
-                canv.setFillAlpha(1)
-            canv.restoreState()
-    def _header(canv, doc):
-        margin = inch
-        img_h = 28
-        img_w = 28
-        try:
-            page_w, page_h = doc.pagesize
-        except Exception:
-            page_w, page_h = getattr(canv, '_pagesize', (letter[0], letter[1]))
-        y = page_h - img_h - 10
-        # logos
-        left_candidates = ['logo_clinicas.jpg', 'logo_clinicas.JPG', 'logo_clinicas_familiares_cunori.jpg', 'logotipo-cunori-transparente.png', 'logo.png', 'logo.JPG']
-        right_candidates = ['escudo_guatemala.png', 'logotipo-cunori-transparente.png', 'logo.JPG']
-        def pick(cands):
-            for nm in cands:
-                p = os.path.join(current_app.root_path, 'static', 'img', nm)
-                if os.path.exists(p):
-                    return p
-            return None
-        left_path = pick(left_candidates)
-        right_path = pick(right_candidates)
-        try:
-            canv.saveState()
-            if left_path:
-                canv.drawImage(left_path, margin, y, width=img_w, height=img_h, preserveAspectRatio=True, mask='auto')
-            if right_path:
-                canv.drawImage(right_path, page_w - margin - img_w, y, width=img_w, height=img_h, preserveAspectRatio=True, mask='auto')
-            canv.setFont('Helvetica-Bold', 12)
-            canv.setFillColorRGB(0.1, 0.16, 0.23)
-            canv.drawCentredString(page_w/2, y + 8, 'Clínicas Familiares CUNORI-Shororagua')
-            canv.setLineWidth(0.5)
-            canv.setStrokeColorRGB(0.6, 0.6, 0.6)
-            canv.line(margin, y - 4, page_w - margin, y - 4)
-        finally:
-            canv.restoreState()
-
-    def _draw(canv, doc):
-        _header(canv, doc)
-        _watermark(canv, doc)
-
-    # Dibujar bloque de firma únicamente en la última página
-    from reportlab.pdfgen import canvas as rl_canvas
-    class LastPageSignatureCanvas(rl_canvas.Canvas):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-            self._saved_page_states = []
-        def showPage(self):
-            self._saved_page_states.append(dict(self.__dict__))
-            self._startPage()
-        def save(self):
-            total = len(self._saved_page_states)
-            for idx, state in enumerate(self._saved_page_states, start=1):
-                self.__dict__.update(state)
-                _draw(self, self)
-                if idx == total:
-                    self.saveState()
-                    page_w, page_h = self._pagesize
-                    margin = 72
-                    line_w = 200
-                    x1 = (page_w - line_w) / 2
-                    y = margin + 40
-                    self.setLineWidth(1)
-                    self.line(x1, y, x1 + line_w, y)
-                    self.setFont('Helvetica', 10)
-                    self.drawCentredString(page_w/2, y - 14, 'Firma y sello')
-                    self.setFont('Helvetica-Oblique', 10)
-                    self.drawCentredString(page_w/2, y - 28, 'Médico')
-                    self.restoreState()
-                super().showPage()
-            super().save()
-
-    doc.build(story, canvasmaker=LastPageSignatureCanvas)
-    
-    # Preparar respuesta
-    buffer.seek(0)
+    # Encabezado, marca de agua y firma en la última página los pone la plantilla
+    buffer = ClinicaDocTemplate('historial').build_to(io.BytesIO(), story)
     
     # Crear nombre del archivo
     nombre_archivo = f"historial_medico_{paciente.nombre_completo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    
-    # Crear respuesta con el PDF
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
-    
-    buffer.close()
-    
-    return response
+    return buffer.getvalue(), nombre_archivo
 
 # ==================== RUTAS DE REPORTES MÉDICOS ESTADÍSTICOS ====================
 
+# Rangos de edad de los reportes (límite superior inclusivo); > 90 => '90+'
+RANGOS_EDAD = [
+    (0, 5), (6, 10), (11, 15), (16, 20), (21, 25), (26, 30),
+    (31, 35), (36, 40), (41, 45), (46, 50), (51, 55), (56, 60),
+    (61, 65), (66, 70), (71, 75), (76, 80), (81, 85), (86, 90)
+]
+RANGOS_EDAD_ETIQUETAS = [f'{a}-{b}' for a, b in RANGOS_EDAD] + ['90+']
+
+
+def _rango_edad_sql():
+    """Expresión CASE que asigna a cada paciente la etiqueta de su rango de edad."""
+    return case(
+        *[(Paciente.edad <= b, f'{a}-{b}') for a, b in RANGOS_EDAD],
+        else_=case((Paciente.edad.isnot(None), '90+'), else_=None)
+    )
+
+
 @bp.route('/api/reportes/estadisticas_generales')
 @login_required
 @role_required('medico', 'admin')
+@solo_lectura
+@report_cache.cached
 def estadisticas_generales():
     """API para obtener estadísticas generales de pacientes"""
     try:
         # Alcance: si es médico, filtrar por su clínica; admin/supervisor => global
         is_medico_scoped = (current_user.rol == 'medico' and current_user.clinica_actual_id)
 
-        # Obtener subconjunto de pacientes según alcance (IDs por consultas en la clínica)
+        # 1) Pacientes: género y rango de edad agrupados en SQL
+        rango_edad = _rango_edad_sql()
+        pacientes_q = db.session.query(Paciente.sexo, rango_edad, func.count(Paciente.id)) \
+            .group_by(Paciente.sexo, rango_edad)
         if is_medico_scoped:
-            pacientes_ids_rows = db.session.query(Consulta.paciente_id) \
-                .filter(Consulta.clinica_id == current_user.clinica_actual_id) \
-                .distinct().all()
-            pacientes_ids = [row[0] for row in pacientes_ids_rows if row[0] is not None]
-            pacientes_base_q = Paciente.query.filter(Paciente.id.in_(pacientes_ids))
-            consultas_base_q = Consulta.query.filter(Consulta.clinica_id == current_user.clinica_actual_id)
-        else:
-            pacientes_base_q = Paciente.query
-            consultas_base_q = Consulta.query
+            pacientes_q = pacientes_q.filter(Paciente.id.in_(
+                db.session.query(Consulta.paciente_id)
+                .filter(Consulta.clinica_id == current_user.clinica_actual_id)
+            ))
 
-        # Total de pacientes (según alcance)
-        total_pacientes = pacientes_base_q.count()
-        
-        # Distribución por género (según alcance)
-        pacientes_por_genero = db.session.query(
-            Paciente.sexo, func.count(Paciente.id)
-        )
-        if is_medico_scoped:
-            pacientes_por_genero = pacientes_por_genero.filter(Paciente.id.in_(pacientes_ids))
-        pacientes_por_genero = pacientes_por_genero.group_by(Paciente.sexo).all()
-        
+        total_pacientes = 0
         genero_data = {}
-        for genero, count in pacientes_por_genero:
-            genero_data[genero or 'No especificado'] = count
-            
-        # Distribución por edad (rangos) sobre el subconjunto de pacientes
-        rangos_edad = {
-            '0-5': 0, '6-10': 0, '11-15': 0, '16-20': 0, '21-25': 0,
-            '26-30': 0, '31-35': 0, '36-40': 0, '41-45': 0, '46-50': 0,
-            '51-55': 0, '56-60': 0, '61-65': 0, '66-70': 0, '71-75': 0,
-            '76-80': 0, '81-85': 0, '86-90': 0, '90+': 0
-        }
-        
-        pacientes = pacientes_base_q.all()
-        for paciente in pacientes:
-            if paciente.edad is not None:
-                edad = paciente.edad
-                if edad <= 5:
-                    rangos_edad['0-5'] += 1
-                elif edad <= 10:
-                    rangos_edad['6-10'] += 1
-                elif edad <= 15:
-                    rangos_edad['11-15'] += 1
-                elif edad <= 20:
-                    rangos_edad['16-20'] += 1
-                elif edad <= 25:
-                    rangos_edad['21-25'] += 1
-                elif edad <= 30:
-                    rangos_edad['26-30'] += 1
-                elif edad <= 35:
-                    rangos_edad['31-35'] += 1
-                elif edad <= 40:
-                    rangos_edad['36-40'] += 1
-                elif edad <= 45:
-                    rangos_edad['41-45'] += 1
-                elif edad <= 50:
-                    rangos_edad['46-50'] += 1
-                elif edad <= 55:
-                    rangos_edad['51-55'] += 1
-                elif edad <= 60:
-                    rangos_edad['56-60'] += 1
-                elif edad <= 65:
-                    rangos_edad['61-65'] += 1
-                elif edad <= 70:
-                    rangos_edad['66-70'] += 1
-                elif edad <= 75:
-                    rangos_edad['71-75'] += 1
-                elif edad <= 80:
-                    rangos_edad['76-80'] += 1
-                elif edad <= 85:
-                    rangos_edad['81-85'] += 1
-                elif edad <= 90:
-                    rangos_edad['86-90'] += 1
-                else:
-                    rangos_edad['90+'] += 1
-        
-        # Total de consultas (según alcance)
-        total_consultas = consultas_base_q.count()
-
-        # Consultas por mes (últimos 6 meses) - sistema ya está en Guatemala
+        rangos_edad = {etiqueta: 0 for etiqueta in RANGOS_EDAD_ETIQUETAS}
+        for genero, rango, count in pacientes_q.all():
+            total_pacientes += count
+            clave_genero = genero or 'No especificado'
+            genero_data[clave_genero] = genero_data.get(clave_genero, 0) + count
+            if rango is not None:
+                rangos_edad[rango] += count
+
+        # 2) Consultas: total y últimos 6 meses desde el rollup diario
         now = datetime.now()
         first_of_this_month = datetime(now.year, now.month, 1)
 
@@ -2191,19 +2056,18 @@ def estadisticas_generales():
             month = (dt.month - 1 + months) % 12 + 1
             return datetime(year, month, 1)
 
-        month_starts = [add_months(first_of_this_month, offset) for offset in range(-5, 1)]
+        month_starts = [add_months(first_of_this_month, offset) for offset in range(-5, 2)]
+        total_consultas, conteos_mes = rollups.conteo_por_periodos(
+            month_starts, current_user.clinica_actual_id if is_medico_scoped else None
+        )
+
         meses_data = {}
-        for start in month_starts:
-            end = add_months(start, 1)
-            q = consultas_base_q
-            total = q.filter(Consulta.fecha_consulta >= start, Consulta.fecha_consulta < end).count()
+        for i, start in enumerate(month_starts[:-1]):
             mes_nombre = ['', 'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
                           'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'][start.month]
-            clave = f"{mes_nombre} {start.year}"
-            meses_data[clave] = total
-            print(f"DEBUG: Mes {clave}, consultas: {total}")
+            meses_data[f"{mes_nombre} {start.year}"] = conteos_mes[i]
         consultas_mes_actual = list(meses_data.values())[-1] if meses_data else 0
-        
+
         return jsonify({
             'success': True,
             'data': {
@@ -2217,35 +2081,20 @@ def estadisticas_generales():
         })
         
     except Exception as e:
-        print(f"Error en estadísticas generales: {e}")
+        logger.exception('Error en estadísticas generales')
         return jsonify({'success': False, 'error': str(e)})
 
 @bp.route('/api/reportes/enfermedades_comunes')
 @login_required
 @role_required('medico', 'admin')
+@solo_lectura
+@report_cache.cached
 def enfermedades_comunes():
     """API para obtener las enfermedades más comunes"""
     try:
-        # Obtener diagnósticos (filtrar por clínica si es médico)
-        if current_user.rol == 'medico' and current_user.clinica_actual_id:
-            consultas = Consulta.query.filter(
-                Consulta.diagnostico.isnot(None),
-                Consulta.clinica_id == current_user.clinica_actual_id
-            ).all()
-        else:
-            consultas = Consulta.query.filter(Consulta.diagnostico.isnot(None)).all()
-        
-        # Contar diagnósticos
-        diagnosticos = []
-        for consulta in consultas:
-            if consulta.diagnostico and consulta.diagnostico.strip():
-                diagnosticos.append(consulta.diagnostico.strip().lower())
-        
-        # Contar frecuencias
-        contador_diagnosticos = Counter(diagnosticos)
-        
-        # Obtener los 15 más comunes
-        top_diagnosticos = contador_diagnosticos.most_common(15)
+        # Diagnósticos más frecuentes desde el rollup (filtrar por clínica si es médico)
+        clinica_id = current_user.clinica_actual_id if current_user.rol == 'medico' else None
+        top_diagnosticos = rollups.diagnosticos_frecuentes(clinica_id, limite=15)
         
         enfermedades_data = {}
         for diagnostico, count in top_diagnosticos:
@@ -2259,59 +2108,20 @@ def enfermedades_comunes():
         })
         
     except Exception as e:
-        print(f"Error en enfermedades comunes: {e}")
+        logger.exception('Error en enfermedades comunes')
         return jsonify({'success': False, 'error': str(e)})
 
 @bp.route('/api/reportes/problemas_por_sistemas')
 @login_required
 @role_required('medico', 'admin')
+@solo_lectura
+@report_cache.cached
 def problemas_por_sistemas():
     """API para obtener problemas clasificados por sistemas médicos"""
     try:
-        # Definir palabras clave para cada sistema
-        sistemas_keywords = {
-            'Respiratorio': ['tos', 'gripe', 'resfriado', 'bronquitis', 'asma', 'neumonía', 'congestion', 'respiratorio'],
-            'Cardiovascular': ['corazón', 'hipertensión', 'presión', 'cardiaco', 'cardiovascular', 'arritmia'],
-            'Neurológico': ['dolor de cabeza', 'cefalea', 'migraña', 'neurológico', 'mareo', 'vértigo'],
-            'Musculo Esquelético': ['dolor', 'espalda', 'articulaciones', 'músculo', 'hueso', 'artritis', 'lumbar'],
-            'Gastrointestinal': ['estómago', 'digestivo', 'diarrea', 'estreñimiento', 'gastritis', 'intestinal'],
-            'Genitourinario': ['urinario', 'riñón', 'vejiga', 'genital', 'infección urinaria'],
-            'Endocrino': ['diabetes', 'tiroides', 'hormonal', 'endocrino', 'glucosa'],
-            'Dermatológico': ['piel', 'dermatitis', 'rash', 'alergia', 'eccema'],
-            'Oftalmológico': ['ojo', 'visión', 'oftalmológico', 'conjuntivitis'],
-            'Otorrinolaringológico': ['oído', 'garganta', 'nariz', 'otitis', 'sinusitis'],
-            'Ginecológico': ['ginecológico', 'menstrual', 'embarazo', 'pélvico'],
-            'Pediátrico': ['niño', 'infantil', 'pediátrico', 'desarrollo']
-        }
-        
-        # Obtener diagnósticos y motivos (filtrar por clínica si es médico)
-        if current_user.rol == 'medico' and current_user.clinica_actual_id:
-            consultas = Consulta.query.filter(
-                or_(Consulta.diagnostico.isnot(None), Consulta.motivo_consulta.isnot(None)),
-                Consulta.clinica_id == current_user.clinica_actual_id
-            ).all()
-        else:
-            consultas = Consulta.query.filter(
-                or_(Consulta.diagnostico.isnot(None), Consulta.motivo_consulta.isnot(None))
-            ).all()
-        
-        # Contar por sistemas
-        sistemas_count = defaultdict(int)
-        
-        for consulta in consultas:
-            texto_consulta = ""
-            if consulta.diagnostico:
-                texto_consulta += consulta.diagnostico.lower() + " "
-            if consulta.motivo_consulta:
-                texto_consulta += consulta.motivo_consulta.lower() + " "
-            
-            if texto_consulta.strip():
-                # Clasificar por sistema
-                for sistema, keywords in sistemas_keywords.items():
-                    for keyword in keywords:
-                        if keyword in texto_consulta:
-                            sistemas_count[sistema] += 1
-                            break  # Solo contar una vez por consulta por sistema
+        # Conteo agregado sobre las etiquetas guardadas (filtrar por clínica si es médico)
+        clinica_id = current_user.clinica_actual_id if current_user.rol == 'medico' else None
+        sistemas_count = conteo_por_sistema(clinica_id)
         
         # Convertir a diccionario regular y ordenar
         sistemas_data = dict(sistemas_count)
@@ -2322,76 +2132,23 @@ def problemas_por_sistemas():
         })
         
     except Exception as e:
-        print(f"Error en problemas por sistemas: {e}")
+        logger.exception('Error en problemas por sistemas')
         return jsonify({'success': False, 'error': str(e)})
 
 @bp.route('/api/reportes/sistema_detalle/<sistema>')
 @login_required
 @role_required('medico', 'admin')
+@solo_lectura
+@report_cache.cached
 def sistema_detalle(sistema):
     """API para obtener detalles de un sistema específico"""
     try:
-        # Definir sub-categorías por sistema
-        subcategorias = {
-            'Respiratorio': {
-                'resfriado común': ['resfriado', 'tos', 'gripe'],
-                'bronquitis': ['bronquitis'],
-                'asma': ['asma'],
-                'neumonía': ['neumonía'],
-                'sinusitis': ['sinusitis']
-            },
-            'Neurológico': {
-                'cefalea': ['dolor de cabeza', 'cefalea'],
-                'migraña': ['migraña'],
-                'mareos': ['mareo', 'vértigo']
-            },
-            'Musculo Esquelético': {
-                'dolor lumbar': ['lumbar', 'espalda baja'],
-                'artritis': ['artritis'],
-                'dolor articular': ['articulaciones'],
-                'dolor muscular': ['músculo', 'muscular']
-            },
-            'Cardiovascular': {
-                'hipertensión': ['hipertensión', 'presión alta'],
-                'arritmia': ['arritmia', 'palpitaciones']
-            },
-            'Gastrointestinal': {
-                'gastritis': ['gastritis'],
-                'diarrea': ['diarrea'],
-                'estreñimiento': ['estreñimiento']
-            }
-        }
-        
-        if sistema not in subcategorias:
+        if not subcategorias(sistema):
             return jsonify({'success': False, 'error': 'Sistema no encontrado'})
         
-        # Obtener consultas relacionadas (filtrar por clínica si es médico)
-        if current_user.rol == 'medico' and current_user.clinica_actual_id:
-            consultas = Consulta.query.filter(
-                or_(Consulta.diagnostico.isnot(None), Consulta.motivo_consulta.isnot(None)),
-                Consulta.clinica_id == current_user.clinica_actual_id
-            ).all()
-        else:
-            consultas = Consulta.query.filter(
-                or_(Consulta.diagnostico.isnot(None), Consulta.motivo_consulta.isnot(None))
-            ).all()
-        
-        # Contar subcategorías
-        subcat_count = defaultdict(int)
-        
-        for consulta in consultas:
-            texto_consulta = ""
-            if consulta.diagnostico:
-                texto_consulta += consulta.diagnostico.lower() + " "
-            if consulta.motivo_consulta:
-                texto_consulta += consulta.motivo_consulta.lower() + " "
-            
-            if texto_consulta.strip():
-                for subcategoria, keywords in subcategorias[sistema].items():
-                    for keyword in keywords:
-                        if keyword in texto_consulta:
-                            subcat_count[subcategoria] += 1
-                            break
+        # Conteo agregado por subcategoría (filtrar por clínica si es médico)
+        clinica_id = current_user.clinica_actual_id if current_user.rol == 'medico' else None
+        subcat_count = conteo_por_subcategoria(sistema, clinica_id)
         
         return jsonify({
             'success': True,
@@ -2400,10 +2157,73 @@ def sistema_detalle(sistema):
         })
         
     except Exception as e:
-        print(f"Error en detalle de sistema: {e}")
+        logger.exception('Error en detalle de sistema')
         return jsonify({'success': False, 'error': str(e)})
 
 
+@bp.route('/api/reportes/cache_metrics')
+@login_required
+@role_required('admin')
+def reportes_cache_metrics():
+    """Aciertos/fallos de la caché de reportes, de la caché de PDF y de los gráficos"""
+    from app.utils.pdf_cache import pdf_cache
+    return jsonify({'success': True, 'data': report_cache.estadisticas(), 'pdf': pdf_cache.estadisticas(),
+                    'graficos': charts.estadisticas()})
+
+
+@bp.route('/admin/perf', methods=['GET', 'POST'])
+@login_required
+@role_required('admin')
+def admin_perf():
+    """Endpoints más lentos entre las peticiones muestreadas (``?formato=json`` para la API)"""
+    from app.utils.perf import perf
+    if request.method == 'POST':
+        perf.limpiar()
+        flash('Estadísticas de rendimiento reiniciadas.', 'success')
+        return redirect(url_for('main.admin_perf'))
+    endpoints = perf.peores_endpoints(limite=request.args.get('limite', 25, type=int))
+    if request.args.get('formato') == 'json':
+        return jsonify({'success': True, 'data': endpoints, 'tasa_muestreo': perf.tasa})
+    return render_template('main/admin_perf.html', title='Rendimiento', endpoints=endpoints, perf=perf)
+
+
+@bp.route('/api/reportes/grafico/<tipo>.<formato>')
+@login_required
+@role_required('medico', 'admin')
+@solo_lectura
+def reportes_grafico(tipo, formato):
+    """Gráfico de reportes como imagen (``?miniatura=1`` para la versión reducida del panel)"""
+    if tipo not in charts.tipos or formato not in FORMATOS_GRAFICO:
+        abort(404)
+    is_medico_scoped = (current_user.rol == 'medico' and current_user.clinica_actual_id)
+    clinica_id = current_user.clinica_actual_id if is_medico_scoped else None
+    miniatura = request.args.get('miniatura', '').lower() in ('1', 'true')
+
+    etag = hashlib.sha1(f'{tipo}|{clinica_id}|{charts.version_datos()}|{formato}|{miniatura}'.encode('utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        respuesta = make_response('', 304)
+    else:
+        contenido = charts.render(tipo, clinica_id, formato=formato, miniatura=miniatura)
+        if contenido is None:
+            return jsonify({'success': False, 'error': 'Sin datos para el gráfico'}), 404
+        respuesta = make_response(contenido)
+        respuesta.mimetype = FORMATOS_GRAFICO[formato]
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+
+@bp.route('/api/reportes/tags/backfill', methods=['GET', 'POST'])
+@login_required
+@role_required('admin')
+def reportes_tags_backfill():
+    """Estado (GET) o inicio en segundo plano (POST) de la clasificación de consultas existentes"""
+    if request.method == 'POST':
+        iniciado = tag_backfill.iniciar(current_app._get_current_object())
+        return jsonify({'success': True, 'iniciado': iniciado, 'estado': tag_backfill.estado})
+    return jsonify({'success': True, 'estado': tag_backfill.estado})
+
+
 # ===== Vista para asignar médicos a clínicas (Supervisor/Admin) =====
 @bp.route('/asignar_clinicas', methods=['GET'])
 @login_required
@@ -93,6 +93,11 @@ class SignosVitales(db.Model):
     fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
     paciente_id = db.Column(db.Integer, db.ForeignKey('paciente.id'), nullable=True)  # Para signos iniciales sin consulta
     consulta_id = db.Column(db.Integer, db.ForeignKey('consulta.id'), nullable=True)  # Ahora es opcional
+
+    __table_args__ = (
+        db.Index('ix_signos_vitales_consulta_id', 'consulta_id'),
+        db.Index('ix_signos_vitales_paciente_fecha', 'paciente_id', 'fecha_registro'),
+    )
     
     def to_dict(self):
         return {
@@ -146,6 +151,14 @@ class Consulta(db.Model):
     tratamiento = db.Column(db.Text)  # Medicamentos recetados
     indicaciones = db.Column(db.Text)  # Indicaciones adicionales para el paciente
     signos_vitales = db.relationship('SignosVitales', backref='consulta', uselist=False)
+
+    # Índices para los filtros más frecuentes (historial, reportes por clínica/mes, estado)
+    __table_args__ = (
+        db.Index('ix_consulta_paciente_fecha', paciente_id, fecha_consulta.desc()),
+        db.Index('ix_consulta_clinica_fecha', clinica_id, fecha_consulta),
+        db.Index('ix_consulta_paciente_estado', paciente_id, estado),
+        db.Index('ix_consulta_fecha', fecha_consulta),
+    )
     
     def __repr__(self):
         return f'<Consulta {self.id}>'
@@ -200,6 +213,10 @@ class CodigoVerificacion(db.Model):
     fecha_expiracion = db.Column(db.DateTime, nullable=False)
     
     usuario = db.relationship('Usuario', backref='codigos_verificacion')
+
+    __table_args__ = (
+        db.Index('ix_codigo_verificacion_usuario_tipo_usado', 'usuario_id', 'tipo', 'usado'),
+    )
     
     @staticmethod
     def generar_codigo():
@@ -261,4 +278,103 @@ class VerificationCode(db.Model):
 
     def is_expired(self):
         """Check if the verification code is expired (valid for 30 minutes)."""
-        return datetime.utcnow() > self.timestamp + timedelta(minutes=30)
\ No newline at end of file
+        return datetime.utcnow() > self.timestamp + timedelta(minutes=30)
+
+class EstadisticaDiaria(db.Model):
+    """Contadores pre-agregados por día y clínica (se mantienen al guardar consultas)."""
+    __tablename__ = 'estadistica_diaria'
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.Date, nullable=False)
+    clinica_id = db.Column(db.Integer, db.ForeignKey('clinica.id'), nullable=True)
+    total_consultas = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('fecha', 'clinica_id', name='uq_estadistica_diaria_fecha_clinica'),
+        db.Index('ix_estadistica_diaria_clinica_fecha', 'clinica_id', 'fecha'),
+    )
+
+    def __repr__(self):
+        return f'<EstadisticaDiaria {self.fecha} {self.clinica_id}>'
+
+
+class EstadisticaDiagnostico(db.Model):
+    """Frecuencia diaria de diagnósticos (texto normalizado) por clínica."""
+    __tablename__ = 'estadistica_diagnostico'
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.Date, nullable=False)
+    clinica_id = db.Column(db.Integer, db.ForeignKey('clinica.id'), nullable=True)
+    diagnostico = db.Column(db.String(255), nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('fecha', 'clinica_id', 'diagnostico', name='uq_estadistica_diagnostico'),
+        db.Index('ix_estadistica_diagnostico_clinica_fecha', 'clinica_id', 'fecha'),
+    )
+
+    def __repr__(self):
+        return f'<EstadisticaDiagnostico {self.fecha} {self.diagnostico}>'
+
+
+class ConsultaTag(db.Model):
+    """Clasificación de una consulta calculada al guardarla.
+
+    Por cada consulta: una fila con sistema nulo que lleva el diagnóstico
+    normalizado, una fila por sistema detectado (subcategoría nula) y una fila
+    por cada subcategoría detectada.
+    """
+    __tablename__ = 'consulta_tag'
+    id = db.Column(db.Integer, primary_key=True)
+    consulta_id = db.Column(db.Integer, db.ForeignKey('consulta.id'), nullable=False, index=True)
+    clinica_id = db.Column(db.Integer, db.ForeignKey('clinica.id'), nullable=True)  # copia de consulta.clinica_id
+    sistema = db.Column(db.String(50), nullable=True)
+    subcategoria = db.Column(db.String(50), nullable=True)
+    diagnostico_normalizado = db.Column(db.String(255), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_consulta_tag_sistema_subcategoria', 'sistema', 'subcategoria'),
+        db.Index('ix_consulta_tag_clinica_sistema_subcategoria', 'clinica_id', 'sistema', 'subcategoria'),
+    )
+
+    def __repr__(self):
+        return f'<ConsultaTag {self.consulta_id} {self.sistema}/{self.subcategoria}>'
+
+
+class ConsultaTagBackfill(db.Model):
+    """Avance del backfill de etiquetas: todas las consultas con id <= ``hasta_consulta_id`` están clasificadas."""
+    __tablename__ = 'consulta_tag_backfill'
+    id = db.Column(db.Integer, primary_key=True)  # una sola fila (id 1)
+    hasta_consulta_id = db.Column(db.Integer, nullable=False, default=0)
+    fecha = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ConsultaTagBackfill {self.hasta_consulta_id}>'
+
+
+class PdfJob(db.Model):
+    """Trabajo de generación de PDF en segundo plano (lo procesa ``flask pdf-worker``)."""
+    __tablename__ = 'pdf_job'
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 en hexadecimal
+    tipo = db.Column(db.String(20), nullable=False)  # historial, receta, consulta, reportes
+    parametros = db.Column(db.Text, nullable=False)  # JSON con los argumentos del generador
+    alcance = db.Column(db.String(30), nullable=False)  # 'global' o 'clinica:<id>'
+    clave = db.Column(db.String(40), nullable=False)  # hash de (tipo, parámetros, alcance) para deduplicar
+    clave_activa = db.Column(db.String(40))  # = clave mientras está pendiente o en proceso, NULL al terminar
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')  # pendiente, en_proceso, completado, error
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=True)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    nombre_archivo = db.Column(db.String(255))
+    ruta_archivo = db.Column(db.String(500))
+    fecha_creacion = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    fecha_inicio = db.Column(db.DateTime)
+    fecha_fin = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_pdf_job_estado_fecha', 'estado', 'fecha_creacion'),
+        # Único: un solo trabajo activo por clave (los NULL de los terminados no chocan)
+        db.Index('uq_pdf_job_clave_activa', 'clave_activa', unique=True),
+        db.Index('ix_pdf_job_usuario_estado', 'usuario_id', 'estado'),
+    )
+
+    def __repr__(self):
+        return f'<PdfJob {self.id} {self.tipo} {self.estado}>'
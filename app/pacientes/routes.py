@@ -5,6 +5,10 @@ from app.pacientes import bp
 from app.models import Paciente, Consulta, SignosVitales
 from sqlalchemy import func
 from app.pacientes.forms import PacienteForm, SignosVitalesForm, BusquedaPacienteForm
+from app.utils.patient_search import patient_search
+from app.utils.pagination import Keyset, CursorInvalido
+
+PACIENTES_POR_NOMBRE = Keyset(Paciente.nombre_completo, Paciente.id)
 
 @bp.route('/pacientes', methods=['GET', 'POST'])
 @login_required
@@ -13,25 +17,38 @@ def pacientes_lista():
     if current_user.rol in ['pendiente', None]:
         flash('Tu cuenta aún no ha sido aprobada por un administrador.', 'warning')
         return redirect(url_for('auth.espera_aprobacion'))
-    # Vista para el listado de pacientes con búsqueda
+    # Vista para el listado de pacientes con búsqueda, paginado por cursor (nombre, id)
     form = BusquedaPacienteForm()
     
     # Importar la función corregida
     from app.main.routes import filtered_pacientes_query
     
-    if form.validate_on_submit() or request.method == 'POST':
+    if request.method == 'POST':
         termino = (form.termino_busqueda.data or '').strip()
-        # Usar la función corregida que permite ver pacientes recién registrados
-        base_q = filtered_pacientes_query()
-        pacientes = base_q.filter(
-            (Paciente.nombre_completo.ilike(f'%{termino}%')) |
-            (Paciente.id == int(termino) if termino.isdigit() else False)
-        ).order_by(Paciente.nombre_completo).all()
     else:
-        # Usar la función corregida para listado completo
-        pacientes = filtered_pacientes_query().order_by(Paciente.nombre_completo).all()
-    
-    return render_template('pacientes/lista.html', title='Pacientes', pacientes=pacientes, form=form)
+        termino = request.args.get('termino', '').strip()
+        form.termino_busqueda.data = termino
+    # Usar la función corregida que permite ver pacientes recién registrados
+    base_q = filtered_pacientes_query()
+    if termino:
+        base_q = base_q.filter(
+            patient_search.match_clause(termino) |
+            (Paciente.id == int(termino) if termino.isdigit() else False)
+        )
+
+    try:
+        pagina = PACIENTES_POR_NOMBRE.paginate(base_q, request.args.get('cursor'),
+                                               request.args.get('limit', type=int))
+    except CursorInvalido:
+        if request.args.get('format') == 'json':
+            return jsonify({'error': 'Cursor inválido'}), 400
+        flash('El enlace de paginación no es válido; se muestra la primera página.', 'warning')
+        return redirect(url_for('pacientes.pacientes_lista', termino=termino or None))
+
+    if request.args.get('format') == 'json':
+        return jsonify(pagina.to_dict(Paciente.to_dict, clave='pacientes'))
+    return render_template('pacientes/lista.html', title='Pacientes', pacientes=pagina.items,
+                           pagina=pagina, form=form, termino=termino)
 
 @bp.route('/pacientes/nuevo', methods=['GET', 'POST'])
 @login_required
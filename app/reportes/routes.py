@@ -1,53 +1,64 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, Response, stream_with_context, jsonify
 from flask_login import login_required, current_user
 from app import db
 from app.reportes import bp
 from app.models import Paciente, Consulta, SignosVitales, Clinica
+from app.utils.rollups import rollups
+from app.utils.clinical_text import clinical_classifier
+from app.utils import export as exportador
+from app.main.routes import role_required
+from app.utils.db_engine import solo_lectura
+from app.utils.pagination import Keyset, CursorInvalido
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import re
 from collections import Counter
 
-# Definición de sistemas y palabras clave asociadas
-SISTEMAS_CORPORALES = {
-    'Cardiovascular': ['corazón', 'presión', 'arterial', 'circulación', 'palpitaciones', 'taquicardia', 'bradicardia'],
-    'Respiratorio': ['pulmones', 'respiración', 'tos', 'asma', 'bronquitis', 'disnea', 'sibilancias'],
-    'Gastrointestinal': ['estómago', 'intestino', 'digestión', 'dolor abdominal', 'náuseas', 'vómitos', 'diarrea', 'estreñimiento'],
-    'Neurológico': ['cerebro', 'nervios', 'dolor de cabeza', 'mareos', 'vértigo', 'convulsiones', 'migraña'],
-    'Musculoesquelético': ['músculos', 'huesos', 'articulaciones', 'dolor de espalda', 'artritis', 'fractura'],
-    'Endocrino': ['diabetes', 'tiroides', 'hormonas', 'metabolismo'],
-    'Urinario': ['riñones', 'vejiga', 'infección urinaria', 'dolor al orinar'],
-    'Piel y Tegumentos': ['piel', 'dermatitis', 'erupción', 'acné', 'herida', 'quemadura']
-}
-
 def analizar_sistemas(texto):
-    """Analiza un texto y cuenta las menciones de cada sistema corporal."""
-    if not texto:
-        return Counter()
-    
-    # Normalizar texto: minúsculas y sin acentos (simplificado)
-    texto_normalizado = texto.lower()
-    conteo = Counter()
-
-    for sistema, keywords in SISTEMAS_CORPORALES.items():
-        for keyword in keywords:
-            if re.search(r'\b' + re.escape(keyword) + r'\b', texto_normalizado):
-                conteo[sistema] += 1
-    return conteo
+    """Analiza un texto y cuenta los sistemas corporales mencionados (una vez cada uno)."""
+    return Counter(clinical_classifier.sistemas(texto))
 
 @bp.route('/reportes')
 @login_required
 def reportes_index():
     return render_template('reportes/index.html', title='Reportes')
 
+PACIENTES_POR_NOMBRE = Keyset(Paciente.nombre_completo, Paciente.id)
+CONSULTAS_RECIENTES = Keyset(Consulta.fecha_consulta.desc(), Consulta.id.desc())
+
+
+def _consulta_listado(consulta):
+    return {
+        'id': consulta.id,
+        'paciente': consulta.paciente.nombre_completo if consulta.paciente else None,
+        'tipo_consulta': consulta.tipo_consulta,
+        'clinica': consulta.clinica.nombre if consulta.clinica else None,
+        'medico': consulta.medico.nombre_completo if consulta.medico else None,
+        'fecha_consulta': consulta.fecha_consulta.isoformat() if consulta.fecha_consulta else None,
+        'estado': consulta.estado,
+    }
+
+
+def _cursor_invalido(endpoint):
+    if request.args.get('format') == 'json':
+        return jsonify({'error': 'Cursor inválido'}), 400
+    flash('El enlace de paginación no es válido; se muestra la primera página.', 'warning')
+    return redirect(url_for(endpoint))
+
 @bp.route('/reportes/consultas')
 @login_required
+@solo_lectura
 def reporte_consultas():
     # Si es médico, limitar a su clínica; admin/supervisor ven todas
+    q = Consulta.query.options(joinedload(Consulta.paciente), joinedload(Consulta.clinica), joinedload(Consulta.medico))
     if current_user.rol == 'medico' and current_user.clinica_actual_id:
-        consultas = Consulta.query.filter_by(clinica_id=current_user.clinica_actual_id).order_by(Consulta.fecha_consulta.desc()).all()
-    else:
-        consultas = Consulta.query.order_by(Consulta.fecha_consulta.desc()).all()
+        q = q.filter_by(clinica_id=current_user.clinica_actual_id)
+    try:
+        pagina = CONSULTAS_RECIENTES.paginate(q, request.args.get('cursor'), request.args.get('limit', type=int))
+    except CursorInvalido:
+        return _cursor_invalido('reportes.reporte_consultas')
+    if request.args.get('format') == 'json':
+        return jsonify(pagina.to_dict(_consulta_listado, clave='consultas'))
 
     # Conteo del mes actual (sistema ya está en Guatemala)
     now = datetime.now()
@@ -55,40 +66,46 @@ def reporte_consultas():
     next_year = now.year + (1 if now.month == 12 else 0)
     next_month = 1 if now.month == 12 else now.month + 1
     first_next_month = datetime(next_year, next_month, 1)
-    total_mes_query = Consulta.query \
-        .filter(Consulta.fecha_consulta >= first_of_month) \
-        .filter(Consulta.fecha_consulta < first_next_month)
-    if current_user.rol == 'medico' and current_user.clinica_actual_id:
-        total_mes_query = total_mes_query.filter(Consulta.clinica_id == current_user.clinica_actual_id)
-    total_mes_actual = total_mes_query.count()
+    clinica_id = current_user.clinica_actual_id if current_user.rol == 'medico' else None
+    total_mes_actual = rollups.total_consultas(clinica_id, desde=first_of_month, hasta=first_next_month)
 
-    return render_template('reportes/consultas.html', title='Reporte de Consultas', consultas=consultas, total_mes_actual=total_mes_actual)
+    return render_template('reportes/consultas.html', title='Reporte de Consultas', consultas=pagina.items,
+                           pagina=pagina, total_mes_actual=total_mes_actual)
 
 @bp.route('/reportes/pacientes')
 @login_required
+@solo_lectura
 def reporte_pacientes():
     # Médicos: solo pacientes que han tenido consultas en su clínica
+    q = Paciente.query
     if current_user.rol == 'medico' and current_user.clinica_actual_id:
-        pacientes_ids = db.session.query(Consulta.paciente_id).filter(Consulta.clinica_id == current_user.clinica_actual_id).distinct()
-        pacientes = Paciente.query.filter(Paciente.id.in_(pacientes_ids)).order_by(Paciente.nombre_completo).all()
-    else:
-        pacientes = Paciente.query.order_by(Paciente.nombre_completo).all()
-    return render_template('reportes/pacientes.html', title='Reporte de Pacientes', pacientes=pacientes)
+        pacientes_ids = db.session.query(Consulta.paciente_id).filter(Consulta.clinica_id == current_user.clinica_actual_id)
+        q = q.filter(Paciente.id.in_(pacientes_ids))
+    try:
+        pagina = PACIENTES_POR_NOMBRE.paginate(q, request.args.get('cursor'), request.args.get('limit', type=int))
+    except CursorInvalido:
+        return _cursor_invalido('reportes.reporte_pacientes')
+    if request.args.get('format') == 'json':
+        return jsonify(pagina.to_dict(Paciente.to_dict, clave='pacientes'))
+    return render_template('reportes/pacientes.html', title='Reporte de Pacientes', pacientes=pagina.items, pagina=pagina)
 
 @bp.route('/reportes/clinicas')
 @login_required
+@solo_lectura
 def reporte_clinicas():
     # Médicos: solo su clínica; admin/supervisor todas
     if current_user.rol == 'medico' and current_user.clinica_actual_id:
         clinicas = Clinica.query.filter(Clinica.id == current_user.clinica_actual_id).all()
     else:
         clinicas = Clinica.query.all()
+    totales = rollups.consultas_por_clinica()
     for clinica in clinicas:
-        clinica.total_consultas = Consulta.query.filter_by(clinica_id=clinica.id).count()
+        clinica.total_consultas = totales.get(clinica.id, 0)
     return render_template('reportes/clinicas.html', title='Reporte de Clínicas', clinicas=clinicas)
 
 @bp.route('/reportes/diario')
 @login_required
+@solo_lectura
 def reporte_diario():
     hoy = datetime.now().date()
     inicio_dia = datetime.combine(hoy, datetime.min.time())
@@ -106,6 +123,7 @@ def reporte_diario():
 
 @bp.route('/reportes/estadisticas')
 @login_required
+@solo_lectura
 def estadisticas_clinicas():
     # Obtener IDs de pacientes según alcance (médico: su clínica; admin/supervisor: global)
     pacientes_ids_q = db.session.query(Consulta.paciente_id)
@@ -129,28 +147,19 @@ def estadisticas_clinicas():
         for r in rangos
     ]
 
-    # Diagnósticos según alcance
-    diag_q = db.session.query(Consulta.diagnostico)
-    if current_user.rol == 'medico' and current_user.clinica_actual_id:
-        diag_q = diag_q.filter(Consulta.clinica_id == current_user.clinica_actual_id)
-    diagnosticos = diag_q.all()
-    conteo_diagnosticos = {}
-    for diag in diagnosticos:
-        if diag[0]:
-            nombre = diag[0].strip().capitalize()
-            conteo_diagnosticos[nombre] = conteo_diagnosticos.get(nombre, 0) + 1
-    enfermedades_comunes = sorted(conteo_diagnosticos.items(), key=lambda x: x[1], reverse=True)[:10]
-    enfermedades_labels = [e[0] for e in enfermedades_comunes]
+    # Diagnósticos según alcance (rollup diario)
+    clinica_id = current_user.clinica_actual_id if current_user.rol == 'medico' else None
+    enfermedades_comunes = rollups.diagnosticos_frecuentes(clinica_id, limite=10)
+    enfermedades_labels = [e[0].capitalize() for e in enfermedades_comunes]
     enfermedades_casos = [e[1] for e in enfermedades_comunes]
 
     # Revisión por sistemas según alcance
-    rev_q = Consulta.query.filter(Consulta.revision_sistemas.isnot(None))
+    rev_q = db.session.query(Consulta.revision_sistemas).filter(Consulta.revision_sistemas.isnot(None))
     if current_user.rol == 'medico' and current_user.clinica_actual_id:
         rev_q = rev_q.filter(Consulta.clinica_id == current_user.clinica_actual_id)
-    consultas_con_revision = rev_q.all()
     conteo_total_sistemas = Counter()
-    for consulta in consultas_con_revision:
-        conteo_total_sistemas.update(analizar_sistemas(consulta.revision_sistemas))
+    for (revision_sistemas,) in rev_q.yield_per(1000):
+        conteo_total_sistemas.update(analizar_sistemas(revision_sistemas))
 
     # Preparar datos para el gráfico
     sistemas_labels = list(conteo_total_sistemas.keys())
@@ -162,12 +171,7 @@ def estadisticas_clinicas():
     next_year = now.year + (1 if now.month == 12 else 0)
     next_month = 1 if now.month == 12 else now.month + 1
     first_next_month = datetime(next_year, next_month, 1)
-    total_mes_q = Consulta.query \
-        .filter(Consulta.fecha_consulta >= first_of_month) \
-        .filter(Consulta.fecha_consulta < first_next_month)
-    if current_user.rol == 'medico' and current_user.clinica_actual_id:
-        total_mes_q = total_mes_q.filter(Consulta.clinica_id == current_user.clinica_actual_id)
-    total_mes_actual = total_mes_q.count()
+    total_mes_actual = rollups.total_consultas(clinica_id, desde=first_of_month, hasta=first_next_month)
 
     return render_template('reportes/estadisticas.html',
         title='Estadísticas Clínicas',
@@ -181,3 +185,28 @@ def estadisticas_clinicas():
         sistemas_casos=sistemas_casos,
         total_mes_actual=total_mes_actual
     )
+
+
+@bp.route('/export/<any(consultas, pacientes):entidad>.<any(csv, ndjson):formato>')
+@login_required
+@role_required('medico', 'admin')
+@solo_lectura
+def exportar(entidad, formato):
+    """Exportación completa en streaming, filtrable por ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD&clinica_id="""
+    try:
+        desde, hasta = exportador.parse_rango(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Formato de fecha inválido (use YYYY-MM-DD)'}), 400
+
+    # Médicos: siempre su clínica; admin/supervisor pueden filtrar por cualquiera
+    if current_user.rol == 'medico' and current_user.clinica_actual_id:
+        clinica_id = current_user.clinica_actual_id
+    else:
+        clinica_id = request.args.get('clinica_id', type=int)
+
+    nombre = f"{entidad}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    return Response(
+        stream_with_context(exportador.generar(entidad, formato, desde, hasta, clinica_id)),
+        mimetype=exportador.FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename="{nombre}"'}
+    )
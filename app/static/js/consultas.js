@@ -7,6 +7,31 @@ let currentTab = 'datos-generales';
 let revisionSistemasData = {};
 let sistemaSeleccionado = null;
 
+// Historial paginado: la lista solo pide los campos que muestra; el resto de
+// una consulta se trae al expandirla (ver fetchConsultaCompleta)
+const HISTORIAL_CAMPOS_LISTA = 'tipo_consulta,estado,medico,motivo_consulta,diagnostico,tratamiento,signos_vitales';
+const HISTORIAL_PAGINA = 20;
+
+async function fetchHistorialPagina(pacienteId, cursor) {
+    const params = new URLSearchParams({ limit: String(HISTORIAL_PAGINA), fields: HISTORIAL_CAMPOS_LISTA });
+    if (cursor) params.set('cursor', cursor);
+    const resp = await fetch(`/api/pacientes/${pacienteId}/historial?${params.toString()}`, { headers: { 'Accept': 'application/json' } });
+    if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+    return resp.json();
+}
+
+// Completa (en el mismo objeto) todos los campos de una consulta del historial
+async function fetchConsultaCompleta(pacienteId, consulta) {
+    if (!consulta || consulta._completa || !consulta.id) return consulta;
+    const resp = await fetch(`/api/pacientes/${pacienteId}/historial?id=${consulta.id}`, { headers: { 'Accept': 'application/json' } });
+    if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+    const page = await resp.json();
+    if (page.historial && page.historial.length) {
+        Object.assign(consulta, page.historial[0], { _completa: true });
+    }
+    return consulta;
+}
+
 
 document.addEventListener('DOMContentLoaded', function () {
     console.log('🚀 DOM Content Loaded - Inicializando consultas.js');
@@ -141,9 +166,9 @@ document.addEventListener('DOMContentLoaded', function () {
                     </div>
                     <i class="fas fa-user-check text-primary"></i>
                 `;
-                item.addEventListener('click', () => {
+                item.addEventListener('click', async () => {
                     console.log('🖱️ Clic detectado en paciente:', patient.nombre_completo);
-                    selectPatient(patient);
+                    selectPatient(await loadPatientDetails(patient));
                 });
                 searchResultsDiv.appendChild(item);
             });
@@ -154,6 +179,45 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    // El autocompletado solo trae un resumen; al seleccionar se cargan los datos
+    // generales y la primera página del historial (las demás con "Ver más")
+    async function loadPatientDetails(patient) {
+        const detalle = { ...patient, historial_consultas: [], historial_next_cursor: null };
+        try {
+            const infoResp = await fetch(`/api/get_patient_info/${patient.id}`, { headers: { 'Accept': 'application/json' } });
+            if (infoResp.ok) {
+                Object.assign(detalle, await infoResp.json());
+            }
+            const page = await fetchHistorialPagina(patient.id, null);
+            detalle.historial_consultas = page.historial || [];
+            detalle.historial_next_cursor = page.next_cursor || null;
+            detalle.historial_total = page.total;
+        } catch (error) {
+            console.error('Error cargando detalle del paciente:', error);
+        }
+        detalle.total_consultas = detalle.historial_total ?? (detalle.historial_consultas.length || patient.total_consultas || 0);
+        return detalle;
+    }
+
+    // Siguiente página del historial del paciente actual
+    let cargandoHistorial = false;
+    window.loadMoreHistorial = async function() {
+        const patient = window.currentPatient;
+        if (!patient || !patient.historial_next_cursor || cargandoHistorial) return;
+        cargandoHistorial = true;
+        try {
+            const page = await fetchHistorialPagina(patient.id, patient.historial_next_cursor);
+            if (window.currentPatient !== patient) return;  // se cambió de paciente mientras tanto
+            patient.historial_consultas.push(...(page.historial || []));
+            patient.historial_next_cursor = page.next_cursor || null;
+            updateMedicalHistory(patient);
+        } catch (error) {
+            console.error('Error cargando más historial:', error);
+        } finally {
+            cargandoHistorial = false;
+        }
+    };
+
     // Function to select a patient and update panel
     function selectPatient(patient) {
         console.log('🎯 selectPatient - Paciente seleccionado:', patient);
@@ -313,12 +377,13 @@ document.addEventListener('DOMContentLoaded', function () {
         }
         
         const historial = patient.historial_consultas || [];
+        const total = Math.max(patient.historial_total || 0, historial.length);
         
         // Actualizar contador y mostrar/ocultar botón PDF
         const btnDescargarPDF = document.getElementById('btn-descargar-pdf');
         if (historialTotalEl) {
-            historialTotalEl.textContent = historial.length > 0 ? 
-                `${historial.length} consulta${historial.length > 1 ? 's' : ''} previa${historial.length > 1 ? 's' : ''}` : 
+            historialTotalEl.textContent = total > 0 ? 
+                `${total} consulta${total > 1 ? 's' : ''} previa${total > 1 ? 's' : ''}` : 
                 'No hay consultas previas';
         }
         
@@ -379,13 +444,6 @@ document.addEventListener('DOMContentLoaded', function () {
                         </div>
                     ` : ''}
                     
-                    ${consulta.historia_enfermedad ? `
-                        <div class="mb-2">
-                            <strong class="small text-warning">Historia de la enfermedad:</strong>
-                            <p class="small mb-0">${consulta.historia_enfermedad}</p>
-                        </div>
-                    ` : ''}
-                    
                     <!-- Signos vitales de esta consulta -->
                     ${consulta.signos_vitales || consulta.presion_arterial ? `
                         <div class="mt-2 pt-2 border-top">
@@ -414,6 +472,16 @@ document.addEventListener('DOMContentLoaded', function () {
             `;
         });
         
+        if (patient.historial_next_cursor) {
+            historialHTML += `
+                <div class="p-3 text-center">
+                    <button class="btn btn-sm btn-outline-primary" onclick="loadMoreHistorial()">
+                        <i class="fas fa-chevron-down me-1"></i> Ver más (${historial.length} de ${total})
+                    </button>
+                </div>
+            `;
+        }
+        
         historialContainer.innerHTML = historialHTML;
         console.log(`✅ Historial médico actualizado con ${historial.length} consulta(s)`);
     }
@@ -422,7 +490,7 @@ document.addEventListener('DOMContentLoaded', function () {
     window.updateMedicalHistory = updateMedicalHistory;
 
     // Función global para mostrar detalles completos de una consulta
-    window.showConsultaDetails = function(consultaId, fecha) {
+    window.showConsultaDetails = async function(consultaId, fecha) {
         console.log(`🔍 Mostrando detalles de consulta ID: ${consultaId}`);
         
         // Buscar la consulta en el historial del paciente actual
@@ -436,6 +504,12 @@ document.addEventListener('DOMContentLoaded', function () {
             console.error('❌ Consulta no encontrada');
             return;
         }
+        // La lista solo trae un resumen: los demás campos se piden al abrir el detalle
+        try {
+            await fetchConsultaCompleta(window.currentPatient.id, consulta);
+        } catch (error) {
+            console.error('❌ Error cargando la consulta completa:', error);
+        }
         
         // Crear modal con detalles completos
         const modalHTML = `
@@ -989,13 +1063,8 @@ window.descargarHistorialPDF = function() {
     const pdfUrl = `/descargar_historial_pdf/${window.currentPatient.id}`;
     console.log(`📥 Descargando PDF desde: ${pdfUrl}`);
     
-    // Crear enlace temporal y hacer clic para descargar
-    const link = document.createElement('a');
-    link.href = pdfUrl;
-    link.download = `historial_medico_${window.currentPatient.nombre_completo.replace(/\s+/g, '_')}.pdf`;
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
+    // Descargar (vía la cola de PDF si está activa)
+    window.descargarPdf(pdfUrl);
     
     console.log('✅ Descarga iniciada');
 };
@@ -1396,9 +1465,14 @@ function findOrCreateConsultaForPatient(patient) {
         }
         console.log("Consulta en progreso encontrada:", consultaActiva);
         enableAutoSaveForConsulta(consultaActiva);
-        loadPatientDataInTabs(consultaActiva);
-        // Refrescar panel de signos desde la consulta activa si trae datos
-        updateVitalsPanelFromConsulta(consultaActiva);
+        // Las pestañas necesitan todos los campos, no solo el resumen de la lista
+        fetchConsultaCompleta(patient.id, consultaActiva)
+            .catch(error => console.error('❌ Error cargando la consulta en progreso:', error))
+            .then(() => {
+                loadPatientDataInTabs(consultaActiva);
+                // Refrescar panel de signos desde la consulta activa si trae datos
+                updateVitalsPanelFromConsulta(consultaActiva);
+            });
         return;
     }
 
@@ -1969,7 +2043,7 @@ async function imprimirReceta() {
             // Pequeña pausa para asegurar que el guardado se procese
             setTimeout(() => {
                 const url = `/generar_receta_pdf/${consultaActual.id}`;
-                window.open(url, '_blank');
+                window.descargarPdf(url);
             }, 500);
         } else {
             alert('No se pudo guardar la receta antes de generar el PDF. Revise los datos y la conexión.');
@@ -2071,5 +2145,5 @@ function getCSRFToken() {
 window.descargarConsultaPDF = function(consultaId) {
     if (!consultaId) return;
     const url = `/generar_consulta_pdf/${consultaId}`;
-    window.open(url, '_blank');
+    window.descargarPdf(url);
 };
@@ -0,0 +1,57 @@
+// Descarga de PDF a través de la cola de trabajos (PDF_JOBS_ASYNC).
+// Si la cola está desactivada, o el trabajo no arranca a tiempo (no hay worker),
+// se usa la ruta síncrona de siempre.
+(function() {
+    const INTERVALO_MS = 1000;
+    const ESPERA_INICIO_MS = 30000;
+
+    function colaActiva() {
+        const meta = document.querySelector('meta[name="pdf-jobs-async"]');
+        return meta && meta.getAttribute('content') === 'true';
+    }
+
+    function urlAsync(url) {
+        return url + (url.indexOf('?') === -1 ? '?' : '&') + 'async=1';
+    }
+
+    function esperar(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function descargarPdf(url, onEstado) {
+        if (!colaActiva()) {
+            window.location.href = url;
+            return;
+        }
+        try {
+            let respuesta = await fetch(urlAsync(url), { headers: { 'Accept': 'application/json' } });
+            let datos = await respuesta.json();
+            if (!respuesta.ok || !datos.success) {
+                alert(datos.error || 'No se pudo solicitar el PDF.');
+                return;
+            }
+            const inicio = Date.now();
+            while (datos.estado === 'pendiente' || datos.estado === 'en_proceso') {
+                if (onEstado) onEstado(datos);
+                if (datos.estado === 'pendiente' && Date.now() - inicio > ESPERA_INICIO_MS) {
+                    // Ningún worker tomó el trabajo: generar en la petición
+                    window.location.href = url;
+                    return;
+                }
+                await esperar(INTERVALO_MS);
+                respuesta = await fetch(datos.estado_url, { headers: { 'Accept': 'application/json' } });
+                datos = await respuesta.json();
+            }
+            if (datos.estado === 'completado') {
+                window.location.href = datos.descarga_url;
+            } else {
+                alert('Error al generar el PDF: ' + (datos.error || 'desconocido'));
+            }
+        } catch (error) {
+            console.error('Error en la cola de PDF:', error);
+            window.location.href = url;
+        }
+    }
+
+    window.descargarPdf = descargarPdf;
+})();
@@ -35,7 +35,7 @@ document.addEventListener('DOMContentLoaded', function() {
     async function cargarEstadisticasGenerales() {
         console.log('📊 Cargando estadísticas generales...');
         try {
-            const response = await fetch(`/api/reportes/estadisticas_generales?_t=${Date.now()}`);
+            const response = await fetch('/api/reportes/estadisticas_generales', { cache: 'no-cache' });
             if (!response.ok) {
                 throw new Error(`Error en la respuesta de la API: ${response.statusText}`);
             }
@@ -262,7 +262,7 @@ document.addEventListener('DOMContentLoaded', function() {
     async function cargarEnfermedadesComunes() {
         console.log('🦠 Cargando enfermedades comunes...');
         
-        const response = await fetch(`/api/reportes/enfermedades_comunes?_t=${Date.now()}`);
+        const response = await fetch('/api/reportes/enfermedades_comunes', { cache: 'no-cache' });
         const result = await response.json();
         
         if (result.success) {
@@ -316,7 +316,7 @@ document.addEventListener('DOMContentLoaded', function() {
     async function cargarProblemasPorSistemas() {
         console.log('🏥 Cargando problemas por sistemas...');
         
-        const response = await fetch(`/api/reportes/problemas_por_sistemas?_t=${Date.now()}`);
+        const response = await fetch('/api/reportes/problemas_por_sistemas', { cache: 'no-cache' });
         const result = await response.json();
         
         if (result.success) {
@@ -416,7 +416,7 @@ document.addEventListener('DOMContentLoaded', function() {
         console.log(`🔍 Mostrando detalle del sistema: ${sistema}`);
         
         try {
-            const response = await fetch(`/api/reportes/sistema_detalle/${encodeURIComponent(sistema)}`);
+            const response = await fetch(`/api/reportes/sistema_detalle/${encodeURIComponent(sistema)}`, { cache: 'no-cache' });
             const result = await response.json();
             
             if (result.success) {
@@ -2,6 +2,7 @@ import os
 import shutil
 import sqlite3
 import tarfile
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -109,7 +110,14 @@ def run_backup(include_tar: bool = True, upload_drive: bool = False) -> dict:
         'local_path': '',
         'drive_file_id': ''
     }
-    path = create_sqlite_backup(include_tar=include_tar)
+    from app.utils.metrics import metrics
+    inicio = time.perf_counter()
+    try:
+        path = create_sqlite_backup(include_tar=include_tar)
+    except Exception:
+        metrics.registrar_backup(time.perf_counter() - inicio, ok=False)
+        raise
+    metrics.registrar_backup(time.perf_counter() - inicio, path.stat().st_size)
     result['local_path'] = str(path)
     if upload_drive:
         drive_id = upload_to_google_drive(path)
@@ -0,0 +1,220 @@
+"""
+Gráficos de los reportes (PNG o SVG) sin el estado global de pyplot.
+
+Cada gráfico se dibuja sobre una ``matplotlib.figure.Figure`` propia con su
+``FigureCanvasAgg``: no hay figura "actual" compartida, así que varios hilos del
+servidor pueden generar gráficos a la vez.
+
+Los gráficos se registran con ``@charts.grafico('tipo', datos=...)``, separando
+la consulta a la BD (``datos(clinica_id)``) del dibujo (``dibujar(fig, datos)``).
+El resultado se memoriza por (tipo, clínica, versión de datos, formato,
+miniatura). La versión es la de la caché de reportes, que cambia con cada flush
+que toca consultas o pacientes: mientras los datos no cambien, el gráfico no se
+vuelve a consultar ni a dibujar.
+
+``miniatura=True`` genera una versión de baja resolución para el panel.
+
+``render_varios`` genera varios gráficos en dos fases: los datos se consultan
+primero en el proceso web (o los pasa quien llama, ya consultados en una sola
+pasada) y el dibujo se reparte en un pool de procesos (``CHART_POOL_WORKERS``),
+porque la rasterización de matplotlib retiene el GIL y no escala con hilos.
+"""
+import io
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.utils.lazy import MODULOS_GRAFICOS, ModuloDiferido, precargar
+
+logger = logging.getLogger(__name__)
+
+# matplotlib se importa al dibujar el primer gráfico, no al crear la app
+_figure = ModuloDiferido('matplotlib.figure')
+_backend_agg = ModuloDiferido('matplotlib.backends.backend_agg')
+
+FORMATOS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+DPI = 100  # igual que el valor por defecto de pyplot.savefig
+DPI_MINIATURA = 40
+
+Grafico = namedtuple('Grafico', 'datos dibujar figsize')
+
+
+def _dibujar(dibujar, figsize, datos, formato, dpi):
+    """Dibuja en una figura nueva y devuelve los bytes. Se ejecuta también en los procesos del pool."""
+    fig = _figure.Figure(figsize=figsize, dpi=DPI)
+    _backend_agg.FigureCanvasAgg(fig)
+    dibujar(fig, datos)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=formato, dpi=dpi)
+    return buffer.getvalue()
+
+
+class ChartService:
+    def __init__(self):
+        self._graficos = {}
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()
+        self._pool = None
+        self.max_entradas = 128
+        self.procesos = 0
+        self.contexto = 'spawn'
+        self.metricas = {'hits': 0, 'misses': 0}
+
+    def init_app(self, app):
+        self.max_entradas = app.config.get('CHART_CACHE_MAX_ENTRIES', 128)
+        self.procesos = app.config.get('CHART_POOL_WORKERS', 0)
+        self.contexto = app.config.get('CHART_POOL_CONTEXT', 'spawn')
+
+    # ----- Registro -----
+    def grafico(self, tipo, datos, figsize=(6.4, 4.8)):
+        """Decorador: registra ``dibujar(fig, datos)`` y la función que obtiene sus datos."""
+        def decorator(f):
+            self._graficos[tipo] = Grafico(datos, f, figsize)
+            return f
+        return decorator
+
+    @property
+    def tipos(self):
+        return sorted(self._graficos)
+
+    # ----- Dibujo -----
+    def dibujar(self, tipo, datos, formato='png', miniatura=False):
+        """Bytes del gráfico ``tipo`` dibujado con ``datos`` (sin consultar la BD)."""
+        grafico = self._graficos[tipo]
+        return _dibujar(grafico.dibujar, grafico.figsize, datos, formato, DPI_MINIATURA if miniatura else DPI)
+
+    def _obtener_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.procesos,
+                                                 mp_context=multiprocessing.get_context(self.contexto),
+                                                 initializer=precargar, initargs=MODULOS_GRAFICOS)
+            return self._pool
+
+    def cerrar_pool(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def dibujar_varios(self, datos_por_tipo, formato='png', miniatura=False):
+        """{tipo: bytes} dibujando en paralelo en el pool de procesos (si está habilitado)."""
+        tipos = list(datos_por_tipo)
+        if self.procesos <= 1 or len(tipos) <= 1:
+            return {tipo: self.dibujar(tipo, datos_por_tipo[tipo], formato, miniatura) for tipo in tipos}
+        dpi = DPI_MINIATURA if miniatura else DPI
+        try:
+            pool = self._obtener_pool()
+            futuros = {
+                tipo: pool.submit(_dibujar, self._graficos[tipo].dibujar, self._graficos[tipo].figsize,
+                                  datos_por_tipo[tipo], formato, dpi)
+                for tipo in tipos
+            }
+            return {tipo: futuro.result() for tipo, futuro in futuros.items()}
+        except BrokenProcessPool:
+            # Los procesos del pool no arrancan o murieron: se dibuja aquí y no se
+            # vuelve a intentar en este proceso (evita relanzar el pool en cada petición)
+            logger.warning('Gráficos: el pool de procesos falló; se dibujará en el proceso web.')
+            with self._lock:
+                self._pool = None
+                self.procesos = 0
+            return {tipo: self.dibujar(tipo, datos_por_tipo[tipo], formato, miniatura) for tipo in tipos}
+
+    @staticmethod
+    def version_datos():
+        from app.utils.report_cache import report_cache
+        backend = report_cache.backend()
+        return backend.version() if backend is not None else None
+
+    def render(self, tipo, clinica_id=None, formato='png', miniatura=False):
+        """Bytes del gráfico para el alcance ``clinica_id`` (None si no hay datos)."""
+        if tipo not in self._graficos:
+            raise KeyError(tipo)
+        if formato not in FORMATOS:
+            raise ValueError(f'Formato no soportado: {formato}')
+        # La versión se lee antes de consultar: si los datos cambian mientras se
+        # dibuja, el resultado queda guardado bajo la versión vieja y no se reutiliza
+        version = self.version_datos()
+        clave = (tipo, clinica_id or None, version, formato, bool(miniatura))
+        with self._lock:
+            if clave in self._memo:
+                self._memo.move_to_end(clave)
+                self.metricas['hits'] += 1
+                return self._memo[clave]
+            self.metricas['misses'] += 1
+
+        datos = self._graficos[tipo].datos(clinica_id)
+        contenido = self.dibujar(tipo, datos, formato, miniatura) if datos else None
+        self._memorizar(clave, contenido)
+        return contenido
+
+    def render_varios(self, tipos, clinica_id=None, datos=None, version=None, formato='png', miniatura=False):
+        """{tipo: bytes o None} para varios gráficos del mismo alcance.
+
+        Si se pasan ``datos`` ({tipo: datos}) ya consultados, ``version`` debe ser
+        la leída con ``version_datos()`` antes de consultarlos; sin ella el
+        resultado no se memoriza. Los tipos que falten en ``datos`` se consultan aquí.
+        """
+        for tipo in tipos:
+            if tipo not in self._graficos:
+                raise KeyError(tipo)
+        if datos is None:
+            datos = {}
+            version = self.version_datos()
+        resultado = {}
+        pendientes = []
+        with self._lock:
+            for tipo in tipos:
+                clave = (tipo, clinica_id or None, version, formato, bool(miniatura))
+                if version is not None and clave in self._memo:
+                    self._memo.move_to_end(clave)
+                    self.metricas['hits'] += 1
+                    resultado[tipo] = self._memo[clave]
+                else:
+                    self.metricas['misses'] += 1
+                    pendientes.append(tipo)
+        if not pendientes:
+            return resultado
+
+        # Fase 1: datos (en este proceso, con la sesión de la petición)
+        datos_pendientes = {}
+        for tipo in pendientes:
+            datos_tipo = datos[tipo] if tipo in datos else self._graficos[tipo].datos(clinica_id)
+            if datos_tipo:
+                datos_pendientes[tipo] = datos_tipo
+            else:
+                resultado[tipo] = None
+        # Fase 2: dibujo en paralelo
+        resultado.update(self.dibujar_varios(datos_pendientes, formato, miniatura))
+        for tipo in pendientes:
+            self._memorizar((tipo, clinica_id or None, version, formato, bool(miniatura)), resultado[tipo])
+        return resultado
+
+    def _memorizar(self, clave, contenido):
+        if clave[2] is None or self.max_entradas <= 0:
+            return
+        with self._lock:
+            self._memo[clave] = contenido
+            self._memo.move_to_end(clave)
+            while len(self._memo) > self.max_entradas:
+                self._memo.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._memo.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self.metricas)
+            datos['entradas'] = len(self._memo)
+            datos['bytes'] = sum(len(v) for v in self._memo.values() if v)
+        return datos
+
+
+charts = ChartService()
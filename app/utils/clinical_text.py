@@ -0,0 +1,131 @@
+"""
+Clasificación de texto clínico por sistemas corporales.
+
+Una sola taxonomía (``TAXONOMIA``) para el dashboard, el detalle por sistema, los
+gráficos del PDF y el reporte de estadísticas. Todas las palabras clave se
+compilan en una única expresión regular, así que cada texto se recorre una sola
+vez sin importar cuántos sistemas o palabras haya.
+
+- Sin distinción de mayúsculas ni acentos ("Neumonia" == "neumonía").
+- Coincidencia por palabra completa, con plural opcional ("ojo"/"ojos",
+  "dolor"/"dolores"), de modo que "tos" no coincide con "tostada".
+- Ante frases que se solapan gana la más larga: "dolor de cabeza" cuenta como
+  Neurológico y no además como el "dolor" genérico.
+"""
+import re
+from collections import defaultdict
+
+from app.utils.patient_search import normalizar_texto
+
+GENERAL = None  # palabras del sistema sin subcategoría específica
+
+# sistema -> subcategoría (o GENERAL) -> palabras clave
+TAXONOMIA = {
+    'Respiratorio': {
+        'resfriado común': ['resfriado', 'tos', 'gripe'],
+        'bronquitis': ['bronquitis'],
+        'asma': ['asma'],
+        'neumonía': ['neumonía'],
+        'sinusitis': ['sinusitis'],
+        GENERAL: ['congestion', 'respiratorio', 'pulmones', 'respiración', 'disnea', 'sibilancias'],
+    },
+    'Cardiovascular': {
+        'hipertensión': ['hipertensión', 'presión alta'],
+        'arritmia': ['arritmia', 'palpitaciones', 'taquicardia', 'bradicardia'],
+        GENERAL: ['corazón', 'presión', 'arterial', 'cardiaco', 'cardiovascular', 'circulación'],
+    },
+    'Neurológico': {
+        'cefalea': ['dolor de cabeza', 'cefalea'],
+        'migraña': ['migraña'],
+        'mareos': ['mareo', 'vértigo'],
+        GENERAL: ['neurológico', 'convulsiones', 'cerebro', 'nervios'],
+    },
+    'Musculo Esquelético': {
+        'dolor lumbar': ['lumbar', 'espalda baja', 'dolor de espalda'],
+        'artritis': ['artritis'],
+        'dolor articular': ['articulaciones'],
+        'dolor muscular': ['músculo', 'muscular'],
+        GENERAL: ['dolor', 'espalda', 'hueso', 'fractura'],
+    },
+    'Gastrointestinal': {
+        'gastritis': ['gastritis'],
+        'diarrea': ['diarrea'],
+        'estreñimiento': ['estreñimiento'],
+        GENERAL: ['estómago', 'digestivo', 'intestinal', 'intestino', 'digestión', 'dolor abdominal',
+                  'náuseas', 'vómitos'],
+    },
+    'Genitourinario': {
+        GENERAL: ['urinario', 'riñón', 'vejiga', 'genital', 'infección urinaria', 'disuria', 'polaquiuria',
+                  'dolor al orinar'],
+    },
+    'Endocrino': {
+        GENERAL: ['diabetes', 'tiroides', 'hormonal', 'hormonas', 'endocrino', 'glucosa', 'metabolismo'],
+    },
+    'Dermatológico': {
+        GENERAL: ['piel', 'dermatitis', 'rash', 'alergia', 'eccema', 'erupción', 'acné', 'herida', 'quemadura'],
+    },
+    'Oftalmológico': {
+        GENERAL: ['ojo', 'visión', 'oftalmológico', 'conjuntivitis'],
+    },
+    'Otorrinolaringológico': {
+        GENERAL: ['oído', 'garganta', 'nariz', 'otitis', 'sinusitis'],
+    },
+    'Ginecológico': {
+        GENERAL: ['ginecológico', 'menstrual', 'embarazo', 'pélvico'],
+    },
+    'Pediátrico': {
+        GENERAL: ['niño', 'infantil', 'pediátrico', 'desarrollo'],
+    },
+}
+
+SISTEMAS = list(TAXONOMIA)
+
+
+def subcategorias(sistema):
+    """Subcategorías con nombre de un sistema (lista vacía si no tiene)."""
+    return [sub for sub in TAXONOMIA.get(sistema, {}) if sub is not GENERAL]
+
+
+class ClinicalTextClassifier:
+    """Clasificador compilado a partir de una taxonomía sistema -> subcategoría -> palabras."""
+
+    def __init__(self, taxonomia):
+        # palabra normalizada -> [(sistema, subcategoría)]
+        self._destinos = defaultdict(list)
+        for sistema, subcats in taxonomia.items():
+            for subcategoria, palabras in subcats.items():
+                for palabra in palabras:
+                    self._destinos[normalizar_texto(palabra)].append((sistema, subcategoria))
+        # Las más largas primero para que la alternancia prefiera la frase completa
+        alternativas = sorted(self._destinos, key=len, reverse=True)
+        self._patron = re.compile(
+            r'\b(' + '|'.join(re.escape(p) for p in alternativas) + r')(?:es|s)?\b'
+        )
+
+    def clasificar(self, *textos):
+        """{sistema: {subcategorías}} encontradas en los textos (una pasada).
+
+        Un sistema detectado solo por palabras generales tiene un conjunto vacío.
+        """
+        texto = normalizar_texto(' '.join(t for t in textos if t))
+        resultado = defaultdict(set)
+        if not texto:
+            return resultado
+        for coincidencia in self._patron.finditer(texto):
+            for sistema, subcategoria in self._destinos[coincidencia.group(1)]:
+                subs = resultado[sistema]
+                if subcategoria is not GENERAL:
+                    subs.add(subcategoria)
+        return resultado
+
+    def sistemas(self, *textos):
+        """Conjunto de sistemas mencionados en los textos."""
+        return set(self.clasificar(*textos))
+
+
+clinical_classifier = ClinicalTextClassifier(TAXONOMIA)
+
+
+def clasificar_consulta(diagnostico, motivo_consulta):
+    """Clasificación canónica de una consulta: diagnóstico + motivo de consulta."""
+    return clinical_classifier.clasificar(diagnostico, motivo_consulta)
@@ -0,0 +1,223 @@
+"""
+Etiquetas de clasificación por consulta (tabla ``consulta_tag``).
+
+Se calculan al guardar la consulta (eventos de SQLAlchemy cuando cambian el
+diagnóstico, el motivo de consulta o la clínica; esto cubre
+``guardar_diagnostico_completo``, ``guardar_motivo_consulta`` y
+``guardar_consulta_completa``), de modo que los reportes por sistema son
+consultas agregadas sobre la tabla en lugar de recorrer el texto libre.
+
+Las consultas anteriores a la tabla (o cargadas sin pasar por el ORM) se
+clasifican con ``flask backfill-tags`` o con el trabajo en segundo plano que se
+lanza desde los reportes. ``consulta_tag_backfill`` guarda hasta qué id de
+consulta llegó el backfill; los reportes lo lanzan desde ahí si encuentran por
+encima una consulta clasificable sin etiquetas (aunque la tabla ya tenga las de
+consultas nuevas guardadas por el ORM).
+"""
+import logging
+import threading
+import weakref
+from datetime import datetime
+
+from sqlalchemy import event, inspect, select, insert, delete, func, case, exists
+from sqlalchemy.dialects import mysql, sqlite
+
+from app import db
+from app.models import Consulta, ConsultaTag, ConsultaTagBackfill
+from app.utils.clinical_text import clasificar_consulta
+from app.utils.rollups import normalizar_diagnostico
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_CLASIFICADOS = ('diagnostico', 'motivo_consulta', 'clinica_id')
+
+
+def filas_tags(consulta_id, clinica_id, diagnostico, motivo_consulta):
+    """Filas de ``consulta_tag`` para una consulta."""
+    diagnostico_normalizado = normalizar_diagnostico(diagnostico)
+    base = {'consulta_id': consulta_id, 'clinica_id': clinica_id,
+            'diagnostico_normalizado': diagnostico_normalizado}
+    filas = []
+    if diagnostico_normalizado:
+        filas.append(dict(base, sistema=None, subcategoria=None))
+    for sistema, subcategorias in clasificar_consulta(diagnostico, motivo_consulta).items():
+        filas.append(dict(base, sistema=sistema, subcategoria=None))
+        filas.extend(dict(base, sistema=sistema, subcategoria=sub) for sub in sorted(subcategorias))
+    return filas
+
+
+def sincronizar(connection, consulta_id, clinica_id, diagnostico, motivo_consulta, nueva=False):
+    t = ConsultaTag.__table__
+    if not nueva:
+        connection.execute(delete(t).where(t.c.consulta_id == consulta_id))
+    filas = filas_tags(consulta_id, clinica_id, diagnostico, motivo_consulta)
+    if filas:
+        connection.execute(insert(t), filas)
+
+
+# ----- Consultas agregadas para los reportes -----
+def conteo_por_sistema(clinica_id=None):
+    """{sistema: consultas}; cada consulta cuenta una vez por sistema."""
+    tag_backfill.asegurar()
+    q = db.session.query(ConsultaTag.sistema, func.count(ConsultaTag.id)) \
+        .filter(ConsultaTag.sistema.isnot(None), ConsultaTag.subcategoria.is_(None))
+    if clinica_id:
+        q = q.filter(ConsultaTag.clinica_id == clinica_id)
+    return dict(q.group_by(ConsultaTag.sistema).all())
+
+
+def conteo_por_subcategoria(sistema, clinica_id=None):
+    """{subcategoría: consultas} dentro de un sistema."""
+    tag_backfill.asegurar()
+    q = db.session.query(ConsultaTag.subcategoria, func.count(ConsultaTag.id)) \
+        .filter(ConsultaTag.sistema == sistema, ConsultaTag.subcategoria.isnot(None))
+    if clinica_id:
+        q = q.filter(ConsultaTag.clinica_id == clinica_id)
+    return dict(q.group_by(ConsultaTag.subcategoria).all())
+
+
+def _clasificable():
+    return (Consulta.diagnostico.isnot(None)) | (Consulta.motivo_consulta.isnot(None))
+
+
+def leer_avance(connection):
+    """Id de consulta hasta el que llegó el backfill (0 si nunca corrió)."""
+    return connection.execute(
+        select(ConsultaTagBackfill.hasta_consulta_id).where(ConsultaTagBackfill.id == 1)
+    ).scalar() or 0
+
+
+def guardar_avance(connection, hasta_id):
+    """Sube la marca de avance a ``hasta_id`` (nunca la baja) en una sola sentencia."""
+    t = ConsultaTagBackfill.__table__
+    fila = {'id': 1, 'hasta_consulta_id': hasta_id, 'fecha': datetime.utcnow()}
+    dialecto = connection.dialect.name
+    if dialecto == 'sqlite':
+        sentencia = sqlite.insert(t).values(**fila)
+        nuevo = sentencia.excluded
+        sentencia = sentencia.on_conflict_do_update(index_elements=['id'], set_={
+            'hasta_consulta_id': case((nuevo.hasta_consulta_id > t.c.hasta_consulta_id, nuevo.hasta_consulta_id),
+                                      else_=t.c.hasta_consulta_id),
+            'fecha': nuevo.fecha,
+        })
+    elif dialecto == 'mysql':
+        sentencia = mysql.insert(t).values(**fila)
+        sentencia = sentencia.on_duplicate_key_update(
+            hasta_consulta_id=func.greatest(t.c.hasta_consulta_id, sentencia.inserted.hasta_consulta_id),
+            fecha=sentencia.inserted.fecha,
+        )
+    else:
+        if connection.execute(select(t.c.id).where(t.c.id == 1)).first() is None:
+            connection.execute(insert(t).values(**fila))
+            return
+        connection.execute(t.update().where(t.c.id == 1, t.c.hasta_consulta_id < hasta_id)
+                           .values(hasta_consulta_id=hasta_id, fecha=fila['fecha']))
+        return
+    connection.execute(sentencia)
+
+
+class TagBackfill:
+    """Clasifica por lotes las consultas existentes (idempotente: re-etiqueta cada lote)."""
+
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._verificados = weakref.WeakSet()  # motores ya revisados
+        self.estado = {'en_progreso': False, 'procesadas': 0, 'ultimo_id': 0,
+                       'inicio': None, 'fin': None, 'error': None}
+
+    def ejecutar(self, batch_size=None, desde_id=0, progreso=None) -> int:
+        """Recorre ``consulta`` por id en lotes; cada lote en su propia transacción.
+
+        Si empieza en la marca de avance o antes, cada lote la sube hasta su último id.
+        """
+        from app.utils.report_cache import report_cache
+        batch_size = batch_size or self.BATCH_SIZE
+        t = ConsultaTag.__table__
+        with db.engine.connect() as conn:
+            continuo = desde_id <= leer_avance(conn)
+        ultimo_id = desde_id
+        procesadas = 0
+        self.estado.update(en_progreso=True, procesadas=0, ultimo_id=desde_id,
+                           inicio=datetime.now().isoformat(), fin=None, error=None)
+        try:
+            while True:
+                with db.engine.begin() as conn:
+                    lote = conn.execute(
+                        select(Consulta.id, Consulta.clinica_id, Consulta.diagnostico, Consulta.motivo_consulta)
+                        .where(Consulta.id > ultimo_id).order_by(Consulta.id).limit(batch_size)
+                    ).all()
+                    if not lote:
+                        break
+                    conn.execute(delete(t).where(t.c.consulta_id.in_([fila[0] for fila in lote])))
+                    filas = [tag for fila in lote for tag in filas_tags(*fila)]
+                    if filas:
+                        conn.execute(insert(t), filas)
+                    if continuo:
+                        guardar_avance(conn, lote[-1][0])
+                ultimo_id = lote[-1][0]
+                procesadas += len(lote)
+                self.estado.update(procesadas=procesadas, ultimo_id=ultimo_id)
+                report_cache.invalidar()
+                if progreso:
+                    progreso(procesadas, ultimo_id)
+        except Exception as e:
+            self.estado['error'] = str(e)
+            raise
+        finally:
+            self.estado.update(en_progreso=False, fin=datetime.now().isoformat())
+        return procesadas
+
+    def iniciar(self, app, batch_size=None, desde_id=0) -> bool:
+        """Lanza el backfill en un hilo de fondo. False si ya hay uno en curso."""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return False
+
+            def _trabajo():
+                with app.app_context():
+                    try:
+                        self.ejecutar(batch_size, desde_id=desde_id)
+                    except Exception:
+                        logger.exception('Error en backfill de etiquetas')
+
+            self._hilo = threading.Thread(target=_trabajo, name='consulta-tag-backfill', daemon=True)
+            self._hilo.start()
+            return True
+
+    def asegurar(self):
+        """Inicia el backfill desde la marca de avance si por encima de ella hay
+        consultas clasificables sin etiquetas (una vez por motor y proceso)."""
+        if db.engine in self._verificados:
+            return
+        from flask import current_app
+        avance = leer_avance(db.session.connection())
+        sin_etiquetar = db.session.query(Consulta.id).filter(
+            Consulta.id > avance, _clasificable(),
+            ~exists().where(ConsultaTag.consulta_id == Consulta.id)
+        ).limit(1).first() is not None
+        if sin_etiquetar:
+            self.iniciar(current_app._get_current_object(), desde_id=avance)
+        self._verificados.add(db.engine)
+
+
+tag_backfill = TagBackfill()
+
+
+@event.listens_for(Consulta, 'after_insert')
+def _etiquetar_consulta_nueva(mapper, connection, target):
+    sincronizar(connection, target.id, target.clinica_id, target.diagnostico, target.motivo_consulta, nueva=True)
+
+
+@event.listens_for(Consulta, 'after_update')
+def _etiquetar_consulta_actualizada(mapper, connection, target):
+    estado = inspect(target)
+    if any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_CLASIFICADOS):
+        sincronizar(connection, target.id, target.clinica_id, target.diagnostico, target.motivo_consulta)
+
+
+@event.listens_for(Consulta, 'before_delete')
+def _desetiquetar_consulta(mapper, connection, target):
+    connection.execute(delete(ConsultaTag.__table__).where(ConsultaTag.consulta_id == target.id))
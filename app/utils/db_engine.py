@@ -0,0 +1,157 @@
+"""
+Opciones del engine de SQLAlchemy según la base de datos configurada.
+
+MySQL (``mysql+pymysql`` / ``mysql+mysqlconnector``): pool de conexiones
+configurable por entorno (``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW``,
+``DB_POOL_RECYCLE``, ``DB_POOL_PRE_PING``). Las conexiones se reciclan antes
+del ``wait_timeout`` del servidor y se verifican al tomarlas del pool, para no
+usar una conexión que MySQL ya cerró.
+
+SQLite: cada conexión nueva recibe, en el evento ``connect`` del engine,
+``journal_mode=WAL`` (las lecturas no bloquean al escritor), ``busy_timeout``
+(esperar el lock de escritura en lugar de fallar con "database is locked"),
+``synchronous=NORMAL`` (seguro con WAL y sin un fsync por cada commit),
+``cache_size`` y ``mmap_size`` (páginas en memoria y lectura mapeada del archivo).
+
+Con ``SQLITE_READ_POOL`` se agrega un segundo engine (bind ``lectura``) sobre el
+mismo archivo, con ``query_only=ON`` y su propio pool. Las vistas marcadas con
+``@solo_lectura`` (reportes y búsquedas) hacen sus SELECT por ese pool; los
+flush, UPDATE y DELETE siguen yendo al engine principal. Así una lectura
+analítica larga no ocupa las conexiones de las vistas que escriben.
+
+En todos los motores ``hide_parameters`` evita que los mensajes de error de
+SQLAlchemy (y por tanto los logs) incluyan los parámetros de las sentencias, que
+llevan datos de pacientes.
+
+Los valores definidos en ``SQLALCHEMY_ENGINE_OPTIONS`` tienen prioridad.
+"""
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+BIND_LECTURA = 'lectura'
+
+JOURNAL_MODES = {'', 'WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF'}
+SYNCHRONOUS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def _sqlite_en_memoria(url):
+    return url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'
+
+
+def opciones_engine(config):
+    """Opciones para ``create_engine`` según ``SQLALCHEMY_DATABASE_URI`` y las variables ``DB_*``."""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        if _sqlite_en_memoria(url):
+            # Flask-SQLAlchemy usa StaticPool: una sola conexión compartida
+            return {'hide_parameters': True}
+        return {
+            'hide_parameters': True,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+        }
+    return {
+        'hide_parameters': True,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def usa_pool_lectura(config):
+    """True si ``SQLITE_READ_POOL`` está activo y la base es un archivo SQLite."""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    return bool(config.get('SQLITE_READ_POOL')) and url.get_backend_name() == 'sqlite' \
+        and not _sqlite_en_memoria(url)
+
+
+def configurar_sqlite(engine, config, solo_lectura=False):
+    """Registra los PRAGMA de ``SQLITE_*`` en cada conexión nueva del engine (solo SQLite)."""
+    if engine.dialect.name != 'sqlite':
+        return
+    journal_mode = config['SQLITE_JOURNAL_MODE'].upper()
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f'SQLITE_JOURNAL_MODE no válido: {journal_mode}')
+    if synchronous not in SYNCHRONOUS:
+        raise ValueError(f'SQLITE_SYNCHRONOUS no válido: {synchronous}')
+    busy_timeout = int(config['SQLITE_BUSY_TIMEOUT'])
+    cache_size = int(config['SQLITE_CACHE_SIZE'])
+    mmap_size = int(config['SQLITE_MMAP_SIZE'])
+    # WAL no aplica a bases en memoria (SQLite respondería "memory")
+    if _sqlite_en_memoria(engine.url):
+        journal_mode = ''
+
+    @event.listens_for(engine, 'connect')
+    def _pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if journal_mode:
+                cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+            cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+            cursor.execute(f'PRAGMA cache_size={cache_size}')
+            cursor.execute(f'PRAGMA mmap_size={mmap_size}')
+            if solo_lectura:
+                cursor.execute('PRAGMA query_only=ON')
+        finally:
+            cursor.close()
+
+
+def aplicar_opciones(app):
+    """Completa ``SQLALCHEMY_ENGINE_OPTIONS``; se llama antes de ``db.init_app``."""
+    opciones = opciones_engine(app.config)
+    opciones.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones
+    if usa_pool_lectura(app.config):
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(BIND_LECTURA, {
+            'url': app.config['SQLALCHEMY_DATABASE_URI'],
+            'hide_parameters': True,
+            'pool_size': app.config['SQLITE_READ_POOL_SIZE'],
+            'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        })
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def configurar_engines(app, db):
+    """PRAGMA de SQLite en el engine principal y en el de solo lectura; se llama después de ``db.init_app``."""
+    with app.app_context():
+        for clave, engine in db.engines.items():
+            configurar_sqlite(engine, app.config, solo_lectura=clave == BIND_LECTURA)
+
+
+# ----- Enrutado de lecturas -----
+
+def _lectura_activa():
+    return has_app_context() and g.get('db_lectura', False)
+
+
+class SesionClinica(Session):
+    """``db.session`` que manda los SELECT de las vistas ``@solo_lectura`` al bind ``lectura``."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) and _lectura_activa():
+            engine = self._db.engines.get(BIND_LECTURA)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def solo_lectura(f):
+    """Decorador: las consultas de la vista usan el pool de solo lectura (si está habilitado).
+
+    La marca vive en ``g`` hasta el final de la petición, así que también cubre
+    las respuestas generadas en streaming (exportaciones).
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_lectura = True
+        return f(*args, **kwargs)
+    return decorated_function
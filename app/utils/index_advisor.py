@@ -0,0 +1,104 @@
+"""
+Asesor de índices: ejecuta EXPLAIN (MySQL) o EXPLAIN QUERY PLAN (SQLite) sobre
+las consultas más frecuentes de la aplicación y marca los recorridos completos
+de tabla (full scans) y los ordenamientos sin índice.
+
+Uso: ``flask db-index-report``
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, and_
+
+from app import db
+from app.models import Consulta, SignosVitales, CodigoVerificacion
+
+
+def hot_queries():
+    """Consultas representativas de las rutas con más tráfico (parámetros de ejemplo)."""
+    hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    inicio_mes = hoy.replace(day=1)
+    return [
+        ('historial_paciente',
+         select(Consulta.id).where(Consulta.paciente_id == 1)
+         .order_by(Consulta.fecha_consulta.desc())),
+        ('consultas_por_clinica',
+         select(Consulta.id).where(Consulta.clinica_id == 1)
+         .order_by(Consulta.fecha_consulta.desc())),
+        ('reporte_diario',
+         select(Consulta.id).where(
+             Consulta.clinica_id == 1,
+             Consulta.fecha_consulta >= hoy,
+             Consulta.fecha_consulta < hoy + timedelta(days=1))
+         .order_by(Consulta.fecha_consulta)),
+        ('consultas_por_mes',
+         select(func.count(Consulta.id)).where(
+             Consulta.clinica_id == 1,
+             Consulta.fecha_consulta >= inicio_mes,
+             Consulta.fecha_consulta < inicio_mes + timedelta(days=31))),
+        ('consultas_por_mes_global',
+         select(func.count(Consulta.id)).where(
+             Consulta.fecha_consulta >= inicio_mes,
+             Consulta.fecha_consulta < inicio_mes + timedelta(days=31))),
+        ('consulta_en_progreso',
+         select(Consulta.id).where(Consulta.paciente_id == 1, Consulta.estado == 'en_progreso')
+         .order_by(Consulta.fecha_consulta.desc())),
+        ('pacientes_por_clinica',
+         select(Consulta.paciente_id).where(Consulta.clinica_id == 1).distinct()),
+        ('signos_vitales_por_consulta',
+         select(SignosVitales.id).join(Consulta, Consulta.id == SignosVitales.consulta_id)
+         .where(Consulta.paciente_id == 1)
+         .order_by(SignosVitales.fecha_registro.desc())),
+        ('signos_vitales_iniciales',
+         select(SignosVitales.id).where(SignosVitales.paciente_id == 1, SignosVitales.consulta_id.is_(None))
+         .order_by(SignosVitales.fecha_registro.desc())),
+        ('codigo_verificacion_activo',
+         select(CodigoVerificacion.id).where(and_(
+             CodigoVerificacion.usuario_id == 1,
+             CodigoVerificacion.tipo == 'password_change',
+             CodigoVerificacion.usado.is_(False)))),
+    ]
+
+
+def _explain_sqlite(conn, sql):
+    filas = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+    plan = [f[-1] for f in filas]
+    problemas = []
+    for paso in plan:
+        if paso.startswith('SCAN ') and 'USING' not in paso and 'VIRTUAL TABLE' not in paso:
+            problemas.append(f'full scan: {paso}')
+        elif 'USE TEMP B-TREE' in paso:
+            problemas.append(f'ordenamiento sin índice: {paso}')
+    return plan, problemas
+
+
+def _explain_mysql(conn, sql):
+    resultado = conn.exec_driver_sql(f'EXPLAIN {sql}')
+    columnas = list(resultado.keys())
+    plan, problemas = [], []
+    for fila in resultado.fetchall():
+        datos = dict(zip(columnas, fila))
+        plan.append(f"{datos.get('table')}: type={datos.get('type')} key={datos.get('key')} extra={datos.get('Extra')}")
+        if datos.get('type') == 'ALL':
+            problemas.append(f"full scan en {datos.get('table')}")
+        if 'filesort' in (datos.get('Extra') or ''):
+            problemas.append(f"ordenamiento sin índice en {datos.get('table')}")
+    return plan, problemas
+
+
+def index_report():
+    """Devuelve una lista de dicts: nombre, sql, plan y problemas detectados."""
+    with db.engine.connect() as conn:
+        dialecto = conn.dialect.name
+        if dialecto == 'sqlite':
+            explain = _explain_sqlite
+        elif dialecto == 'mysql':
+            explain = _explain_mysql
+        else:
+            raise RuntimeError(f'Motor no soportado por el asesor de índices: {dialecto}')
+
+        reporte = []
+        for nombre, stmt in hot_queries():
+            sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+            plan, problemas = explain(conn, sql)
+            reporte.append({'nombre': nombre, 'sql': sql, 'plan': plan, 'problemas': problemas})
+        return reporte
@@ -0,0 +1,58 @@
+"""
+Carga diferida de librerías pesadas (ReportLab, matplotlib).
+
+Importar ``reportlab.platypus`` y ``matplotlib`` cuesta varios cientos de
+milisegundos por proceso, y la mayoría de los procesos (recepción, consultas)
+nunca genera un PDF ni un gráfico. Los módulos que los usan los importan en las
+funciones que dibujan o a través de ``ModuloDiferido``; aquí se resuelve si
+están instalados sin importarlos.
+
+``REPORTLAB_AVAILABLE`` mantiene el significado de siempre: True si ReportLab
+está instalado y se pueden generar PDF.
+"""
+import importlib
+import importlib.util
+
+# Módulos que conviene cargar de antemano en procesos que solo generan PDF o gráficos
+MODULOS_PDF = ('reportlab.platypus', 'app.utils.pdf_document')
+MODULOS_GRAFICOS = ('matplotlib.figure', 'matplotlib.backends.backend_agg')
+
+
+def disponible(nombre):
+    """True si el paquete ``nombre`` está instalado (no lo importa)."""
+    try:
+        return importlib.util.find_spec(nombre) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+REPORTLAB_AVAILABLE = disponible('reportlab')
+MATPLOTLIB_AVAILABLE = disponible('matplotlib')
+
+
+class ModuloDiferido:
+    """Referencia a un módulo que se importa en el primer acceso a un atributo."""
+
+    def __init__(self, nombre):
+        self._nombre = nombre
+        self._modulo = None
+
+    def _cargar(self):
+        if self._modulo is None:
+            # import_module usa el lock de importación: seguro entre hilos
+            self._modulo = importlib.import_module(self._nombre)
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._cargar(), atributo)
+
+    def __repr__(self):
+        estado = 'cargado' if self._modulo is not None else 'sin cargar'
+        return f'<ModuloDiferido {self._nombre} ({estado})>'
+
+
+def precargar(*nombres):
+    """Importa ahora los módulos indicados (los que no estén instalados se omiten)."""
+    for nombre in nombres:
+        if disponible(nombre.split('.')[0]):
+            importlib.import_module(nombre)
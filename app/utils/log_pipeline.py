@@ -0,0 +1,199 @@
+"""
+Registro (logging) estructurado de la aplicación.
+
+Todos los loggers de la aplicación cuelgan de ``app`` (``current_app.logger`` y
+``logging.getLogger(__name__)`` en los módulos del paquete). El logger ``app``
+solo tiene un ``QueueHandler``: el hilo de la petición deja el registro en una
+cola y un ``QueueListener`` en segundo plano lo formatea y lo escribe en
+``LOG_FILE`` (archivo rotativo) o en stderr. Así una escritura lenta no bloquea
+los hilos del servidor WSGI.
+
+- ``LOG_LEVEL``: nivel por defecto del logger ``app`` (``INFO``). Los
+  ``logger.debug(...)`` desactivados solo cuestan la comprobación de nivel.
+- ``LOG_LEVELS``: niveles por módulo, ``"app.main.routes=DEBUG,sqlalchemy.engine=INFO"``.
+- ``LOG_FORMAT``: ``json`` (una línea JSON por registro) o ``text``.
+- ``LOG_REDACT_FIELDS``: campos ``extra=`` que se reemplazan por ``[redactado]``
+  (nombres, DPI, teléfono...). Además se enmascaran correos y números de DPI
+  (13 dígitos) dentro del mensaje, de la traza de la excepción y de la pila.
+
+El filtro de redacción corre en el hilo que registra, antes de encolar, de modo
+que los datos de pacientes nunca llegan a la cola ni al archivo.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import re
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+from flask import g, has_request_context, request
+
+REDACTADO = '[redactado]'
+CAMPOS_PHI = ('nombre', 'nombre_completo', 'dni', 'dpi', 'direccion', 'telefono', 'email',
+              'correo', 'fecha_nacimiento', 'diagnostico', 'motivo_consulta')
+_CORREO = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_DPI = re.compile(r'\b\d{4}\s?\d{5}\s?\d{4}\b')
+
+# Atributos propios de LogRecord: lo demás llegó por ``extra=``
+_ATRIBUTOS_RECORD = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def campos_extra(record):
+    return {k: v for k, v in vars(record).items() if k not in _ATRIBUTOS_RECORD}
+
+
+def enmascarar(texto):
+    return _DPI.sub(REDACTADO, _CORREO.sub(REDACTADO, texto))
+
+
+class RedactorPHI(logging.Filter):
+    """Oculta campos con datos de pacientes y enmascara correos/DPI en el mensaje y la traza."""
+
+    def __init__(self, campos=CAMPOS_PHI):
+        super().__init__()
+        self.campos = frozenset(campos)
+
+    def filter(self, record):
+        for campo in self.campos.intersection(vars(record)):
+            setattr(record, campo, REDACTADO)
+        record.msg = enmascarar(record.getMessage())
+        record.args = None
+        # El texto de la excepción (p. ej. parámetros de un error SQL) se formatea
+        # aquí para enmascararlo; los formateadores usan exc_text si no hay exc_info
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.exc_text:
+            record.exc_text = enmascarar(record.exc_text)
+        if record.stack_info:
+            record.stack_info = enmascarar(record.stack_info)
+        return True
+
+
+class ContextoPeticion(logging.Filter):
+    """Agrega método, ruta (sin query string) y usuario cuando hay una petición en curso."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.metodo = request.method
+            record.ruta = request.path
+            # Solo si Flask-Login ya cargó al usuario: registrar no debe consultar la BD
+            usuario = getattr(g.get('_login_user'), 'id', None)
+            if usuario is not None:
+                record.usuario_id = usuario
+        return True
+
+
+class ManejadorCola(QueueHandler):
+    """QueueHandler que conserva la traza de la excepción aparte del mensaje."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        datos = {
+            'fecha': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        datos.update(campos_extra(record))
+        if record.exc_info:
+            datos['excepcion'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        texto = super().format(record)
+        extra = campos_extra(record)
+        if extra:
+            texto += ' ' + ' '.join(f'{k}={v}' for k, v in extra.items())
+        return texto
+
+
+def parsear_niveles(texto):
+    """``"a=DEBUG, b.c=warning"`` -> ``{'a': 'DEBUG', 'b.c': 'WARNING'}``"""
+    niveles = {}
+    for parte in (texto or '').split(','):
+        nombre, _, nivel = parte.partition('=')
+        if nombre.strip() and nivel.strip():
+            niveles[nombre.strip()] = nivel.strip().upper()
+    return niveles
+
+
+class LogPipeline:
+    def __init__(self):
+        self._listeners = {}
+        atexit.register(self.detener)
+
+    def init_app(self, app):
+        from flask.logging import default_handler
+        logger = logging.getLogger('app')
+        logger.removeHandler(default_handler)
+
+        if app.config.get('LOG_FORMAT', 'json') == 'text':
+            formato = FormatoTexto()
+        else:
+            formato = FormatoJSON()
+        ruta = app.config.get('LOG_FILE')
+        if ruta:
+            Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+            destino = RotatingFileHandler(ruta, maxBytes=app.config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+                                          backupCount=app.config.get('LOG_BACKUPS', 5), encoding='utf-8')
+        else:
+            destino = logging.StreamHandler(sys.stderr)
+        destino.setFormatter(formato)
+
+        campos = app.config.get('LOG_REDACT_FIELDS') or CAMPOS_PHI
+        self.conectar(logger, destino, filtros=[ContextoPeticion(), RedactorPHI(campos)])
+        logger.setLevel(app.config.get('LOG_LEVEL', 'INFO').upper())
+        for nombre, nivel in parsear_niveles(app.config.get('LOG_LEVELS')).items():
+            logging.getLogger(nombre).setLevel(nivel)
+
+    def conectar(self, logger, *destinos, filtros=()):
+        """Deja en ``logger`` un único QueueHandler y escribe en ``destinos`` desde un hilo aparte.
+
+        Llamarlo de nuevo con el mismo logger (otra ``create_app``) reemplaza los destinos.
+        """
+        anterior = self._listeners.pop(logger.name, None)
+        if anterior is not None:
+            listener, handler = anterior
+            listener.stop()
+            logger.removeHandler(handler)
+            for destino in listener.handlers:
+                destino.close()
+        cola = queue.SimpleQueue()
+        handler = ManejadorCola(cola)
+        for filtro in filtros:
+            handler.addFilter(filtro)
+        listener = QueueListener(cola, *destinos, respect_handler_level=True)
+        listener.start()
+        logger.addHandler(handler)
+        self._listeners[logger.name] = (listener, handler)
+
+    def detener(self):
+        """Vacía las colas y detiene los hilos escritores (al salir del proceso)."""
+        for listener, _handler in list(self._listeners.values()):
+            listener.stop()
+        self._listeners.clear()
+
+
+log_pipeline = LogPipeline()
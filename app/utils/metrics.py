@@ -0,0 +1,473 @@
+"""
+Métricas de la aplicación en formato de texto de Prometheus (``GET /metrics``).
+
+- ``clinica_http_request_duration_seconds`` (histograma por endpoint y método) y
+  ``clinica_http_requests_total`` (por endpoint, método y código).
+- ``clinica_http_request_queries`` (histograma de sentencias SQL por petición),
+  ``clinica_db_queries_total`` y ``clinica_db_query_seconds_total`` (por engine).
+- ``clinica_db_pool_*``: conexiones del pool de SQLAlchemy (tamaño, en uso,
+  libres, overflow), leídas en el momento del scrape.
+- Contadores del dominio: consultas creadas y finalizadas, pacientes
+  registrados, PDF generados con su tiempo de dibujo y respaldos con duración y
+  tamaño. Del respaldo más reciente en ``BACKUP_DIR`` se publican además la
+  fecha y el tamaño, así cuenta también el que se hizo con ``flask backup-db``.
+
+Cada hilo acumula en su propio diccionario sin tomar locks; el scrape suma los
+de los hilos vivos más la base donde se volcaron los de los hilos terminados
+(``flask run`` crea un hilo por petición).
+
+Con varios procesos sirviendo (``multiproceso``: gunicorn o ``WSGI_MULTIPROCESS``)
+cada proceso escribe sus totales en ``METRICS_DIR/<pid>-<id>.json`` cada
+``METRICS_FLUSH_SECONDS`` segundos y al salir, y el scrape suma su propio valor
+en vivo con los archivos de los demás: cualquier worker que atienda ``/metrics``
+devuelve el total. Los archivos de procesos terminados se siguen sumando para
+que los contadores no retrocedan; ``flask serve`` vacía el directorio al
+arrancar. Los medidores del pool de conexiones son los del proceso que responde.
+
+El acceso se limita a ``METRICS_ALLOWED_IPS`` (por defecto solo la máquina local)
+o a quien envíe ``Authorization: Bearer <METRICS_TOKEN>``. Con
+``METRICS_ENABLED=false`` no se registra ninguna ruta ni evento.
+"""
+import atexit
+import bisect
+import hmac
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from functools import wraps
+from pathlib import Path
+
+from flask import Response, abort, current_app, request
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from app.models import Consulta, Paciente
+from app.utils.wsgi_server import multiproceso
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_PETICION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BUCKETS_PDF = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_BACKUP = (1, 5, 15, 30, 60, 300, 900)
+ESTADO_FINALIZADA = 'completada'
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=''):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metrica:
+    tipo = 'untyped'
+
+    def __init__(self, registro, nombre, ayuda, etiquetas=()):
+        self.registro = registro
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        registro.metricas.append(self)
+
+    def cabecera(self):
+        return [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def inc(self, *valores, n=1):
+        datos = self.registro.fragmento()
+        clave = (self, valores)
+        datos[clave] = datos.get(clave, 0) + n
+
+    def exponer(self, sumados):
+        lineas = self.cabecera()
+        if not self.etiquetas and self not in sumados:
+            lineas.append(f'{self.nombre} 0')
+        for valores, total in sorted(sumados.get(self, {}).items()):
+            lineas.append(f'{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(total)}')
+        return lineas
+
+
+class Histograma(Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, registro, nombre, ayuda, etiquetas=(), buckets=BUCKETS_PETICION):
+        super().__init__(registro, nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor, *valores):
+        datos = self.registro.fragmento()
+        clave = (self, valores)
+        celdas = datos.get(clave)
+        if celdas is None:
+            # Un conteo por bucket (no acumulado), el de +Inf y la suma
+            celdas = datos[clave] = [0] * (len(self.buckets) + 1) + [0.0]
+        celdas[bisect.bisect_left(self.buckets, valor)] += 1
+        celdas[-1] += valor
+
+    def exponer(self, sumados):
+        lineas = self.cabecera()
+        for valores, celdas in sorted(sumados.get(self, {}).items()):
+            acumulado = 0
+            for limite, n in zip(self.buckets + (float('inf'),), celdas):
+                acumulado += n
+                le = f'le="{_numero(limite)}"'
+                lineas.append(f'{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {_numero(celdas[-1])}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acumulado}')
+        return lineas
+
+
+class Medidor(Metrica):
+    """Valor instantáneo calculado en el scrape: ``funcion() -> [(valores_etiquetas, valor), ...]``."""
+    tipo = 'gauge'
+
+    def __init__(self, registro, nombre, ayuda, etiquetas=(), funcion=None):
+        super().__init__(registro, nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def exponer(self, _sumados):
+        lineas = self.cabecera()
+        for valores, valor in self.funcion():
+            lineas.append(f'{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(valor)}')
+        return lineas
+
+
+def _sumar_valor(destino, clave, valor):
+    """Suma un contador (número) o las celdas de un histograma (lista) en ``destino[clave]``."""
+    if isinstance(valor, list):
+        previo = destino.get(clave)
+        destino[clave] = list(valor) if previo is None else [a + b for a, b in zip(previo, valor)]
+    else:
+        destino[clave] = destino.get(clave, 0) + valor
+
+
+class _Fragmento:
+    """Valores de un hilo. Cuando el hilo termina se vuelcan en la base del registro."""
+    __slots__ = ('datos', '__weakref__')
+
+    def __init__(self):
+        self.datos = {}
+
+
+class Registro:
+    """Métricas con un diccionario de valores por hilo (sin locks al registrar)."""
+
+    def __init__(self):
+        self.metricas = []
+        self._local = threading.local()
+        self._base = {}  # (metrica, valores) -> valor de los hilos ya terminados
+        self._fragmentos = {}
+        # Reentrante: el volcado de un hilo terminado puede correr (por el GC) con el lock tomado
+        self._lock = threading.RLock()
+
+    def fragmento(self):
+        try:
+            return self._local.fragmento.datos
+        except AttributeError:
+            fragmento = self._local.fragmento = _Fragmento()
+            with self._lock:
+                self._fragmentos[id(fragmento.datos)] = fragmento.datos
+            # threading.local suelta el fragmento al terminar el hilo
+            weakref.finalize(fragmento, self._volcar, fragmento.datos).atexit = False
+            return fragmento.datos
+
+    def _volcar(self, datos):
+        with self._lock:
+            self._fragmentos.pop(id(datos), None)
+            for clave, valor in datos.items():
+                _sumar_valor(self._base, clave, valor)
+
+    def sumar(self):
+        sumados = {}
+        with self._lock:
+            for datos in itertools.chain((self._base,), list(self._fragmentos.values())):
+                for (metrica, valores), valor in list(datos.items()):
+                    _sumar_valor(sumados.setdefault(metrica, {}), valores, valor)
+        return sumados
+
+    def exponer(self, sumados=None):
+        if sumados is None:
+            sumados = self.sumar()
+        lineas = []
+        for metrica in self.metricas:
+            lineas.extend(metrica.exponer(sumados))
+        return '\n'.join(lineas) + '\n'
+
+
+class AlmacenProcesos:
+    """Totales de cada proceso en ``directorio/<pid>-<id>.json``, para sumarlos en el scrape."""
+
+    def __init__(self, registro, directorio, intervalo=5):
+        self.registro = registro
+        self.directorio = Path(directorio)
+        self.intervalo = intervalo
+        self._pid = None
+        self._archivo = None
+        self._lock = threading.Lock()
+        atexit.register(self._al_salir)
+
+    def arrancar(self):
+        """Inicia (una vez por proceso, también tras un fork) el hilo que escribe el archivo."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.directorio.mkdir(parents=True, exist_ok=True)
+            self._archivo = self.directorio / f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+            self._pid = os.getpid()
+            threading.Thread(target=self._escribir_periodicamente, name='metrics-almacen', daemon=True).start()
+
+    def _escribir_periodicamente(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.escribir()
+            except OSError:
+                logger.exception('No se pudieron guardar las métricas del proceso')
+
+    def _al_salir(self):
+        if self._pid == os.getpid():
+            self.escribir()
+
+    def escribir(self):
+        datos = {metrica.nombre: [[list(valores), valor] for valores, valor in por_etiquetas.items()]
+                 for metrica, por_etiquetas in self.registro.sumar().items()}
+        temporal = self._archivo.with_suffix('.tmp')
+        temporal.write_text(json.dumps(datos), encoding='utf-8')
+        os.replace(temporal, self._archivo)
+
+    def sumar(self):
+        """Valores en vivo de este proceso más los archivos de los demás."""
+        sumados = self.registro.sumar()
+        por_nombre = {metrica.nombre: metrica for metrica in self.registro.metricas}
+        for ruta in self.directorio.glob('*.json'):
+            if ruta == self._archivo:
+                continue
+            try:
+                datos = json.loads(ruta.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue  # reemplazado o borrado mientras se leía
+            for nombre, filas in datos.items():
+                metrica = por_nombre.get(nombre)
+                if metrica is None:
+                    continue
+                por_etiquetas = sumados.setdefault(metrica, {})
+                for valores, valor in filas:
+                    _sumar_valor(por_etiquetas, tuple(valores), valor)
+        return sumados
+
+
+class Metrics:
+    def __init__(self):
+        self.registro = r = Registro()
+        self.peticiones = Contador(r, 'clinica_http_requests_total', 'Peticiones HTTP atendidas.',
+                                   ('endpoint', 'method', 'status'))
+        self.duracion = Histograma(r, 'clinica_http_request_duration_seconds', 'Duración de las peticiones HTTP.',
+                                   ('endpoint', 'method'), BUCKETS_PETICION)
+        self.consultas_peticion = Histograma(r, 'clinica_http_request_queries', 'Sentencias SQL por petición HTTP.',
+                                             ('endpoint',), BUCKETS_CONSULTAS)
+        self.sql = Contador(r, 'clinica_db_queries_total', 'Sentencias SQL ejecutadas.', ('engine',))
+        self.sql_segundos = Contador(r, 'clinica_db_query_seconds_total', 'Tiempo total en sentencias SQL.',
+                                     ('engine',))
+        Medidor(r, 'clinica_db_pool_size', 'Tamaño configurado del pool de conexiones.', ('engine',),
+                lambda: self._pool('size'))
+        Medidor(r, 'clinica_db_pool_checked_out', 'Conexiones del pool en uso.', ('engine',),
+                lambda: self._pool('checkedout'))
+        Medidor(r, 'clinica_db_pool_checked_in', 'Conexiones libres en el pool.', ('engine',),
+                lambda: self._pool('checkedin'))
+        # QueuePool.overflow() es negativo mientras quedan conexiones por abrir dentro de pool_size
+        Medidor(r, 'clinica_db_pool_overflow', 'Conexiones abiertas por encima de pool_size.', ('engine',),
+                lambda: [(bind, max(0, valor)) for bind, valor in self._pool('overflow')])
+        self.consultas_creadas = Contador(r, 'clinica_consultas_creadas_total', 'Consultas creadas.')
+        self.consultas_finalizadas = Contador(r, 'clinica_consultas_finalizadas_total', 'Consultas finalizadas.')
+        self.pacientes_registrados = Contador(r, 'clinica_pacientes_registrados_total', 'Pacientes registrados.')
+        self.pdf_generados = Contador(r, 'clinica_pdf_generados_total', 'PDF dibujados (sin contar la caché).',
+                                      ('tipo', 'resultado'))
+        self.pdf_segundos = Histograma(r, 'clinica_pdf_render_seconds', 'Tiempo de dibujo de los PDF.',
+                                       ('tipo',), BUCKETS_PDF)
+        self.backups = Contador(r, 'clinica_backups_total', 'Respaldos ejecutados en este proceso.', ('resultado',))
+        self.backup_segundos = Histograma(r, 'clinica_backup_duration_seconds', 'Duración de los respaldos.',
+                                          (), BUCKETS_BACKUP)
+        self.backup_bytes = Contador(r, 'clinica_backup_bytes_total', 'Bytes escritos por los respaldos.')
+        Medidor(r, 'clinica_backup_ultimo_timestamp_seconds', 'Fecha del respaldo más reciente en BACKUP_DIR.',
+                (), lambda: self._ultimo_backup('fecha'))
+        Medidor(r, 'clinica_backup_ultimo_bytes', 'Tamaño del respaldo más reciente en BACKUP_DIR.',
+                (), lambda: self._ultimo_backup('bytes'))
+        self._app = None
+        self.almacen = None
+
+    def init_app(self, app, db):
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        self._app = app
+        self._db = db
+        if multiproceso(app.config):
+            self.almacen = AlmacenProcesos(self.registro, app.config['METRICS_DIR'],
+                                           app.config.get('METRICS_FLUSH_SECONDS', 5))
+        with app.app_context():
+            for bind, engine in db.engines.items():
+                nombre = bind or 'default'
+                event.listen(engine, 'before_cursor_execute', self._antes_de_ejecutar)
+                event.listen(engine, 'after_cursor_execute',
+                             lambda *args, _nombre=nombre: self._despues_de_ejecutar(_nombre, *args))
+        app.before_request(self._iniciar)
+        app.after_request(self._finalizar)
+        app.teardown_request(self._cerrar)
+        app.add_url_rule('/metrics', 'metrics', self.vista)
+
+    # ----- Peticiones HTTP -----
+    def _iniciar(self):
+        if self.almacen is not None:
+            self.almacen.arrancar()
+        local = self.registro._local
+        local.inicio = time.perf_counter()
+        local.consultas = 0
+
+    def _registrar(self, status):
+        local = self.registro._local
+        inicio = getattr(local, 'inicio', None)
+        if inicio is None:
+            return
+        local.inicio = None
+        endpoint = request.endpoint or '(sin endpoint)'
+        self.duracion.observar(time.perf_counter() - inicio, endpoint, request.method)
+        self.peticiones.inc(endpoint, request.method, str(status))
+        self.consultas_peticion.observar(getattr(local, 'consultas', 0), endpoint)
+
+    def _finalizar(self, respuesta):
+        self._registrar(respuesta.status_code)
+        return respuesta
+
+    def _cerrar(self, exc=None):
+        # after_request no corre si la vista lanzó una excepción no manejada
+        self._registrar(500)
+
+    # ----- SQL -----
+    def _antes_de_ejecutar(self, conn, cursor, statement, parameters, context, executemany):
+        # El inicio va en el ExecutionContext y no en conn.info: si la sentencia
+        # falla, after_cursor_execute no corre y el dato muere con el contexto.
+        if context is not None:
+            context._metrics_inicio = time.perf_counter()
+
+    def _despues_de_ejecutar(self, engine, conn, cursor, statement, parameters, context, executemany):
+        inicio = getattr(context, '_metrics_inicio', None)
+        if inicio is not None:
+            self.sql_segundos.inc(engine, n=time.perf_counter() - inicio)
+        self.sql.inc(engine)
+        local = self.registro._local
+        local.consultas = getattr(local, 'consultas', 0) + 1
+
+    def _pool(self, atributo):
+        if self._app is None:
+            return []
+        filas = []
+        for bind, engine in self._db.engines.items():
+            medir = getattr(engine.pool, atributo, None)  # StaticPool/SingletonThreadPool no los tienen
+            if callable(medir):
+                filas.append(((bind or 'default',), medir()))
+        return filas
+
+    # ----- Dominio -----
+    def pdf(self, tipo):
+        """Decorador para las funciones que dibujan un PDF: cuenta y mide cada llamada."""
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    resultado = f(*args, **kwargs)
+                except Exception:
+                    self.pdf_generados.inc(tipo, 'error')
+                    raise
+                self.pdf_generados.inc(tipo, 'ok')
+                self.pdf_segundos.observar(time.perf_counter() - inicio, tipo)
+                return resultado
+            return wrapper
+        return decorator
+
+    def registrar_backup(self, segundos, bytes_escritos=0, ok=True):
+        self.backups.inc('ok' if ok else 'error')
+        if ok:
+            self.backup_segundos.observar(segundos)
+            self.backup_bytes.inc(n=bytes_escritos)
+
+    def _ultimo_backup(self, dato):
+        if self._app is None:
+            return []
+        directorio = Path(self._app.config.get('BACKUP_DIR') or '')
+        try:
+            archivos = [ruta.stat() for ruta in directorio.iterdir() if ruta.is_file()]
+        except OSError:
+            return []
+        if not archivos:
+            return []
+        ultimo = max(archivos, key=lambda info: info.st_mtime)
+        return [((), ultimo.st_mtime if dato == 'fecha' else ultimo.st_size)]
+
+    # ----- Exposición -----
+    def vista(self):
+        token = current_app.config.get('METRICS_TOKEN')
+        autorizacion = request.headers.get('Authorization', '')
+        permitido = request.remote_addr in current_app.config.get('METRICS_ALLOWED_IPS', ())
+        if token and hmac.compare_digest(autorizacion, f'Bearer {token}'):
+            permitido = True
+        if not permitido:
+            abort(403)
+        sumados = self.almacen.sumar() if self.almacen is not None else None
+        return Response(self.registro.exponer(sumados), content_type=TIPO_CONTENIDO, headers={'Cache-Control': 'no-store'})
+
+
+metrics = Metrics()
+
+
+# Consultas y pacientes se cuentan al confirmar la transacción (un rollback no cuenta)
+@event.listens_for(Session, 'after_flush')
+def _contar_en_flush(session, flush_context):
+    pendientes = session.info.setdefault('metrics_pendientes', [0, 0, 0])
+    for obj in itertools.chain(session.new, session.dirty):
+        if isinstance(obj, Consulta):
+            if obj in session.new:
+                pendientes[0] += 1
+            if ESTADO_FINALIZADA in sa_inspect(obj).attrs.estado.history.added:
+                pendientes[1] += 1
+        elif isinstance(obj, Paciente) and obj in session.new:
+            pendientes[2] += 1
+
+
+@event.listens_for(Session, 'after_commit')
+def _contar_en_commit(session):
+    pendientes = session.info.pop('metrics_pendientes', None)
+    if pendientes:
+        creadas, finalizadas, pacientes = pendientes
+        if creadas:
+            metrics.consultas_creadas.inc(n=creadas)
+        if finalizadas:
+            metrics.consultas_finalizadas.inc(n=finalizadas)
+        if pacientes:
+            metrics.pacientes_registrados.inc(n=pacientes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_en_rollback(session):
+    session.info.pop('metrics_pendientes', None)
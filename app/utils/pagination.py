@@ -0,0 +1,143 @@
+"""
+Paginación por cursor (keyset / seek) para listados grandes.
+
+En lugar de ``OFFSET`` se filtra por "después de la última fila vista" sobre
+un orden total (p. ej. ``(nombre_completo, id)`` o ``(fecha_consulta DESC, id DESC)``),
+así que cada página cuesta lo mismo sin importar lo profunda que esté. El cursor
+es opaco para el cliente (base64 de los valores de la última fila).
+
+Uso::
+
+    PACIENTES_POR_NOMBRE = Keyset(Paciente.nombre_completo, Paciente.id)
+    pagina = PACIENTES_POR_NOMBRE.paginate(query, request.args.get('cursor'),
+                                           request.args.get('limit', type=int))
+    pagina.items, pagina.next_cursor, pagina.to_dict(serializador)
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_, false
+from sqlalchemy.sql.elements import UnaryExpression
+from sqlalchemy.sql import operators
+
+PAGE_SIZE = 50
+PAGE_SIZE_MAX = 200
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se puede decodificar para este orden."""
+
+
+class Pagina:
+    def __init__(self, items, next_cursor, limit, cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.limit = limit
+        self.cursor = cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return not self.cursor
+
+    def to_dict(self, serializador, clave='items'):
+        return {
+            clave: [serializador(item) for item in self.items],
+            'next_cursor': self.next_cursor,
+            'limit': self.limit,
+        }
+
+
+class Keyset:
+    """Orden total para paginar. Cada columna puede ir con ``.desc()``.
+
+    Las columnas que admiten NULL se ordenan con los NULL al final, tanto en
+    SQLite como en MySQL; la última columna debe ser única (normalmente el id).
+    """
+
+    def __init__(self, *orden):
+        self._columnas = []
+        for expr in orden:
+            descendente = isinstance(expr, UnaryExpression) and expr.modifier is operators.desc_op
+            columna = (expr.element if isinstance(expr, UnaryExpression) else expr).expression
+            nullable = bool(getattr(columna, 'nullable', False)) and not getattr(columna, 'primary_key', False)
+            self._columnas.append((columna, descendente, nullable))
+
+    # ----- Orden y filtro -----
+    def order_by(self):
+        criterios = []
+        for columna, descendente, nullable in self._columnas:
+            if nullable:
+                criterios.append(columna.is_(None))
+            criterios.append(columna.desc() if descendente else columna.asc())
+        return criterios
+
+    def _despues_de(self, valores):
+        terminos = []
+        prefijo = []
+        for (columna, descendente, nullable), valor in zip(self._columnas, valores):
+            if valor is None:
+                # Dentro de los NULL no hay orden por esta columna; decide la siguiente
+                posterior = false()
+                igual = columna.is_(None)
+            else:
+                posterior = columna < valor if descendente else columna > valor
+                if nullable:
+                    posterior = or_(posterior, columna.is_(None))
+                igual = columna == valor
+            terminos.append(and_(*prefijo, posterior))
+            prefijo.append(igual)
+        return or_(*terminos)
+
+    # ----- Cursor -----
+    def _valores(self, item):
+        valores = []
+        for columna, _, _ in self._columnas:
+            valores.append(item._mapping[columna.key] if hasattr(item, '_mapping') else getattr(item, columna.key))
+        return valores
+
+    def encode(self, item):
+        crudos = []
+        for valor in self._valores(item):
+            crudos.append(valor.isoformat() if isinstance(valor, (datetime, date)) else valor)
+        return base64.urlsafe_b64encode(json.dumps(crudos).encode('utf-8')).decode('ascii')
+
+    def decode(self, cursor):
+        try:
+            crudos = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (ValueError, UnicodeError, binascii.Error) as e:
+            raise CursorInvalido(str(e))
+        if not isinstance(crudos, list) or len(crudos) != len(self._columnas):
+            raise CursorInvalido('longitud de cursor incorrecta')
+        valores = []
+        for (columna, _, _), crudo in zip(self._columnas, crudos):
+            if crudo is None:
+                valores.append(None)
+                continue
+            tipo = columna.type.python_type
+            try:
+                if tipo is datetime:
+                    valores.append(datetime.fromisoformat(crudo))
+                elif tipo is date:
+                    valores.append(date.fromisoformat(crudo))
+                else:
+                    valores.append(tipo(crudo))
+            except (TypeError, ValueError) as e:
+                raise CursorInvalido(str(e))
+        return valores
+
+    # ----- Paginación -----
+    def paginate(self, query, cursor=None, limit=None, default=PAGE_SIZE, maximo=PAGE_SIZE_MAX):
+        """Aplica orden, filtro de cursor y límite a ``query``. Lanza ``CursorInvalido``."""
+        limit = min(max(limit or default, 1), maximo)
+        if cursor:
+            query = query.filter(self._despues_de(self.decode(cursor)))
+        filas = query.order_by(*self.order_by()).limit(limit + 1).all()
+        hay_mas = len(filas) > limit
+        filas = filas[:limit]
+        return Pagina(filas, self.encode(filas[-1]) if hay_mas else None, limit, cursor)
@@ -0,0 +1,241 @@
+"""
+Índice de búsqueda de pacientes por nombre, DPI y número de expediente.
+
+- SQLite: tabla virtual FTS5 con tokenizador ``trigram``. Los términos de 3 o
+  más caracteres se buscan como subcadena con ``MATCH '"tok1" "tok2"'`` (usa el
+  índice); los de 1-2 caracteres, que el trigrama no cubre, se comparan como
+  inicio de palabra con ``LIKE`` sobre las filas que ya devolvió el ``MATCH``.
+- MySQL: tabla auxiliar con índice FULLTEXT y parser ``ngram``.
+- Otros motores (o SQLite sin FTS5): se usa ``ILIKE`` sobre las columnas originales.
+
+El texto se guarda normalizado (minúsculas y sin acentos), de modo que
+"Pérez" y "perez" coinciden. La tabla se mantiene sincronizada mediante
+eventos de SQLAlchemy al insertar, actualizar o eliminar un ``Paciente``.
+"""
+import unicodedata
+import weakref
+
+from sqlalchemy import event, inspect, or_, text, true, column
+
+from app import db
+from app.models import Paciente
+
+TABLA_INDICE = 'paciente_busqueda'
+CAMPOS_INDEXADOS = ('nombre_completo', 'dni', 'numero_expediente')
+
+
+def normalizar_texto(texto) -> str:
+    """Minúsculas, sin acentos y con espacios simples."""
+    if not texto:
+        return ''
+    descompuesto = unicodedata.normalize('NFKD', str(texto))
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.lower().split())
+
+
+def _texto_paciente(nombre_completo, dni, numero_expediente) -> str:
+    return ' '.join(filter(None, (normalizar_texto(v) for v in (nombre_completo, dni, numero_expediente))))
+
+
+TRIGRAMA = 3
+
+
+def _frase_fts(tokens) -> str:
+    """``'"tok1" "tok2"'``: todas las subcadenas, con las comillas internas duplicadas."""
+    return ' '.join('"{}"'.format(tok.replace('"', '""')) for tok in tokens)
+
+
+class PatientSearchIndex:
+    """Servicio único de búsqueda de pacientes usado por todos los endpoints."""
+
+    BATCH_SIZE = 1000
+
+    def __init__(self):
+        # engine -> 'fts5' | 'fulltext' | 'ilike'
+        self._modos = weakref.WeakKeyDictionary()
+
+    # ----- Esquema -----
+    def modo(self, connection=None) -> str:
+        """Modo de búsqueda del motor actual; crea el índice la primera vez.
+
+        Dentro de un flush se recibe la conexión del flush (el índice se crea en
+        la misma transacción); fuera de él se usa una transacción propia.
+        """
+        engine = connection.engine if connection is not None else db.engine
+        if engine in self._modos:
+            return self._modos[engine]
+        if connection is not None:
+            modo, creado = self._crear_esquema(connection)
+            # Si se creó dentro del flush, la transacción aún puede revertirse
+            if not creado:
+                self._modos[engine] = modo
+            return modo
+        with engine.begin() as conn:
+            modo, _ = self._crear_esquema(conn)
+        self._modos[engine] = modo
+        return modo
+
+    def _crear_esquema(self, connection) -> tuple:
+        dialecto = connection.dialect.name
+        if dialecto == 'sqlite':
+            existe = connection.execute(
+                text("SELECT name FROM sqlite_master WHERE type='table' AND name=:n"),
+                {'n': TABLA_INDICE}
+            ).first()
+            if existe:
+                return 'fts5', False
+            try:
+                connection.execute(text(
+                    f"CREATE VIRTUAL TABLE {TABLA_INDICE} USING fts5(texto, tokenize='trigram')"
+                ))
+            except Exception:
+                # SQLite sin FTS5/trigram (< 3.34): búsqueda tradicional
+                return 'ilike', False
+            self._poblar(connection)
+            return 'fts5', True
+
+        if dialecto == 'mysql':
+            # El DDL en MySQL hace commit implícito: usar una conexión aparte
+            with connection.engine.begin() as ddl_conn:
+                existe = ddl_conn.execute(
+                    text("SELECT COUNT(*) FROM information_schema.tables "
+                         "WHERE table_schema = DATABASE() AND table_name = :n"),
+                    {'n': TABLA_INDICE}
+                ).scalar()
+                if existe:
+                    return 'fulltext', False
+                ddl_conn.execute(text(
+                    f"CREATE TABLE {TABLA_INDICE} ("
+                    " paciente_id INT NOT NULL PRIMARY KEY,"
+                    " texto VARCHAR(255) NOT NULL DEFAULT '',"
+                    f" FULLTEXT KEY ft_{TABLA_INDICE} (texto) WITH PARSER ngram"
+                    ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+                ))
+                self._poblar(ddl_conn, modo='fulltext')
+            return 'fulltext', False
+
+        return 'ilike', False
+
+    def _poblar(self, connection, modo='fts5') -> int:
+        """Carga el índice completo a partir de la tabla paciente, por lotes."""
+        total = 0
+        ultimo_id = 0
+        while True:
+            filas = connection.execute(
+                text("SELECT id, nombre_completo, dni, numero_expediente FROM paciente "
+                     "WHERE id > :ultimo ORDER BY id LIMIT :limite"),
+                {'ultimo': ultimo_id, 'limite': self.BATCH_SIZE}
+            ).fetchall()
+            if not filas:
+                break
+            valores = [{'id': f[0], 'texto': _texto_paciente(f[1], f[2], f[3])} for f in filas]
+            connection.execute(text(self._sql_insert(modo)), valores)
+            total += len(filas)
+            ultimo_id = filas[-1][0]
+        return total
+
+    def rebuild(self) -> int:
+        """Reconstruye el índice completo (p. ej. tras cargas masivas sin eventos ORM)."""
+        modo = self.modo()
+        if modo == 'ilike':
+            return 0
+        connection = db.session.connection()
+        connection.execute(text(f"DELETE FROM {TABLA_INDICE}"))
+        total = self._poblar(connection, modo=modo)
+        db.session.commit()
+        return total
+
+    # ----- Sincronización -----
+    @staticmethod
+    def _sql_insert(modo) -> str:
+        if modo == 'fts5':
+            return f"INSERT INTO {TABLA_INDICE} (rowid, texto) VALUES (:id, :texto)"
+        return (f"INSERT INTO {TABLA_INDICE} (paciente_id, texto) VALUES (:id, :texto) "
+                f"ON DUPLICATE KEY UPDATE texto = VALUES(texto)")
+
+    def _sql_delete(self, modo) -> str:
+        clave = 'rowid' if modo == 'fts5' else 'paciente_id'
+        return f"DELETE FROM {TABLA_INDICE} WHERE {clave} = :id"
+
+    def sync(self, connection, paciente) -> None:
+        modo = self.modo(connection)
+        if modo == 'ilike':
+            return
+        if modo == 'fts5':
+            connection.execute(text(self._sql_delete(modo)), {'id': paciente.id})
+        connection.execute(text(self._sql_insert(modo)), {
+            'id': paciente.id,
+            'texto': _texto_paciente(paciente.nombre_completo, paciente.dni, paciente.numero_expediente)
+        })
+
+    def remove(self, connection, paciente_id) -> None:
+        modo = self.modo(connection)
+        if modo != 'ilike':
+            connection.execute(text(self._sql_delete(modo)), {'id': paciente_id})
+
+    # ----- Consulta -----
+    def match_clause(self, termino):
+        """Condición SQL sobre ``Paciente`` para el término de búsqueda dado."""
+        tokens = normalizar_texto(termino).split()
+        if not tokens:
+            return true()
+
+        modo = self.modo()
+        if modo == 'fts5':
+            largos = [tok for tok in tokens if len(tok) >= TRIGRAMA]
+            # Sin ESCAPE (impide usar el índice): los comodines se quitan del término
+            cortos = [tok for tok in (t.replace('%', '').replace('_', '') for t in tokens if len(t) < TRIGRAMA) if tok]
+            condiciones = []
+            parametros = {}
+            if largos:
+                condiciones.append(f"{TABLA_INDICE} MATCH :frase")
+                parametros['frase'] = _frase_fts(largos)
+            for i, tok in enumerate(cortos):
+                condiciones.append(f"(texto LIKE :p{i} OR texto LIKE :e{i})")
+                parametros[f'p{i}'] = f'{tok}%'
+                parametros[f'e{i}'] = f'% {tok}%'
+            if not condiciones:
+                return true()
+            sub = text(
+                f"SELECT rowid FROM {TABLA_INDICE} WHERE {' AND '.join(condiciones)}"
+            ).bindparams(**parametros).columns(column('rowid'))
+            return Paciente.id.in_(sub)
+
+        if modo == 'fulltext':
+            booleano = ' '.join('+"{}"'.format(tok.replace('"', '')) for tok in tokens)
+            sub = text(
+                f"SELECT paciente_id FROM {TABLA_INDICE} "
+                f"WHERE MATCH(texto) AGAINST(:q IN BOOLEAN MODE)"
+            ).bindparams(q=booleano).columns(column('paciente_id'))
+            return Paciente.id.in_(sub)
+
+        termino = termino.strip()
+        return or_(
+            Paciente.nombre_completo.ilike(f'%{termino}%'),
+            Paciente.dni.ilike(f'%{termino}%'),
+            Paciente.numero_expediente.ilike(f'%{termino}%')
+        )
+
+    def search(self, query, termino):
+        """Aplica el filtro de búsqueda a una consulta de ``Paciente``."""
+        return query.filter(self.match_clause(termino))
+
+
+patient_search = PatientSearchIndex()
+
+
+@event.listens_for(Paciente, 'after_insert')
+def _indexar_paciente_nuevo(mapper, connection, target):
+    patient_search.sync(connection, target)
+
+
+@event.listens_for(Paciente, 'after_update')
+def _indexar_paciente_actualizado(mapper, connection, target):
+    estado = inspect(target)
+    if any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_INDEXADOS):
+        patient_search.sync(connection, target)
+
+
+@event.listens_for(Paciente, 'after_delete')
+def _desindexar_paciente(mapper, connection, target):
+    patient_search.remove(connection, target.id)
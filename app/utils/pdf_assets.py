@@ -0,0 +1,167 @@
+"""
+Logos del encabezado y marca de agua de los PDF, cargados una sola vez.
+
+Con el primer PDF del proceso se buscan los archivos en ``static/img``, se
+decodifican y se reducen al tamaño en que se imprimen (los originales miden hasta 1900 px para
+ocupar 28 pt en el encabezado). Las imágenes sin transparencia se guardan como
+JPEG en memoria, que ReportLab incrusta tal cual sin volver a comprimir.
+
+Dentro de cada documento los logos se dibujan como formularios XObject
+(``beginForm``/``doForm``): la imagen se incrusta una vez por PDF y cada página
+solo la referencia, en lugar de buscar el archivo y procesarlo en cada página.
+"""
+import io
+import os
+import threading
+
+from app.utils.lazy import REPORTLAB_AVAILABLE
+
+LOGO_IZQUIERDO_CANDIDATOS = [
+    'logo_clinicas.jpg',
+    'logo_clinicas.JPG',
+    'logo_clinicas_familiares_cunori.jpg',
+    'logotipo-cunori-transparente.png',
+    'logo.png',
+    'logo.JPG'
+]
+LOGO_DERECHO_CANDIDATOS = [
+    'escudo_guatemala.png',
+    'logotipo-cunori-transparente.png',
+    'logo.JPG'
+]
+TITULO_ENCABEZADO = 'Clínicas Familiares CUNORI-Shororagua'
+LOGO_LADO = 28
+MARCA_AGUA_ALPHA = 0.08
+# Resolución de las copias reducidas (lado mayor en píxeles)
+LOGO_PX = 112  # 28 pt a ~288 ppp
+MARCA_AGUA_PX = 800  # ~60 % de una página carta a ~150 ppp
+
+
+class PdfAssets:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.logo_izquierdo = None
+        self.logo_derecho = None
+        self.marca_agua = None
+        self.rutas = {}
+        self.directorio = None
+        self._cargado = False
+
+    def init_app(self, app):
+        # Solo se registra el directorio: PIL y ReportLab se cargan con el primer PDF
+        self.directorio = os.path.join(app.root_path, 'static', 'img')
+        self._cargado = False
+
+    def _asegurar_cargado(self):
+        if not self._cargado and self.directorio is not None:
+            self.cargar(self.directorio)
+
+    @staticmethod
+    def _buscar(directorio, candidatos):
+        for nombre in candidatos:
+            ruta = os.path.join(directorio, nombre)
+            if os.path.exists(ruta):
+                return ruta
+        return None
+
+    @staticmethod
+    def _preparar(ruta, lado_max):
+        """Decodifica ``ruta`` una vez y devuelve un ``ImageReader`` reducido a ``lado_max`` px."""
+        if ruta is None or not REPORTLAB_AVAILABLE:
+            return None
+        from PIL import Image
+        from reportlab.lib.utils import ImageReader
+        with Image.open(ruta) as original:
+            con_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+            imagen = original.convert('RGBA' if con_alpha else 'RGB')
+        imagen.thumbnail((lado_max, lado_max))
+        if con_alpha:
+            lector = ImageReader(imagen)
+        else:
+            buffer = io.BytesIO()
+            imagen.save(buffer, 'JPEG', quality=90)
+            buffer.seek(0)
+            lector = ImageReader(buffer)
+        # ReportLab firma cada imagen con sus píxeles; se calculan aquí una sola vez
+        lector.getRGBData()
+        return lector
+
+    def cargar(self, directorio):
+        """Resuelve y decodifica los logos de ``directorio``."""
+        with self._lock:
+            if self._cargado and directorio == self.directorio:
+                return
+            izquierdo = self._buscar(directorio, LOGO_IZQUIERDO_CANDIDATOS)
+            derecho = self._buscar(directorio, LOGO_DERECHO_CANDIDATOS)
+            self.rutas = {'izquierdo': izquierdo, 'derecho': derecho}
+            self.logo_izquierdo = self._preparar(izquierdo, LOGO_PX)
+            self.logo_derecho = self._preparar(derecho, LOGO_PX)
+            self.marca_agua = self._preparar(izquierdo, MARCA_AGUA_PX)
+            self.directorio = directorio
+            self._cargado = True
+
+    # ----- Formularios XObject (uno por documento) -----
+    def _formulario(self, canv, nombre, imagen, ancho, alto):
+        """Define el formulario la primera vez que se usa en el documento del canvas."""
+        if not canv.hasForm(nombre):
+            canv.beginForm(nombre, 0, 0, ancho, alto)
+            # Los lectores se comparten entre hilos y ReportLab lee su buffer al incrustar
+            with self._lock:
+                canv.drawImage(imagen, 0, 0, width=ancho, height=alto, preserveAspectRatio=True, mask='auto')
+            canv.endForm()
+        return nombre
+
+    @staticmethod
+    def tamano_pagina(canv, doc):
+        try:
+            return doc.pagesize
+        except AttributeError:
+            # Los canvas que redibujan al guardar se pasan a sí mismos como doc
+            return canv._pagesize
+
+    def dibujar_marca_agua(self, canv, doc, escala=0.6):
+        """Logo centrado y semitransparente ocupando ``escala`` de la página."""
+        self._asegurar_cargado()
+        if self.marca_agua is None:
+            return
+        page_w, page_h = self.tamano_pagina(canv, doc)
+        w = page_w * escala
+        h = page_h * escala
+        nombre = self._formulario(canv, f'ClinicaMarcaAgua{int(w)}x{int(h)}', self.marca_agua, w, h)
+        try:
+            canv.saveState()
+            if hasattr(canv, 'setFillAlpha'):
+                canv.setFillAlpha(MARCA_AGUA_ALPHA)
+            canv.translate((page_w - w) / 2, (page_h - h) / 2)
+            canv.doForm(nombre)
+        finally:
+            canv.restoreState()
+
+    def dibujar_encabezado(self, canv, doc, margen=36):
+        """Logos a ambos lados, nombre de la clínica y línea divisoria."""
+        self._asegurar_cargado()
+        page_w, page_h = self.tamano_pagina(canv, doc)
+        y = page_h - LOGO_LADO - 10
+        try:
+            canv.saveState()
+            for imagen, nombre, x in ((self.logo_izquierdo, 'ClinicaLogoIzquierdo', margen),
+                                      (self.logo_derecho, 'ClinicaLogoDerecho', page_w - margen - LOGO_LADO)):
+                if imagen is None:
+                    continue
+                self._formulario(canv, nombre, imagen, LOGO_LADO, LOGO_LADO)
+                canv.saveState()
+                canv.translate(x, y)
+                canv.doForm(nombre)
+                canv.restoreState()
+            canv.setFont('Helvetica-Bold', 12)
+            canv.setFillColorRGB(0.1, 0.16, 0.23)
+            canv.drawCentredString(page_w/2, y + 8, TITULO_ENCABEZADO)
+            # Línea bajo encabezado
+            canv.setLineWidth(0.5)
+            canv.setStrokeColorRGB(0.6, 0.6, 0.6)
+            canv.line(margen, y - 4, page_w - margen, y - 4)
+        finally:
+            canv.restoreState()
+
+
+pdf_assets = PdfAssets()
@@ -0,0 +1,187 @@
+"""
+Caché en disco de los PDF de receta y consulta.
+
+Cada PDF se guarda bajo una clave derivada de su contenido: un hash de todos
+los campos que se imprimen (consulta, paciente, médico, clínica) más la versión
+de la plantilla. Si la consulta cambia, la clave cambia y el PDF viejo deja de
+usarse hasta que la expulsión por tamaño lo borre (editar no toca la caché).
+Al confirmar el borrado de una consulta se descartan sus entradas (los archivos
+llevan el prefijo ``consulta<id>-``).
+
+El tamaño total se limita a ``PDF_CACHE_MAX_BYTES`` expulsando primero las
+entradas usadas hace más tiempo (cada acierto actualiza la fecha del archivo).
+Cada proceso lleva la cuenta de los bytes en disco y solo recorre el directorio
+cuando la cuenta supera el límite.
+Los archivos se sirven con ``send_file`` desde disco, con ETag estable y
+soporte de peticiones condicionales y por rangos.
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Consulta
+
+
+class EntradaPdf:
+    __slots__ = ('clave', 'ruta', 'nombre')
+
+    def __init__(self, clave, ruta, nombre):
+        self.clave = clave
+        self.ruta = ruta
+        self.nombre = nombre
+
+
+class PdfCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.metricas = {'hits': 0, 'misses': 0, 'expulsiones': 0}
+        self._bytes = {}  # directorio -> bytes de PDF en disco según este proceso
+
+    @staticmethod
+    def directorio():
+        directorio = Path(current_app.config['PDF_CACHE_DIR'])
+        directorio.mkdir(parents=True, exist_ok=True)
+        return directorio
+
+    @staticmethod
+    def clave(grupo, tipo, version, datos):
+        """``<grupo>-<sha256>`` de (tipo, versión de plantilla, datos impresos)."""
+        crudo = json.dumps([tipo, version, datos], sort_keys=True, default=str, ensure_ascii=False)
+        return f'{grupo}-{hashlib.sha256(crudo.encode("utf-8")).hexdigest()}'
+
+    def _contar(self, metrica, cantidad=1):
+        with self._lock:
+            self.metricas[metrica] += cantidad
+
+    def obtener(self, clave):
+        """Entrada en caché o None. Marca la entrada como usada recientemente."""
+        directorio = self.directorio()
+        ruta = directorio / f'{clave}.pdf'
+        try:
+            nombre = json.loads((directorio / f'{clave}.json').read_text(encoding='utf-8'))['nombre']
+            os.utime(ruta)
+        except (OSError, ValueError, KeyError):
+            self._contar('misses')
+            return None
+        self._contar('hits')
+        return EntradaPdf(clave, ruta, nombre)
+
+    def guardar(self, clave, contenido: bytes, nombre):
+        directorio = self.directorio()
+        ruta = directorio / f'{clave}.pdf'
+        sufijo = f'.tmp{os.getpid()}.{threading.get_ident()}'
+        try:
+            reemplazado = ruta.stat().st_size  # otro hilo o proceso generó la misma clave
+        except OSError:
+            reemplazado = 0
+        for destino, datos in ((ruta, contenido),
+                               (directorio / f'{clave}.json', json.dumps({'nombre': nombre}).encode('utf-8'))):
+            tmp = destino.with_suffix(sufijo)
+            tmp.write_bytes(datos)
+            os.replace(tmp, destino)
+        self._podar(directorio, len(contenido) - reemplazado)
+        return EntradaPdf(clave, ruta, nombre)
+
+    def obtener_o_generar(self, clave, generar):
+        """Devuelve la entrada de ``clave``; si no existe la crea con ``generar() -> (bytes, nombre)``."""
+        entrada = self.obtener(clave)
+        if entrada is None:
+            contenido, nombre = generar()
+            entrada = self.guardar(clave, contenido, nombre)
+        return entrada
+
+    def _podar(self, directorio, agregados):
+        limite = current_app.config.get('PDF_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        with self._lock:
+            total = self._bytes.get(directorio)
+            if total is not None:
+                total = self._bytes[directorio] = total + agregados
+        if total is not None and total <= limite:
+            return
+        # Primera escritura del proceso o límite superado: recorrer el directorio
+        # (también corrige lo que hayan escrito o borrado otros procesos)
+        archivos = []
+        total = 0
+        for ruta in directorio.glob('*.pdf'):
+            try:
+                info = ruta.stat()
+            except OSError:
+                continue
+            archivos.append((info.st_mtime, info.st_size, ruta))
+            total += info.st_size
+        if total > limite:
+            # Se baja al 90 % del límite para no volver a recorrer el directorio en la siguiente escritura
+            objetivo = limite * 0.9
+            archivos.sort()
+            for _, tamano, ruta in archivos:
+                if total <= objetivo:
+                    break
+                ruta.unlink(missing_ok=True)
+                ruta.with_suffix('.json').unlink(missing_ok=True)
+                total -= tamano
+                self._contar('expulsiones')
+        with self._lock:
+            self._bytes[directorio] = total
+
+    def descartar_grupo(self, grupo):
+        """Borra todas las entradas de un grupo (p. ej. ``consulta42``)."""
+        directorio = Path(current_app.config['PDF_CACHE_DIR'])
+        if not directorio.is_dir():
+            return 0
+        borrados = 0
+        liberados = 0
+        for ruta in directorio.glob(f'{grupo}-*'):
+            if ruta.suffix == '.pdf':
+                try:
+                    liberados += ruta.stat().st_size
+                except OSError:
+                    continue
+                borrados += 1
+            ruta.unlink(missing_ok=True)
+        with self._lock:
+            if directorio in self._bytes:
+                self._bytes[directorio] -= liberados
+        return borrados
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self.metricas)
+        archivos = list(self.directorio().glob('*.pdf'))
+        datos['entradas'] = len(archivos)
+        datos['bytes'] = sum(ruta.stat().st_size for ruta in archivos if ruta.exists())
+        return datos
+
+
+pdf_cache = PdfCache()
+
+
+def grupo_consulta(consulta_id):
+    return f'consulta{consulta_id}'
+
+
+# Los PDF de una consulta borrada se descartan al confirmar (un rollback la conserva).
+# Las ediciones no necesitan nada: la clave cambia con el contenido impreso.
+@event.listens_for(Session, 'after_flush')
+def _anotar_consultas_borradas(session, flush_context):
+    borradas = [obj.id for obj in session.deleted if isinstance(obj, Consulta)]
+    if borradas:
+        session.info.setdefault('pdf_cache_borradas', []).extend(borradas)
+
+
+@event.listens_for(Session, 'after_commit')
+def _descartar_pdf_consultas_borradas(session):
+    borradas = session.info.pop('pdf_cache_borradas', None)
+    if borradas and has_app_context():
+        for consulta_id in borradas:
+            pdf_cache.descartar_grupo(grupo_consulta(consulta_id))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _olvidar_consultas_borradas(session):
+    session.info.pop('pdf_cache_borradas', None)
@@ -0,0 +1,176 @@
+"""
+Plantilla común de los PDF de la clínica (historial, receta, consulta y reportes).
+
+Los estilos de párrafo y de tabla se construyen una sola vez por proceso, al
+importar el módulo, en lugar de llamar a ``getSampleStyleSheet()`` y crear los
+``ParagraphStyle`` en cada petición. Cada tipo de documento tiene un diseño fijo
+(tamaño de página, márgenes, escala de la marca de agua y si lleva firma).
+
+``ClinicaDocTemplate`` arma las páginas a partir de ese diseño: el encabezado y
+la marca de agua se dibujan al empezar cada página con los logos precargados de
+``pdf_assets`` y la firma se coloca como último elemento del contenido, de modo
+que ya no hace falta guardar el estado de todas las páginas para redibujarlas
+al cerrar el documento.
+
+Uso::
+
+    story = [Paragraph('RECETA MÉDICA', ESTILOS['h1']), ...]
+    contenido = ClinicaDocTemplate('receta').build_to(io.BytesIO(), story).getvalue()
+"""
+from collections import namedtuple
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4, letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import BaseDocTemplate, Flowable, Frame, PageTemplate, TableStyle
+
+from app.utils.pdf_assets import pdf_assets
+
+# margenes = (izquierdo, derecho, superior, inferior)
+Diseno = namedtuple('Diseno', 'pagesize margenes margen_encabezado escala_marca_agua firma')
+
+DISENOS = {
+    'reportes': Diseno(letter, (inch, inch, inch, inch), 36, 0.6, False),
+    'receta': Diseno(letter, (72, 72, 72, 18), 36, 0.55, True),
+    'consulta': Diseno(letter, (72, 72, 72, 36), 36, 0.6, True),
+    'historial': Diseno(A4, (inch, inch, inch, inch), inch, 0.6, True),
+}
+
+
+def _construir_estilos():
+    base = getSampleStyleSheet()
+    normal = base['Normal']
+
+    def etiqueta(nombre, color):
+        return ParagraphStyle(nombre, parent=normal, fontSize=10, textColor=color, fontName='Helvetica-Bold')
+
+    estilos = {
+        'h1': base['h1'],
+        'h2': base['h2'],
+        'normal': normal,
+        # Receta
+        'cuerpo': ParagraphStyle(name='Body', parent=normal, spaceAfter=10),
+        # Informe de consulta
+        'consulta_titulo': ParagraphStyle('TitleX', parent=base['Heading1'], spaceAfter=12),
+        'consulta_seccion': ParagraphStyle('HeadingX', parent=base['Heading2'], spaceAfter=6),
+        'pequeno': ParagraphStyle('Small', parent=normal, fontSize=10, spaceAfter=6),
+        # Historial
+        'historial_titulo': ParagraphStyle('CustomTitle', parent=base['Heading1'], fontSize=18, spaceAfter=30,
+                                           alignment=TA_CENTER, textColor=colors.darkblue),
+        'historial_seccion': ParagraphStyle('CustomHeading', parent=base['Heading2'], fontSize=14, spaceAfter=12,
+                                            textColor=colors.darkgreen),
+        'historial_subseccion': ParagraphStyle('CustomSubHeading', parent=base['Heading3'], fontSize=12,
+                                               spaceAfter=8, textColor=colors.darkred),
+        'etiqueta_signos': etiqueta('SignosTitle', colors.darkblue),
+        'etiqueta_motivo': etiqueta('MotivoTitle', colors.darkgreen),
+        'etiqueta_historia': etiqueta('HistoriaTitle', colors.darkorange),
+        'etiqueta_diagnostico': etiqueta('DiagnosticoTitle', colors.darkred),
+        'etiqueta_tratamiento': etiqueta('TratamientoTitle', colors.darkblue),
+        'etiqueta_antecedentes': etiqueta('AntecedentesTitle', colors.purple),
+    }
+    return estilos
+
+
+def _construir_tablas():
+    return {
+        'receta_paciente': TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]),
+        'consulta_datos': TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]),
+        'consulta_examen': TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BACKGROUND', (0, 0), (0, -1), colors.whitesmoke)
+        ]),
+        'historial_paciente': TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]),
+        'historial_consulta': TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ]),
+        'historial_signos': TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightyellow),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ]),
+    }
+
+
+# Solo lectura: se comparten entre peticiones e hilos
+ESTILOS = _construir_estilos()
+TABLAS = _construir_tablas()
+
+
+class FirmaMedico(Flowable):
+    """Bloque "Firma y sello" al pie de la página donde termina el contenido."""
+
+    MARGEN = 72
+    ANCHO_LINEA = 200
+
+    def wrap(self, ancho_disponible, alto_disponible):
+        return 0, 0
+
+    def draw(self):
+        canv = self.canv
+        page_w, _ = canv._pagesize
+        # drawOn trasladó el origen a la posición del flowable; volver al de la página
+        x0, y0 = canv.absolutePosition(0, 0)
+        canv.saveState()
+        canv.translate(-x0, -y0)
+        x1 = (page_w - self.ANCHO_LINEA) / 2
+        y = self.MARGEN + 40
+        canv.setLineWidth(1)
+        canv.line(x1, y, x1 + self.ANCHO_LINEA, y)
+        canv.setFont('Helvetica', 10)
+        canv.drawCentredString(page_w/2, y - 14, 'Firma y sello')
+        canv.setFont('Helvetica-Oblique', 10)
+        canv.drawCentredString(page_w/2, y - 28, 'Médico')
+        canv.restoreState()
+
+
+class ClinicaDocTemplate(BaseDocTemplate):
+    """Documento con encabezado, marca de agua y (según el tipo) firma en la última página.
+
+    Los marcos guardan la posición de escritura durante ``build``, así que cada
+    documento crea los suyos a partir del diseño precalculado del tipo.
+    """
+
+    def __init__(self, tipo, **kwargs):
+        self.tipo = tipo
+        self.diseno = DISENOS[tipo]
+        izquierdo, derecho, superior, inferior = self.diseno.margenes
+        super().__init__(None, pagesize=self.diseno.pagesize, leftMargin=izquierdo, rightMargin=derecho,
+                         topMargin=superior, bottomMargin=inferior, **kwargs)
+        marco = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
+        self.addPageTemplates([PageTemplate(id=tipo, frames=[marco], onPage=self._dibujar_pagina,
+                                            pagesize=self.pagesize)])
+
+    def _dibujar_pagina(self, canv, doc):
+        pdf_assets.dibujar_encabezado(canv, doc, margen=self.diseno.margen_encabezado)
+        pdf_assets.dibujar_marca_agua(canv, doc, escala=self.diseno.escala_marca_agua)
+
+    def build_to(self, fileobj, story):
+        """Escribe el PDF de ``story`` en ``fileobj`` (archivo o buffer) y lo devuelve."""
+        story = list(story)
+        if self.diseno.firma:
+            story.append(FirmaMedico())
+        self.build(story, filename=fileobj)
+        return fileobj
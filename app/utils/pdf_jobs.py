@@ -0,0 +1,283 @@
+"""
+Cola de generación de PDF en segundo plano (tabla ``pdf_job``).
+
+Los PDF de historial, receta, consulta y reportes se construyen con ReportLab
+(y matplotlib en el caso de los reportes) y pueden tardar varios segundos. Con
+``?async=1`` (o ``PDF_JOBS_ASYNC`` desde la interfaz) la ruta solo registra un
+trabajo y responde ``202`` con su id; ``flask pdf-worker`` lo genera en otro
+proceso y el cliente consulta ``/api/pdf/jobs/<id>`` hasta poder descargarlo.
+
+- Deduplicación: dos solicitudes idénticas (mismo tipo, parámetros y alcance)
+  mientras la primera está pendiente o en proceso comparten el mismo trabajo.
+  ``clave_activa`` (la clave mientras el trabajo está activo, NULL al terminar)
+  tiene un índice único, así que dos solicitudes simultáneas no crean dos.
+- Concurrencia: cada proceso del worker genera un PDF a la vez (los gráficos del
+  PDF de reportes ya se reparten en el pool de ``charts``); ``--concurrencia``
+  fija cuántos procesos se lanzan. Cada usuario puede tener como máximo
+  ``PDF_JOBS_MAX_PENDIENTES`` trabajos activos.
+- Los trabajos en proceso por más de ``PDF_JOB_TIMEOUT`` segundos (worker caído)
+  vuelven a la cola hasta ``PDF_JOB_MAX_INTENTOS`` veces.
+- Los archivos generados se borran pasados ``PDF_JOBS_TTL`` segundos.
+
+Los generadores se registran con ``@pdf_jobs.generador('tipo')`` junto a sus
+rutas y devuelven ``(contenido_pdf, nombre_archivo)``.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from flask import current_app, jsonify, request, url_for
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import PdfJob
+
+ESTADOS_ACTIVOS = ('pendiente', 'en_proceso')
+ESTADOS_FINALES = ('completado', 'error')
+MANTENIMIENTO_CADA = 60  # segundos entre recuperación de trabajos colgados y limpieza
+
+
+class ColaLlena(Exception):
+    """El usuario ya tiene el máximo de trabajos activos."""
+
+
+class PdfJobQueue:
+    def __init__(self):
+        self._generadores = {}
+
+    # ----- Registro de generadores -----
+    def generador(self, tipo):
+        """Decorador: registra la función que genera el PDF de ``tipo``."""
+        def decorator(f):
+            self._generadores[tipo] = f
+            return f
+        return decorator
+
+    @property
+    def tipos(self):
+        return sorted(self._generadores)
+
+    # ----- Encolado (lado web) -----
+    @staticmethod
+    def alcance_de(usuario):
+        if usuario.rol == 'medico' and usuario.clinica_actual_id:
+            return f'clinica:{usuario.clinica_actual_id}'
+        return 'global'
+
+    @staticmethod
+    def clave(tipo, parametros, alcance):
+        crudo = json.dumps([tipo, parametros, alcance], sort_keys=True)
+        return hashlib.sha1(crudo.encode('utf-8')).hexdigest()
+
+    def encolar(self, tipo, parametros, usuario):
+        """Registra un trabajo y devuelve ``(job, nuevo)``.
+
+        Si ya hay uno idéntico pendiente o en proceso se devuelve ese. Lanza
+        ``ColaLlena`` si el usuario alcanzó ``PDF_JOBS_MAX_PENDIENTES``.
+        """
+        if tipo not in self._generadores:
+            raise KeyError(tipo)
+        alcance = self.alcance_de(usuario)
+        clave = self.clave(tipo, parametros, alcance)
+        existente = PdfJob.query.filter_by(clave_activa=clave).first()
+        if existente is not None:
+            return existente, False
+
+        limite = current_app.config.get('PDF_JOBS_MAX_PENDIENTES', 5)
+        activos = PdfJob.query.filter(PdfJob.usuario_id == usuario.id, PdfJob.estado.in_(ESTADOS_ACTIVOS)).count()
+        if limite and activos >= limite:
+            raise ColaLlena(f'Ya hay {activos} PDF en preparación; espere a que terminen.')
+
+        job = PdfJob(id=uuid.uuid4().hex, tipo=tipo, parametros=json.dumps(parametros, sort_keys=True),
+                     alcance=alcance, clave=clave, clave_activa=clave, estado='pendiente',
+                     usuario_id=usuario.id, intentos=0)
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Otra solicitud idéntica se insertó entre la consulta y el commit
+            db.session.rollback()
+            existente = PdfJob.query.filter_by(clave_activa=clave).first()
+            if existente is None:
+                raise
+            return existente, False
+        return job, True
+
+    def visible_para(self, job, usuario):
+        """El usuario puede ver el trabajo si lo pidió o si habría pedido uno idéntico."""
+        return job.usuario_id == usuario.id or job.alcance == self.alcance_de(usuario)
+
+    def describir(self, job):
+        datos = {
+            'job_id': job.id,
+            'tipo': job.tipo,
+            'estado': job.estado,
+            'estado_url': url_for('main.pdf_job_estado', job_id=job.id),
+        }
+        if job.estado == 'pendiente':
+            datos['posicion'] = PdfJob.query.filter(
+                PdfJob.estado == 'pendiente', PdfJob.fecha_creacion < job.fecha_creacion
+            ).count() + 1
+        elif job.estado == 'completado':
+            datos['descarga_url'] = url_for('main.pdf_job_descarga', job_id=job.id)
+            datos['nombre_archivo'] = job.nombre_archivo
+        elif job.estado == 'error':
+            datos['error'] = job.error
+        return datos
+
+    @staticmethod
+    def solicitado_async():
+        return request.args.get('async', '').lower() in ('1', 'true')
+
+    def respuesta_encolada(self, tipo, parametros):
+        """Respuesta ``202`` para una ruta de PDF llamada con ``?async=1``."""
+        from flask_login import current_user
+        try:
+            job, nuevo = self.encolar(tipo, parametros, current_user)
+        except ColaLlena as e:
+            return jsonify({'success': False, 'error': str(e)}), 429
+        datos = self.describir(job)
+        respuesta = jsonify({'success': True, 'deduplicado': not nuevo, **datos})
+        respuesta.status_code = 202
+        respuesta.headers['Location'] = datos['estado_url']
+        return respuesta
+
+    # ----- Procesamiento (lado worker) -----
+    def reclamar(self):
+        """Marca como en proceso el trabajo pendiente más antiguo y lo devuelve (None si no hay)."""
+        while True:
+            candidato = db.session.query(PdfJob.id).filter(PdfJob.estado == 'pendiente') \
+                .order_by(PdfJob.fecha_creacion).limit(1).scalar()
+            if candidato is None:
+                return None
+            # Actualización condicional: si otro proceso lo tomó primero, rowcount es 0
+            resultado = db.session.execute(
+                update(PdfJob)
+                .where(PdfJob.id == candidato, PdfJob.estado == 'pendiente')
+                .values(estado='en_proceso', fecha_inicio=datetime.utcnow(), intentos=PdfJob.intentos + 1)
+            )
+            db.session.commit()
+            if resultado.rowcount == 1:
+                return db.session.get(PdfJob, candidato)
+
+    def ejecutar(self, job):
+        """Genera el PDF de un trabajo ya reclamado y guarda el resultado."""
+        job_id = job.id
+        try:
+            generador = self._generadores.get(job.tipo)
+            if generador is None:
+                raise KeyError(f'Tipo de PDF desconocido: {job.tipo}')
+            contenido, nombre_archivo = generador(**json.loads(job.parametros))
+            directorio = Path(current_app.config['PDF_JOBS_DIR'])
+            directorio.mkdir(parents=True, exist_ok=True)
+            ruta = directorio / f'{job_id}.pdf'
+            tmp = ruta.with_suffix(f'.tmp{os.getpid()}')
+            tmp.write_bytes(contenido)
+            os.replace(tmp, ruta)
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(PdfJob, job_id)
+            job.estado = 'error'
+            job.error = str(e) or e.__class__.__name__
+        else:
+            job.estado = 'completado'
+            job.nombre_archivo = nombre_archivo
+            job.ruta_archivo = str(ruta)
+            job.error = None
+        job.clave_activa = None
+        job.fecha_fin = datetime.utcnow()
+        db.session.commit()
+        return job
+
+    def recuperar_colgados(self):
+        """Reencola los trabajos en proceso que superaron ``PDF_JOB_TIMEOUT``."""
+        limite = datetime.utcnow() - timedelta(seconds=current_app.config.get('PDF_JOB_TIMEOUT', 300))
+        max_intentos = current_app.config.get('PDF_JOB_MAX_INTENTOS', 3)
+        colgado = (PdfJob.estado == 'en_proceso') & (PdfJob.fecha_inicio < limite)
+        db.session.execute(
+            update(PdfJob).where(colgado, PdfJob.intentos >= max_intentos)
+            .values(estado='error', clave_activa=None, error='Tiempo de generación agotado',
+                    fecha_fin=datetime.utcnow())
+        )
+        reencolados = db.session.execute(update(PdfJob).where(colgado).values(estado='pendiente')).rowcount
+        db.session.commit()
+        return reencolados
+
+    def limpiar(self):
+        """Borra los trabajos terminados (y sus archivos) más antiguos que ``PDF_JOBS_TTL``."""
+        limite = datetime.utcnow() - timedelta(seconds=current_app.config.get('PDF_JOBS_TTL', 3600))
+        viejos = PdfJob.query.filter(PdfJob.estado.in_(ESTADOS_FINALES), PdfJob.fecha_fin < limite).all()
+        for job in viejos:
+            if job.ruta_archivo:
+                Path(job.ruta_archivo).unlink(missing_ok=True)
+            db.session.delete(job)
+        db.session.commit()
+        return len(viejos)
+
+    def trabajar(self, intervalo=1.0, una_vez=False, detener=None):
+        """Bucle del worker: procesa trabajos de uno en uno. Devuelve cuántos procesó."""
+        procesados = 0
+        ultimo_mantenimiento = None
+        while not (detener is not None and detener.is_set()):
+            if ultimo_mantenimiento is None or time.monotonic() - ultimo_mantenimiento > MANTENIMIENTO_CADA:
+                self.recuperar_colgados()
+                self.limpiar()
+                ultimo_mantenimiento = time.monotonic()
+            job = self.reclamar()
+            if job is None:
+                if una_vez:
+                    break
+                if detener is not None:
+                    detener.wait(intervalo)
+                else:
+                    time.sleep(intervalo)
+                continue
+            self.ejecutar(job)
+            procesados += 1
+            # Sesión limpia por trabajo: no arrastrar objetos de un PDF al siguiente
+            db.session.remove()
+        return procesados
+
+    def lanzar_workers(self, concurrencia, intervalo=1.0, una_vez=False):
+        """Ejecuta ``concurrencia`` procesos worker y espera a que terminen."""
+        if concurrencia <= 1:
+            return self.trabajar(intervalo=intervalo, una_vez=una_vez)
+        contexto = multiprocessing.get_context('spawn')
+        detener = contexto.Event()
+        procesos = [
+            contexto.Process(target=_proceso_worker, args=(intervalo, una_vez, detener),
+                             name=f'pdf-worker-{i + 1}')
+            for i in range(concurrencia)
+        ]
+        for proceso in procesos:
+            proceso.start()
+        try:
+            for proceso in procesos:
+                proceso.join()
+        except KeyboardInterrupt:
+            detener.set()
+            for proceso in procesos:
+                proceso.join()
+        return None
+
+
+def _proceso_worker(intervalo, una_vez, detener):
+    from app import create_app
+    from app.utils.lazy import MODULOS_GRAFICOS, MODULOS_PDF, precargar
+    app = create_app()
+    # Este proceso solo genera PDF: ReportLab y matplotlib se cargan antes del primer trabajo
+    precargar(*MODULOS_PDF, *MODULOS_GRAFICOS)
+    with app.app_context():
+        try:
+            pdf_jobs.trabajar(intervalo=intervalo, una_vez=una_vez, detener=detener)
+        except KeyboardInterrupt:
+            pass
+
+
+pdf_jobs = PdfJobQueue()
@@ -0,0 +1,223 @@
+"""
+Perfilado por petición: consultas SQL, tiempo en la BD y patrones N+1.
+
+Una fracción de las peticiones (``PERF_SAMPLE_RATE``, de 0 a 1) se muestrea.
+En ellas los eventos ``before_cursor_execute``/``after_cursor_execute`` de
+SQLAlchemy cuentan las sentencias, suman su tiempo, guardan las más lentas y
+agrupan las sentencias por forma (el SQL con parámetros ``?``, con las listas
+``IN (?, ?, ...)`` colapsadas). Una forma repetida más de ``PERF_N1_THRESHOLD``
+veces en la misma petición se informa como posible N+1.
+
+Con cada petición muestreada:
+
+- se agrega la cabecera ``Server-Timing`` (``db``, ``app`` y ``total``), visible
+  en las herramientas de desarrollo del navegador;
+- se acumulan estadísticas por endpoint para la página ``/admin/perf``;
+- si la petición es lenta (``PERF_SLOW_REQUEST_MS``), tiene una sentencia lenta
+  (``PERF_SLOW_QUERY_MS``) o un N+1, se escribe una línea JSON en
+  ``PERF_LOG_FILE`` (archivo rotativo). Solo se registran la ruta y el SQL con
+  marcadores, nunca los parámetros ni la query string (pueden contener datos de
+  pacientes).
+
+Un administrador puede forzar el muestreo de una petición con ``?_perf=1``.
+
+Las peticiones no muestreadas solo pagan una lectura de ``ContextVar`` por
+sentencia SQL.
+"""
+import heapq
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from flask import request
+from sqlalchemy import event
+
+from app.utils.log_pipeline import log_pipeline
+
+_peticion_actual = ContextVar('perf_peticion', default=None)
+
+_LISTA_IN = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ESPACIOS = re.compile(r'\s+')
+LARGO_SQL = 300
+
+
+def forma_sql(sentencia):
+    """SQL normalizado para agrupar repeticiones (listas IN colapsadas, espacios simples)."""
+    return _LISTA_IN.sub('(?)', _ESPACIOS.sub(' ', sentencia).strip())
+
+
+class EstadoPeticion:
+    __slots__ = ('inicio', 'consultas', 'tiempo_db', 'formas', 'lentas')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.formas = Counter()
+        self.lentas = []  # heap de (segundos, sql)
+
+
+class PerfProfiler:
+    MAX_LENTAS = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.logger = logging.getLogger('app.perf')
+        self.tasa = 0.0
+        self.lenta_ms = 500
+        self.consulta_lenta_ms = 100
+        self.umbral_n1 = 10
+
+    def init_app(self, app, db):
+        self.tasa = float(app.config.get('PERF_SAMPLE_RATE', 0.0))
+        self.lenta_ms = app.config.get('PERF_SLOW_REQUEST_MS', 500)
+        self.consulta_lenta_ms = app.config.get('PERF_SLOW_QUERY_MS', 100)
+        self.umbral_n1 = app.config.get('PERF_N1_THRESHOLD', 10)
+        self._configurar_log(app)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', _antes_de_ejecutar)
+                event.listen(engine, 'after_cursor_execute', _despues_de_ejecutar)
+
+        app.before_request(self._iniciar)
+        app.after_request(self._finalizar)
+        app.teardown_request(self._limpiar)
+
+    def _configurar_log(self, app):
+        ruta = app.config.get('PERF_LOG_FILE')
+        if not ruta:
+            return
+        Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(ruta, maxBytes=app.config.get('PERF_LOG_MAX_BYTES', 5 * 1024 * 1024),
+                                      backupCount=app.config.get('PERF_LOG_BACKUPS', 5), encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        # El log de lentas va a su propio archivo, escrito fuera del hilo de la petición
+        log_pipeline.conectar(self.logger, handler)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    # ----- Ciclo de la petición -----
+    def _muestrear(self):
+        if self.tasa > 0 and random.random() < self.tasa:
+            return True
+        if request.args.get('_perf'):
+            from flask_login import current_user
+            return current_user.is_authenticated and current_user.rol == 'admin'
+        return False
+
+    def _iniciar(self):
+        if self._muestrear():
+            _peticion_actual.set(EstadoPeticion())
+
+    def _finalizar(self, respuesta):
+        estado = _peticion_actual.get()
+        if estado is None:
+            return respuesta
+        total_ms = (time.perf_counter() - estado.inicio) * 1000
+        db_ms = estado.tiempo_db * 1000
+        respuesta.headers.add(
+            'Server-Timing',
+            f'db;dur={db_ms:.1f};desc="{estado.consultas} consultas", '
+            f'app;dur={max(total_ms - db_ms, 0):.1f}, total;dur={total_ms:.1f}'
+        )
+        n1 = [(forma, veces) for forma, veces in estado.formas.most_common() if veces > self.umbral_n1]
+        lentas = sorted(estado.lentas, reverse=True)
+        endpoint = request.endpoint or '(sin endpoint)'
+        self._acumular(endpoint, total_ms, db_ms, estado.consultas, bool(n1))
+        if total_ms >= self.lenta_ms or n1 or (lentas and lentas[0][0] * 1000 >= self.consulta_lenta_ms):
+            self.logger.info(json.dumps({
+                'fecha': datetime.now().isoformat(timespec='seconds'),
+                'metodo': request.method,
+                'ruta': request.path,
+                'endpoint': endpoint,
+                'estado': respuesta.status_code,
+                'total_ms': round(total_ms, 1),
+                'db_ms': round(db_ms, 1),
+                'consultas': estado.consultas,
+                'mas_lentas': [{'ms': round(s * 1000, 1), 'sql': sql} for s, sql in lentas],
+                'n1': [{'veces': veces, 'sql': forma[:LARGO_SQL]} for forma, veces in n1],
+            }, ensure_ascii=False))
+        return respuesta
+
+    @staticmethod
+    def _limpiar(_exc=None):
+        _peticion_actual.set(None)
+
+    # ----- Estadísticas por endpoint -----
+    def _acumular(self, endpoint, total_ms, db_ms, consultas, con_n1):
+        with self._lock:
+            datos = self._endpoints.get(endpoint)
+            if datos is None:
+                datos = self._endpoints[endpoint] = {
+                    'peticiones': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'db_ms': 0.0,
+                    'consultas': 0, 'max_consultas': 0, 'con_n1': 0,
+                }
+            datos['peticiones'] += 1
+            datos['total_ms'] += total_ms
+            datos['max_ms'] = max(datos['max_ms'], total_ms)
+            datos['db_ms'] += db_ms
+            datos['consultas'] += consultas
+            datos['max_consultas'] = max(datos['max_consultas'], consultas)
+            datos['con_n1'] += con_n1
+
+    def peores_endpoints(self, limite=25):
+        """Endpoints muestreados ordenados por tiempo medio, de mayor a menor."""
+        with self._lock:
+            filas = []
+            for endpoint, d in self._endpoints.items():
+                n = d['peticiones']
+                filas.append({
+                    'endpoint': endpoint,
+                    'peticiones': n,
+                    'media_ms': round(d['total_ms'] / n, 1),
+                    'max_ms': round(d['max_ms'], 1),
+                    'db_media_ms': round(d['db_ms'] / n, 1),
+                    'consultas_media': round(d['consultas'] / n, 1),
+                    'max_consultas': d['max_consultas'],
+                    'con_n1': d['con_n1'],
+                })
+        filas.sort(key=lambda f: f['media_ms'], reverse=True)
+        return filas[:limite]
+
+    def limpiar(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+perf = PerfProfiler()
+
+
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    # En el ExecutionContext, no en conn.info: si la sentencia falla no hay
+    # after_cursor_execute y el inicio se descarta junto con el contexto.
+    if context is not None and _peticion_actual.get() is not None:
+        context._perf_inicio = time.perf_counter()
+
+
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    estado = _peticion_actual.get()
+    if estado is None:
+        return
+    inicio = getattr(context, '_perf_inicio', None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+    estado.consultas += 1
+    estado.tiempo_db += duracion
+    forma = forma_sql(statement)
+    estado.formas[forma] += 1
+    elemento = (duracion, forma[:LARGO_SQL])
+    if len(estado.lentas) < PerfProfiler.MAX_LENTAS:
+        heapq.heappush(estado.lentas, elemento)
+    elif elemento > estado.lentas[0]:
+        heapq.heapreplace(estado.lentas, elemento)
@@ -0,0 +1,333 @@
+"""
+Caché de respuestas de las APIs de reportes.
+
+Las respuestas dependen solo del alcance (clínica del médico o global), de los
+argumentos de la ruta y de la "versión" de los datos. La versión se incrementa
+cada vez que un flush de SQLAlchemy toca una ``Consulta`` o un ``Paciente``, de
+modo que las entradas viejas dejan de usarse sin tener que borrarlas.
+
+Backends (``REPORT_CACHE_BACKEND``):
+
+- ``memory`` (por defecto): LRU en el proceso con TTL. La versión combina un
+  identificador único del arranque con el archivo ``VERSION`` de
+  ``REPORT_CACHE_DIR``, que comparten todos los procesos (otros workers,
+  ``flask seed-synthetic``...): un ETag nunca coincide entre procesos ni entre
+  reinicios y una escritura en otro proceso cambia la versión de todos.
+- ``filesystem``: archivos en ``REPORT_CACHE_DIR`` (compartido entre procesos).
+  Es el que se usa en lugar de ``memory`` cuando la app corre con varios
+  procesos (gunicorn o ``WSGI_MULTIPROCESS``).
+- ``redis``: servidor Redis local o compatible (requiere el paquete ``redis``).
+- ``null``: sin almacenamiento; solo se mantienen ETag y versión.
+
+Además se envía un ``ETag`` por (endpoint, alcance, versión) para que el
+navegador reciba ``304 Not Modified`` sin recalcular nada.
+"""
+import hashlib
+import itertools
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+
+from flask import current_app, has_app_context, make_response, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Consulta, Paciente
+
+logger = logging.getLogger(__name__)
+
+MODELOS_VIGILADOS = (Consulta, Paciente)
+
+
+def _escribir_atomico(ruta, contenido: bytes):
+    tmp = ruta.with_suffix(f'.tmp{os.getpid()}.{threading.get_ident()}')
+    tmp.write_bytes(contenido)
+    os.replace(tmp, ruta)
+
+
+class VersionCompartida:
+    """Archivo ``VERSION`` que cualquier proceso puede cambiar; se relee solo si cambió en disco."""
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._firma = None
+        self._valor = '0'
+
+    def leer(self):
+        try:
+            info = self.ruta.stat()
+        except OSError:
+            return '0'
+        firma = (info.st_mtime_ns, info.st_size, info.st_ino)
+        if firma != self._firma:
+            try:
+                self._valor = self.ruta.read_text().strip() or '0'
+            except OSError:
+                return '0'
+            self._firma = firma
+        return self._valor
+
+    def cambiar(self):
+        # Un valor único evita leer-modificar-escribir entre procesos
+        _escribir_atomico(self.ruta, f'{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'.encode())
+
+
+class MemoryBackend:
+    """LRU en memoria con TTL por entrada."""
+
+    nombre = 'memory'
+
+    def __init__(self, max_entries=256, ttl=300, archivo_version=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        # Único por arranque: los ETag de otro proceso o de antes de reiniciar no coinciden
+        self._arranque = uuid.uuid4().hex[:12]
+        self._version = itertools.count(1)
+        self._actual = next(self._version)
+        self._compartida = VersionCompartida(archivo_version) if archivo_version else None
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entries:
+                self._datos.popitem(last=False)
+
+    def version(self):
+        local = f'{self._arranque}.{self._actual}'
+        if self._compartida is None:
+            return local
+        return f'{local}.{self._compartida.leer()}'
+
+    def bump_version(self):
+        with self._lock:
+            self._actual = next(self._version)
+        if self._compartida is not None:
+            self._compartida.cambiar()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class FileSystemBackend:
+    """Un archivo por entrada; la versión vive en un archivo aparte."""
+
+    nombre = 'filesystem'
+    PODA_CADA = 100
+
+    def __init__(self, directorio, ttl=300):
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._version = VersionCompartida(self.directorio / 'VERSION')
+        self._escrituras = 0
+
+    def _ruta(self, clave):
+        return self.directorio / (hashlib.sha1(clave.encode('utf-8')).hexdigest() + '.cache')
+
+    def get(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            if time.time() - ruta.stat().st_mtime > self.ttl:
+                ruta.unlink(missing_ok=True)
+                return None
+            return pickle.loads(ruta.read_bytes())
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def set(self, clave, valor):
+        _escribir_atomico(self._ruta(clave), pickle.dumps(valor))
+        self._escrituras += 1
+        if self._escrituras % self.PODA_CADA == 0:
+            self._podar()
+
+    def _podar(self):
+        limite = time.time() - self.ttl
+        for ruta in self.directorio.glob('*.cache'):
+            try:
+                if ruta.stat().st_mtime < limite:
+                    ruta.unlink()
+            except OSError:
+                pass
+
+    def version(self):
+        return self._version.leer()
+
+    def bump_version(self):
+        self._version.cambiar()
+
+
+class RedisBackend:
+    """Servidor Redis (o compatible) con expiración nativa."""
+
+    nombre = 'redis'
+    PREFIJO = 'clinica:reportes:'
+
+    def __init__(self, url, ttl=300):
+        import redis  # dependencia opcional
+        self.cliente = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, clave):
+        datos = self.cliente.get(self.PREFIJO + clave)
+        return pickle.loads(datos) if datos is not None else None
+
+    def set(self, clave, valor):
+        self.cliente.set(self.PREFIJO + clave, pickle.dumps(valor), ex=self.ttl)
+
+    def version(self):
+        valor = self.cliente.get(self.PREFIJO + 'version')
+        return valor.decode() if valor is not None else '0'
+
+    def bump_version(self):
+        self.cliente.incr(self.PREFIJO + 'version')
+
+
+class ReportCache:
+    """Punto de acceso único: configuración, métricas y decorador de vistas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.metricas = {'hits': 0, 'misses': 0, 'not_modified': 0, 'stores': 0, 'invalidaciones': 0}
+
+    def init_app(self, app):
+        from app.utils.wsgi_server import multiproceso
+        tipo = app.config.get('REPORT_CACHE_BACKEND', 'memory')
+        if tipo == 'memory' and multiproceso(app.config):
+            # Cada worker tendría su propia copia de las respuestas: se usa el directorio compartido
+            logger.warning("Caché de reportes: varios procesos con el backend 'memory'; se usa 'filesystem' "
+                           "en %s.", app.config['REPORT_CACHE_DIR'])
+            tipo = 'filesystem'
+        ttl = app.config.get('REPORT_CACHE_TTL', 300)
+        backend = None
+        if tipo == 'filesystem':
+            backend = FileSystemBackend(app.config['REPORT_CACHE_DIR'], ttl=ttl)
+        elif tipo == 'redis':
+            try:
+                backend = RedisBackend(app.config['REPORT_CACHE_REDIS_URL'], ttl=ttl)
+            except ImportError:
+                logger.warning("Caché de reportes: paquete 'redis' no instalado, se usa memoria.")
+        archivo_version = Path(app.config['REPORT_CACHE_DIR']) / 'VERSION' if app.config.get('REPORT_CACHE_DIR') else None
+        if tipo == 'null':
+            backend = MemoryBackend(max_entries=0, ttl=ttl, archivo_version=archivo_version)
+        if backend is None:
+            backend = MemoryBackend(max_entries=app.config.get('REPORT_CACHE_MAX_ENTRIES', 256), ttl=ttl,
+                                    archivo_version=archivo_version)
+        app.extensions['report_cache'] = backend
+
+    @staticmethod
+    def backend():
+        return current_app.extensions.get('report_cache')
+
+    def _contar(self, metrica):
+        with self._lock:
+            self.metricas[metrica] += 1
+
+    def invalidar(self):
+        backend = self.backend()
+        if backend is not None:
+            backend.bump_version()
+            self._contar('invalidaciones')
+
+    def estadisticas(self):
+        backend = self.backend()
+        with self._lock:
+            datos = dict(self.metricas)
+        consultas = datos['hits'] + datos['misses']
+        datos['hit_ratio'] = round(datos['hits'] / consultas, 4) if consultas else None
+        if backend is not None:
+            datos['backend'] = backend.nombre
+            datos['version'] = backend.version()
+            if isinstance(backend, MemoryBackend):
+                datos['entradas'] = len(backend)
+        return datos
+
+    @staticmethod
+    def _alcance():
+        if current_user.rol == 'medico' and current_user.clinica_actual_id:
+            return f'clinica:{current_user.clinica_actual_id}'
+        return 'global'
+
+    def cached(self, view):
+        """Decorador para vistas JSON cuyo resultado depende solo del alcance y los datos."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = self.backend()
+            if backend is None:
+                return view(*args, **kwargs)
+
+            argumentos = ','.join(f'{k}={v}' for k, v in sorted(kwargs.items()))
+            clave = f'{request.endpoint}|{self._alcance()}|{argumentos}|{backend.version()}'
+            etag = hashlib.sha1(clave.encode('utf-8')).hexdigest()
+
+            if etag in request.if_none_match:
+                self._contar('not_modified')
+                respuesta = make_response('', 304)
+            else:
+                entrada = backend.get(clave)
+                if entrada is not None:
+                    self._contar('hits')
+                    respuesta = current_app.response_class(entrada['body'], mimetype=entrada['mimetype'])
+                else:
+                    self._contar('misses')
+                    respuesta = make_response(view(*args, **kwargs))
+                    datos = respuesta.get_json(silent=True) if respuesta.is_json else None
+                    # Solo se guardan respuestas exitosas
+                    if respuesta.status_code != 200 or not (isinstance(datos, dict) and datos.get('success')):
+                        return respuesta
+                    backend.set(clave, {'body': respuesta.get_data(), 'mimetype': respuesta.mimetype})
+                    self._contar('stores')
+
+            respuesta.set_etag(etag)
+            respuesta.headers['Cache-Control'] = 'private, no-cache'
+            return respuesta
+        return wrapper
+
+
+report_cache = ReportCache()
+
+
+# El flush solo anota el cambio; la versión se incrementa una vez, al confirmar
+# (lo que otra petición guarde en caché antes del commit queda con la versión vieja)
+@event.listens_for(Session, 'after_flush')
+def _anotar_cambio_reportes(session, flush_context):
+    if any(isinstance(obj, MODELOS_VIGILADOS) for obj in itertools.chain(session.new, session.dirty, session.deleted)):
+        session.info['report_cache_sucio'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_reportes_en_commit(session):
+    if session.info.pop('report_cache_sucio', False) and has_app_context():
+        report_cache.invalidar()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _invalidar_reportes_en_rollback(session):
+    # Un reporte leído por esta sesión entre el flush y el rollback pudo guardar
+    # en caché datos que no se confirmaron (los rollbacks son raros: se invalida)
+    if session.info.pop('report_cache_sucio', False) and has_app_context():
+        report_cache.invalidar()
@@ -0,0 +1,294 @@
+"""
+Estadísticas pre-agregadas por día y clínica para los reportes.
+
+- ``estadistica_diaria``: consultas por (fecha, clinica_id).
+- ``estadistica_diagnostico``: frecuencia de cada diagnóstico (texto en
+  minúsculas, sin espacios al inicio/fin) por (fecha, clinica_id).
+
+Las tablas se actualizan de forma incremental con eventos de SQLAlchemy cada vez
+que se crea, modifica (p. ej. al finalizar en ``guardar_consulta_completa``) o
+elimina una ``Consulta``, con un upsert atómico del motor (``ON CONFLICT`` en
+SQLite, ``ON DUPLICATE KEY UPDATE`` en MySQL): dos consultas simultáneas del
+mismo día y clínica no chocan con la clave única. ``flask rebuild-rollups`` las
+reconstruye desde cero (necesario tras cargas masivas que no pasan por el ORM).
+"""
+import weakref
+from collections import Counter, namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import event, inspect, select, update, insert, delete, func, case, and_
+from sqlalchemy.dialects import mysql, sqlite
+
+from app import db
+from app.models import Consulta, EstadisticaDiaria, EstadisticaDiagnostico
+
+CAMPOS_ROLLUP = ('clinica_id', 'fecha_consulta', 'diagnostico')
+LARGO_DIAGNOSTICO = 255
+BATCH_SIZE = 2000
+
+_Snapshot = namedtuple('_Snapshot', ('id',) + CAMPOS_ROLLUP)
+
+
+def normalizar_diagnostico(texto):
+    """Clave de agrupación de un diagnóstico (igual que los reportes: strip + lower)."""
+    if not texto:
+        return None
+    return texto.strip().lower()[:LARGO_DIAGNOSTICO] or None
+
+
+def _a_fecha(valor):
+    """``func.date`` devuelve texto en SQLite y ``date`` en MySQL."""
+    if valor is None or isinstance(valor, date) and not isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, datetime):
+        return valor.date()
+    return date.fromisoformat(str(valor)[:10])
+
+
+def _misma_clinica(columna, clinica_id):
+    return columna.is_(None) if clinica_id is None else columna == clinica_id
+
+
+class EstadisticasRollup:
+    """Mantenimiento y lectura de las tablas de rollup."""
+
+    def __init__(self):
+        # Motores cuyo rollup ya se verificó como inicializado
+        self._listos = weakref.WeakSet()
+        # Transacción en la que se reconstruyó -> id máximo de consulta incluido
+        self._reconstruido_en = weakref.WeakKeyDictionary()
+
+    # ----- Inicialización -----
+    def asegurar(self, connection=None, consulta_id=None) -> bool:
+        """Reconstruye el rollup si está vacío pero ya existen consultas.
+
+        Devuelve True si se reconstruyó (y por tanto ya incluye los cambios del flush
+        actual) o si la reconstrucción hecha antes en esta transacción ya incluye la
+        consulta ``consulta_id`` (varias consultas insertadas en el mismo flush).
+        """
+        engine = connection.engine if connection is not None else db.engine
+        if engine in self._listos:
+            return False
+        if connection is None:
+            with engine.begin() as conn:
+                reconstruido = self._asegurar(conn)
+            self._listos.add(engine)
+            return reconstruido
+        transaccion = connection.get_transaction()
+        incluido_hasta = self._reconstruido_en.get(transaccion)
+        if incluido_hasta is not None:
+            return consulta_id is not None and consulta_id <= incluido_hasta
+        reconstruido = self._asegurar(connection)
+        # Si se reconstruyó dentro de un flush, la transacción aún puede revertirse
+        if reconstruido:
+            self._reconstruido_en[transaccion] = connection.execute(select(func.max(Consulta.id))).scalar() or 0
+        else:
+            self._listos.add(engine)
+        return reconstruido
+
+    def _asegurar(self, connection) -> bool:
+        vacio = connection.execute(select(EstadisticaDiaria.id).limit(1)).first() is None
+        if vacio and connection.execute(select(Consulta.id).limit(1)).first() is not None:
+            self._reconstruir(connection)
+            return True
+        return False
+
+    # ----- Reconstrucción completa -----
+    def rebuild(self) -> int:
+        """Reconstruye ambas tablas desde ``consulta``. Devuelve el número de filas diarias."""
+        with db.engine.begin() as conn:
+            total = self._reconstruir(conn)
+        self._listos.add(db.engine)
+        return total
+
+    def _reconstruir(self, connection) -> int:
+        diaria = EstadisticaDiaria.__table__
+        diag_t = EstadisticaDiagnostico.__table__
+        connection.execute(delete(diag_t))
+        connection.execute(delete(diaria))
+
+        dia = func.date(Consulta.fecha_consulta)
+        valores = [
+            {'fecha': _a_fecha(fecha), 'clinica_id': clinica_id, 'total_consultas': total}
+            for fecha, clinica_id, total in connection.execute(
+                select(dia, Consulta.clinica_id, func.count(Consulta.id))
+                .where(Consulta.fecha_consulta.isnot(None))
+                .group_by(dia, Consulta.clinica_id)
+            )
+        ]
+
+        # Diagnósticos: la normalización se hace en Python (igual que en los eventos)
+        diagnosticos = Counter()
+        resultado = connection.execution_options(yield_per=BATCH_SIZE).execute(
+            select(Consulta.fecha_consulta, Consulta.clinica_id, Consulta.diagnostico)
+            .where(Consulta.fecha_consulta.isnot(None), Consulta.diagnostico.isnot(None))
+        )
+        for fecha_consulta, clinica_id, diagnostico in resultado:
+            clave = normalizar_diagnostico(diagnostico)
+            if clave:
+                diagnosticos[(fecha_consulta.date(), clinica_id, clave)] += 1
+
+        for i in range(0, len(valores), BATCH_SIZE):
+            connection.execute(insert(diaria), valores[i:i + BATCH_SIZE])
+        valores_diag = [
+            {'fecha': f, 'clinica_id': c, 'diagnostico': d, 'total': n}
+            for (f, c, d), n in diagnosticos.items()
+        ]
+        for i in range(0, len(valores_diag), BATCH_SIZE):
+            connection.execute(insert(diag_t), valores_diag[i:i + BATCH_SIZE])
+        return len(valores)
+
+    # ----- Actualización incremental -----
+    @staticmethod
+    def _upsert(connection, tabla, clave, columna, delta):
+        """Suma ``delta`` a ``columna`` en la fila ``clave`` (la crea si no existe) en una sola sentencia."""
+        fila = dict(clave, **{columna: delta})
+        dialecto = connection.dialect.name
+        if dialecto == 'sqlite':
+            sentencia = sqlite.insert(tabla).values(**fila)
+            sentencia = sentencia.on_conflict_do_update(
+                index_elements=list(clave), set_={columna: tabla.c[columna] + sentencia.excluded[columna]})
+        elif dialecto == 'mysql':
+            sentencia = mysql.insert(tabla).values(**fila)
+            sentencia = sentencia.on_duplicate_key_update({columna: tabla.c[columna] + sentencia.inserted[columna]})
+        else:
+            sentencia = None
+        # clinica_id NULL no choca con la clave única (NULL es distinto de NULL): se
+        # actualiza la fila existente y, si una carrera crea dos, los reportes suman ambas
+        if sentencia is not None and clave['clinica_id'] is not None:
+            connection.execute(sentencia)
+            return
+        condiciones = [_misma_clinica(tabla.c[col], valor) if col == 'clinica_id' else tabla.c[col] == valor
+                       for col, valor in clave.items()]
+        resultado = connection.execute(
+            update(tabla).where(*condiciones).values({columna: tabla.c[columna] + delta}))
+        if resultado.rowcount == 0:
+            connection.execute(insert(tabla).values(**fila))
+
+    def _sumar(self, connection, fecha, clinica_id, delta):
+        self._upsert(connection, EstadisticaDiaria.__table__,
+                     {'fecha': fecha, 'clinica_id': clinica_id}, 'total_consultas', delta)
+
+    def _sumar_diagnostico(self, connection, fecha, clinica_id, diagnostico, delta):
+        self._upsert(connection, EstadisticaDiagnostico.__table__,
+                     {'fecha': fecha, 'clinica_id': clinica_id, 'diagnostico': diagnostico}, 'total', delta)
+
+    def aplicar(self, connection, snap, signo):
+        """Suma (signo=1) o resta (signo=-1) una consulta de los contadores."""
+        if snap.fecha_consulta is None:
+            return
+        dia = snap.fecha_consulta.date()
+        self._sumar(connection, dia, snap.clinica_id, signo)
+        diagnostico = normalizar_diagnostico(snap.diagnostico)
+        if diagnostico:
+            self._sumar_diagnostico(connection, dia, snap.clinica_id, diagnostico, signo)
+
+    def actualizar(self, connection, anterior, actual):
+        """Ajusta los contadores cuando cambia una consulta existente."""
+        def _clave(s):
+            return (s.fecha_consulta.date() if s.fecha_consulta else None, s.clinica_id)
+        if _clave(anterior) != _clave(actual):
+            self.aplicar(connection, anterior, -1)
+            self.aplicar(connection, actual, 1)
+            return
+        if actual.fecha_consulta is None:
+            return
+        dia = actual.fecha_consulta.date()
+        diag_anterior = normalizar_diagnostico(anterior.diagnostico)
+        diag_actual = normalizar_diagnostico(actual.diagnostico)
+        if diag_anterior != diag_actual:
+            if diag_anterior:
+                self._sumar_diagnostico(connection, dia, actual.clinica_id, diag_anterior, -1)
+            if diag_actual:
+                self._sumar_diagnostico(connection, dia, actual.clinica_id, diag_actual, 1)
+
+    # ----- Lectura -----
+    def conteo_por_periodos(self, limites, clinica_id=None):
+        """Total de consultas y conteo por cada periodo [limites[i], limites[i+1]).
+
+        Un único SELECT agrupado por el índice de periodo. Devuelve (total, [conteos]).
+        """
+        self.asegurar()
+        limites = [_a_fecha(l) for l in limites]
+        periodo = case(
+            *[(and_(EstadisticaDiaria.fecha >= inicio, EstadisticaDiaria.fecha < fin), i)
+              for i, (inicio, fin) in enumerate(zip(limites, limites[1:]))],
+            else_=None
+        )
+        q = db.session.query(periodo, func.sum(EstadisticaDiaria.total_consultas)).group_by(periodo)
+        if clinica_id:
+            q = q.filter(EstadisticaDiaria.clinica_id == clinica_id)
+        conteos = {i: int(n or 0) for i, n in q.all()}
+        return sum(conteos.values()), [conteos.get(i, 0) for i in range(len(limites) - 1)]
+
+    def total_consultas(self, clinica_id=None, desde=None, hasta=None):
+        """Consultas en [desde, hasta) (fechas opcionales)."""
+        self.asegurar()
+        q = db.session.query(func.coalesce(func.sum(EstadisticaDiaria.total_consultas), 0))
+        if clinica_id:
+            q = q.filter(EstadisticaDiaria.clinica_id == clinica_id)
+        if desde is not None:
+            q = q.filter(EstadisticaDiaria.fecha >= _a_fecha(desde))
+        if hasta is not None:
+            q = q.filter(EstadisticaDiaria.fecha < _a_fecha(hasta))
+        return int(q.scalar() or 0)
+
+    def consultas_por_clinica(self):
+        """{clinica_id: total de consultas}."""
+        self.asegurar()
+        filas = db.session.query(EstadisticaDiaria.clinica_id, func.sum(EstadisticaDiaria.total_consultas)) \
+            .group_by(EstadisticaDiaria.clinica_id).all()
+        return {clinica_id: int(total or 0) for clinica_id, total in filas}
+
+    def diagnosticos_frecuentes(self, clinica_id=None, limite=15):
+        """[(diagnóstico normalizado, casos)] ordenado de mayor a menor."""
+        self.asegurar()
+        total = func.sum(EstadisticaDiagnostico.total)
+        q = db.session.query(EstadisticaDiagnostico.diagnostico, total) \
+            .group_by(EstadisticaDiagnostico.diagnostico) \
+            .having(total > 0)
+        if clinica_id:
+            q = q.filter(EstadisticaDiagnostico.clinica_id == clinica_id)
+        return [(d, int(n)) for d, n in q.order_by(total.desc(), EstadisticaDiagnostico.diagnostico).limit(limite).all()]
+
+
+rollups = EstadisticasRollup()
+
+
+def _snapshot(target):
+    return _Snapshot(target.id, *(getattr(target, campo) for campo in CAMPOS_ROLLUP))
+
+
+def _snapshot_guardado(connection, consulta_id):
+    """Valores actuales en la base (el historial del ORM no trae el valor previo
+    de atributos que estaban expirados al modificarse)."""
+    t = Consulta.__table__
+    fila = connection.execute(
+        select(*(t.c[campo] for campo in CAMPOS_ROLLUP)).where(t.c.id == consulta_id)
+    ).first()
+    return _Snapshot(consulta_id, *fila) if fila is not None else None
+
+
+@event.listens_for(Consulta, 'after_insert')
+def _rollup_consulta_nueva(mapper, connection, target):
+    if not rollups.asegurar(connection, target.id):
+        rollups.aplicar(connection, _snapshot(target), 1)
+
+
+@event.listens_for(Consulta, 'before_update')
+def _rollup_consulta_actualizada(mapper, connection, target):
+    estado = inspect(target)
+    if not any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_ROLLUP):
+        return
+    # Antes del UPDATE: una reconstrucción aquí refleja el estado anterior,
+    # así que el ajuste se aplica siempre
+    rollups.asegurar(connection)
+    anterior = _snapshot_guardado(connection, target.id)
+    if anterior is not None:
+        rollups.actualizar(connection, anterior, _snapshot(target))
+
+
+@event.listens_for(Consulta, 'after_delete')
+def _rollup_consulta_eliminada(mapper, connection, target):
+    if not rollups.asegurar(connection):
+        rollups.aplicar(connection, _snapshot(target), -1)
@@ -0,0 +1,262 @@
+"""
+Datos sintéticos a gran escala para pruebas de carga y benchmarks.
+
+``generar`` crea clínicas, un médico por clínica, pacientes, consultas y sus
+signos vitales con inserciones masivas (``insert()`` de Core en lotes), sin
+pasar por los eventos del ORM. Los ids se asignan aquí a partir del máximo
+actual de cada tabla, así que las consultas y los signos se enlazan sin
+consultar la BD y la carga se puede repetir sobre una base existente.
+
+Los datos son deterministas para una misma semilla, fecha final y base inicial:
+nombres y apellidos comunes en Guatemala, DPI de 13 dígitos, municipios de
+oriente, diagnósticos y motivos tomados de la taxonomía de reportes
+(``app/utils/clinical_text.py``) con una distribución sesgada (unos pocos
+diagnósticos concentran la mayoría de los casos, como en la práctica) y fechas
+repartidas en los últimos años.
+
+Como las inserciones no disparan los eventos del ORM, después de cargar hay que
+reconstruir las tablas derivadas (rollups, índice de búsqueda, etiquetas); el
+comando ``flask seed-synthetic`` lo hace al terminar.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import Clinica, Consulta, Paciente, SignosVitales, Usuario
+from app.utils.clinical_text import GENERAL, TAXONOMIA
+
+BATCH_SIZE = 5000
+
+NOMBRES_MASCULINOS = [
+    'José', 'Juan', 'Luis', 'Carlos', 'Jorge', 'Mario', 'Pedro', 'Miguel', 'Francisco', 'Manuel', 'Antonio',
+    'Marvin', 'Edgar', 'Erick', 'Byron', 'Óscar', 'Julio', 'Hugo', 'Selvin', 'Walter', 'Fernando', 'Kevin',
+    'Cristian', 'Diego', 'Santiago', 'Mateo', 'Alejandro', 'Rony', 'Otto', 'Estuardo',
+]
+NOMBRES_FEMENINOS = [
+    'María', 'Ana', 'Rosa', 'Carmen', 'Marta', 'Gloria', 'Sandra', 'Karla', 'Claudia', 'Lucía', 'Sofía',
+    'Andrea', 'Paola', 'Jennifer', 'Heidy', 'Mayra', 'Brenda', 'Wendy', 'Elena', 'Julia', 'Dulce', 'Silvia',
+    'Alejandra', 'Fernanda', 'Valeria', 'Isabel', 'Patricia', 'Yesenia', 'Marleny', 'Olga',
+]
+APELLIDOS = [
+    'López', 'García', 'Pérez', 'Hernández', 'Martínez', 'González', 'Rodríguez', 'Ramírez', 'Morales',
+    'Castillo', 'Cruz', 'Reyes', 'Mejía', 'Juárez', 'Ramos', 'Méndez', 'Orellana', 'Portillo', 'Lemus',
+    'Guerra', 'Sagastume', 'Vásquez', 'Aldana', 'Cardona', 'Interiano', 'Villeda', 'Paz', 'Súchite',
+    'Ortiz', 'Flores', 'Chacón', 'Linares', 'Roldán', 'Espino', 'Peralta',
+]
+# (municipio, código de departamento y municipio para el DPI)
+MUNICIPIOS = [
+    ('Chiquimula', '2001'), ('Jocotán', '2002'), ('Esquipulas', '2007'), ('Camotán', '2003'),
+    ('Quezaltepeque', '2008'), ('Olopa', '2004'), ('Ipala', '2010'), ('San Juan Ermita', '2005'),
+    ('Concepción Las Minas', '2006'), ('San Jacinto', '2009'), ('San José La Arada', '2011'),
+    ('Zacapa', '1901'), ('Jalapa', '2101'), ('Jutiapa', '2201'),
+]
+ESTADOS_CIVILES = ['Soltero(a)', 'Casado(a)', 'Unido(a)', 'Viudo(a)', 'Divorciado(a)']
+RELIGIONES = ['Católica', 'Evangélica', 'Ninguna', 'Otra']
+ESCOLARIDAD = ['Ninguna', 'Primaria', 'Básicos', 'Diversificado', 'Universitaria']
+OCUPACIONES = ['Agricultor', 'Ama de casa', 'Estudiante', 'Comerciante', 'Maestro(a)', 'Albañil',
+               'Jornalero', 'Enfermero(a)', 'Piloto', 'Desempleado(a)']
+TIPOS_CONSULTA = ['Primera consulta', 'Seguimiento', 'Medicamento']
+TRATAMIENTOS = [
+    'Acetaminofén 500 mg c/8h por 5 días', 'Ibuprofeno 400 mg c/8h por 3 días',
+    'Amoxicilina 500 mg c/8h por 7 días', 'Omeprazol 20 mg c/24h por 14 días',
+    'Losartán 50 mg c/24h', 'Metformina 850 mg c/12h', 'Loratadina 10 mg c/24h por 5 días',
+    'Salbutamol inhalador 2 puffs c/6h', 'Hidratación oral y dieta blanda',
+]
+
+
+def _catalogo_diagnosticos():
+    """[(diagnóstico, motivo)] a partir de las subcategorías y palabras clave de ``TAXONOMIA``."""
+    catalogo = []
+    for sistema, subcategorias in TAXONOMIA.items():
+        for subcategoria, palabras in subcategorias.items():
+            if subcategoria is GENERAL:
+                continue
+            diagnostico = subcategoria[0].upper() + subcategoria[1:]
+            catalogo.append((diagnostico, f'Paciente refiere {palabras[0]}'))
+        generales = subcategorias.get(GENERAL) or []
+        if generales:
+            catalogo.append((f'Problema {sistema.lower()} ({generales[0]})', f'Consulta por {generales[-1]}'))
+    return catalogo
+
+
+def _max_id(modelo):
+    return db.session.execute(select(func.max(modelo.id))).scalar() or 0
+
+
+def _insertar(tabla, filas):
+    with db.engine.begin() as conn:
+        for i in range(0, len(filas), BATCH_SIZE):
+            conn.execute(insert(tabla), filas[i:i + BATCH_SIZE])
+
+
+class GeneradorSintetico:
+    """Genera las filas de forma determinista a partir de ``semilla``."""
+
+    def __init__(self, semilla=42, anios=3, hoy=None):
+        self.rnd = random.Random(semilla)
+        self.anios = anios
+        # Fecha final de los datos (por defecto hoy a las 17:00): con la misma
+        # semilla y la misma fecha final se generan exactamente las mismas filas
+        self.hoy = datetime.combine(hoy or date.today(), datetime.min.time()) + timedelta(hours=17)
+        self.diagnosticos = _catalogo_diagnosticos()
+        # Distribución tipo Zipf: el diagnóstico i tiene peso 1 / (i + 1)
+        self.rnd.shuffle(self.diagnosticos)
+        self._pesos_diagnostico = []
+        acumulado = 0.0
+        for i in range(len(self.diagnosticos)):
+            acumulado += 1.0 / (i + 1)
+            self._pesos_diagnostico.append(acumulado)
+
+    def paciente(self, paciente_id):
+        rnd = self.rnd
+        masculino = rnd.random() < 0.45
+        nombre = rnd.choice(NOMBRES_MASCULINOS if masculino else NOMBRES_FEMENINOS)
+        if rnd.random() < 0.5:
+            nombre += ' ' + rnd.choice(NOMBRES_MASCULINOS if masculino else NOMBRES_FEMENINOS)
+        municipio, codigo = rnd.choice(MUNICIPIOS)
+        edad = min(int(rnd.expovariate(1 / 28)), 99)
+        nacimiento = (self.hoy - timedelta(days=edad * 365 + rnd.randint(0, 364))).date()
+        registro = self.hoy - timedelta(days=rnd.randint(0, self.anios * 365))
+        return {
+            'id': paciente_id,
+            'nombre_completo': f'{nombre} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}',
+            'edad': edad,
+            'sexo': 'Masculino' if masculino else 'Femenino',
+            'expediente': True,
+            'direccion': f'Barrio {rnd.choice(APELLIDOS)}, {municipio}',
+            'telefono': f'{rnd.choice("345")}{rnd.randint(0, 9999999):07d}',
+            # CUI: 8 dígitos correlativos + verificador + departamento/municipio (único por id)
+            'dni': f'{paciente_id:08d}{rnd.randint(0, 9)}{codigo}',
+            'fecha_nacimiento': nacimiento,
+            'fecha_registro': registro,
+            'estado_civil': rnd.choice(ESTADOS_CIVILES) if edad >= 18 else 'Soltero(a)',
+            'religion': rnd.choice(RELIGIONES),
+            'escolaridad': rnd.choice(ESCOLARIDAD),
+            'ocupacion': rnd.choice(OCUPACIONES) if edad >= 15 else 'Estudiante',
+            'procedencia': municipio,
+            'numero_expediente': f'EXP-{paciente_id:07d}',
+        }
+
+    def consultas(self, paciente, consulta_id, n, clinicas, medicos):
+        """[(consulta, signos)] del paciente, en orden cronológico."""
+        rnd = self.rnd
+        casa = rnd.randrange(len(clinicas))
+        dias = sorted(rnd.randint(0, self.anios * 365) for _ in range(n))
+        filas = []
+        for i, dias_atras in enumerate(reversed(dias)):
+            indice = casa if rnd.random() < 0.9 else rnd.randrange(len(clinicas))
+            fecha = self.hoy - timedelta(days=dias_atras, minutes=rnd.randint(0, 9 * 60))
+            diagnostico, motivo = rnd.choices(self.diagnosticos, cum_weights=self._pesos_diagnostico)[0]
+            sistolica, diastolica = rnd.randint(95, 165), rnd.randint(60, 100)
+            temperatura = round(rnd.gauss(36.9, 0.5), 1)
+            fc, fr, sat = rnd.randint(58, 110), rnd.randint(12, 24), rnd.randint(90, 99)
+            peso = round(max(3.0, rnd.gauss(62 if paciente['edad'] >= 15 else 20, 12)), 1)
+            talla = rnd.randint(150, 180) if paciente['edad'] >= 15 else rnd.randint(55, 150)
+            ultima = dias_atras == dias[0] and rnd.random() < 0.05
+            consulta = {
+                'id': consulta_id + i,
+                'paciente_id': paciente['id'],
+                'tipo_consulta': TIPOS_CONSULTA[0] if i == 0 else rnd.choice(TIPOS_CONSULTA[1:]),
+                'clinica_id': clinicas[indice],
+                'medico_id': medicos[indice],
+                'fecha_consulta': fecha,
+                'estado': 'en_progreso' if ultima else 'completada',
+                'motivo_consulta': motivo,
+                'historia_enfermedad': f'{motivo} desde hace {rnd.randint(1, 15)} días.',
+                'presion_arterial': f'{sistolica}/{diastolica}',
+                'frecuencia_respiratoria': str(fr),
+                'temperatura': str(temperatura),
+                'peso': str(peso),
+                'talla': str(talla),
+                'frecuencia_cardiaca': str(fc),
+                'saturacion_oxigeno': str(sat),
+                'imc': f'{peso / (talla / 100) ** 2:.1f}',
+                'diagnostico': diagnostico,
+                'tratamiento': rnd.choice(TRATAMIENTOS),
+                'indicaciones': 'Control en 15 días o antes si hay signos de alarma.',
+            }
+            signos = {
+                'consulta_id': consulta['id'],
+                'paciente_id': paciente['id'],
+                'presion_arterial': consulta['presion_arterial'],
+                'frecuencia_cardiaca': fc,
+                'frecuencia_respiratoria': fr,
+                'temperatura': temperatura,
+                'saturacion': sat,
+                'glucosa': rnd.randint(70, 180),
+                'fecha_registro': fecha,
+            }
+            filas.append((consulta, signos))
+        return filas
+
+
+def generar(pacientes, consultas_por_paciente, clinicas, semilla=42, anios=3, hoy=None, progreso=None):
+    """Carga el conjunto sintético. Devuelve los conteos y el primer id de consulta creado."""
+    generador = GeneradorSintetico(semilla, anios, hoy)
+    password_hash = generate_password_hash(f'sintetico-{semilla}')  # un solo hash para todos los médicos
+
+    primer_clinica = _max_id(Clinica) + 1
+    primer_medico = _max_id(Usuario) + 1
+    ids_clinicas = list(range(primer_clinica, primer_clinica + clinicas))
+    ids_medicos = list(range(primer_medico, primer_medico + clinicas))
+    _insertar(Clinica.__table__, [
+        {'id': cid, 'nombre': f'Clínica sintética {cid}', 'disponible': True} for cid in ids_clinicas
+    ])
+    _insertar(Usuario.__table__, [
+        {'id': uid, 'nombre_completo': f'Dr(a). Sintético {uid}', 'usuario': f'sintetico{uid}',
+         'email': None, 'password_hash': password_hash, 'fecha_registro': generador.hoy, 'activo': True,
+         'rol': 'medico', 'clinica_actual_id': cid}
+        for uid, cid in zip(ids_medicos, ids_clinicas)
+    ])
+
+    siguiente_paciente = _max_id(Paciente) + 1
+    siguiente_consulta = primer_consulta = _max_id(Consulta) + 1
+    siguiente_signos = _max_id(SignosVitales) + 1
+    totales = {'clinicas': clinicas, 'medicos': clinicas, 'pacientes': 0, 'consultas': 0}
+    # Se genera y se inserta por bloques de pacientes para no tener todo en memoria
+    bloque = max(1, BATCH_SIZE // max(1, consultas_por_paciente))
+    for inicio in range(0, pacientes, bloque):
+        filas_pacientes, filas_consultas, filas_signos = [], [], []
+        for _ in range(min(bloque, pacientes - inicio)):
+            paciente = generador.paciente(siguiente_paciente)
+            filas_pacientes.append(paciente)
+            for consulta, signos in generador.consultas(paciente, siguiente_consulta, consultas_por_paciente,
+                                                        ids_clinicas, ids_medicos):
+                signos['id'] = siguiente_signos
+                siguiente_signos += 1
+                filas_consultas.append(consulta)
+                filas_signos.append(signos)
+            siguiente_paciente += 1
+            siguiente_consulta += consultas_por_paciente
+        with db.engine.begin() as conn:
+            conn.execute(insert(Paciente.__table__), filas_pacientes)
+            for i in range(0, len(filas_consultas), BATCH_SIZE):
+                conn.execute(insert(Consulta.__table__), filas_consultas[i:i + BATCH_SIZE])
+                conn.execute(insert(SignosVitales.__table__), filas_signos[i:i + BATCH_SIZE])
+        totales['pacientes'] += len(filas_pacientes)
+        totales['consultas'] += len(filas_consultas)
+        if progreso:
+            progreso(totales['pacientes'], totales['consultas'])
+    totales['primer_consulta_id'] = primer_consulta
+    return totales
+
+
+def reconstruir_derivados(primer_consulta_id=1):
+    """Rollups, índice de búsqueda y etiquetas de las consultas cargadas; invalida los reportes cacheados.
+
+    La caché de PDF no necesita nada: sus claves dependen del contenido.
+    """
+    from app.utils.consulta_tags import tag_backfill
+    from app.utils.patient_search import patient_search
+    from app.utils.report_cache import report_cache
+    from app.utils.rollups import rollups
+    resultado = {
+        'filas_rollup': rollups.rebuild(),
+        'pacientes_indexados': patient_search.rebuild(),
+        'consultas_etiquetadas': tag_backfill.ejecutar(desde_id=primer_consulta_id - 1),
+    }
+    report_cache.invalidar()
+    return resultado
@@ -0,0 +1,83 @@
+"""
+Servidor WSGI de producción para ``flask serve``.
+
+- ``gunicorn`` (Linux/macOS): ``WSGI_WORKERS`` procesos con ``WSGI_THREADS``
+  hilos cada uno (worker ``gthread``). Cada proceso crea su propia app y su
+  propio pool de conexiones después del fork.
+- ``waitress`` (también en Windows): un proceso con ``WSGI_THREADS`` hilos.
+
+``auto`` usa gunicorn si está instalado y no es Windows; si no, waitress.
+
+Lo que vive en memoria del proceso no se comparte entre workers de gunicorn.
+``multiproceso(config)`` indica si puede haber varios procesos sirviendo: bajo
+gunicorn siempre (``-w`` o ``TTIN`` agregan workers) o si ``WSGI_MULTIPROCESS``
+lo declara (otros servidores). ``create_app`` lo usa para elegir almacenes
+compartidos, también con ``gunicorn wsgi:app`` fuera de ``flask serve``.
+"""
+import os
+import sys
+
+from app.utils.lazy import disponible
+
+SERVIDORES = ('gunicorn', 'waitress')
+
+
+def elegir(nombre='auto'):
+    """Nombre del servidor a usar; RuntimeError si no está instalado."""
+    if nombre == 'auto':
+        if sys.platform != 'win32' and disponible('gunicorn'):
+            return 'gunicorn'
+        if disponible('waitress'):
+            return 'waitress'
+        raise RuntimeError('No hay servidor de producción instalado: pip install gunicorn (o waitress en Windows)')
+    if nombre not in SERVIDORES:
+        raise RuntimeError(f'Servidor no soportado: {nombre}')
+    if not disponible(nombre):
+        raise RuntimeError(f'{nombre} no está instalado: pip install {nombre}')
+    return nombre
+
+
+def multiproceso(config):
+    """True si la app puede estar servida por más de un proceso a la vez."""
+    if config.get('WSGI_MULTIPROCESS'):
+        return True
+    # El árbitro de gunicorn define SERVER_SOFTWARE antes de crear los workers
+    return os.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn/')
+
+
+def servir(app, servidor, host, port, workers, threads, timeout):
+    """Bloquea sirviendo la aplicación hasta que se detenga el servidor."""
+    if servidor == 'gunicorn':
+        _servir_gunicorn(host, port, workers, threads, timeout)
+    else:
+        _servir_waitress(app, host, port, threads, timeout)
+
+
+def _servir_gunicorn(host, port, workers, threads, timeout):
+    from gunicorn.app.base import BaseApplication
+
+    opciones = {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'timeout': timeout,
+        'accesslog': '-',
+    }
+
+    class Aplicacion(BaseApplication):
+        def load_config(self):
+            for clave, valor in opciones.items():
+                self.cfg.set(clave, valor)
+
+        def load(self):
+            # Se ejecuta en cada worker: app, engine y pools propios del proceso
+            from app import create_app
+            return create_app()
+
+    Aplicacion().run()
+
+
+def _servir_waitress(app, host, port, threads, timeout):
+    from waitress import serve
+    serve(app, host=host, port=port, threads=threads, channel_timeout=timeout)
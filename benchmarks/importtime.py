@@ -0,0 +1,117 @@
+"""
+Tiempo de arranque de la app medido con ``python -X importtime``.
+
+Importa ``app`` y llama a ``create_app()`` varias veces, cada vez en un proceso
+nuevo, e informa la mediana del tiempo total y los paquetes que más tardan en
+importarse. Termina con código 1 si se supera el presupuesto de arranque o si
+al crear la app se cargó alguna librería que debe importarse bajo demanda
+(ReportLab, matplotlib, PIL, numpy; ver app/utils/lazy.py).
+
+Uso::
+
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --budget-ms 800 --top 20 --json arranque.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Presupuesto de create_app() (import incluido) en milisegundos
+PRESUPUESTO_MS = float(os.environ.get('STARTUP_BUDGET_MS', '1000'))
+# Paquetes que no deben cargarse solo por crear la app
+PROHIBIDOS = ('matplotlib', 'reportlab', 'PIL', 'numpy')
+
+CODIGO = (
+    "import json, sys, time\n"
+    "inicio = time.perf_counter()\n"
+    "from app import create_app\n"
+    "create_app()\n"
+    "print(json.dumps({'ms': (time.perf_counter() - inicio) * 1000, 'modulos': sorted(sys.modules)}))\n"
+)
+
+
+def _parsear_importtime(stderr):
+    """[(módulo, propio_us, acumulado_us)] de la salida de ``-X importtime``."""
+    filas = []
+    for linea in stderr.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        propio, acumulado, modulo = linea.split(':', 1)[1].split('|')
+        filas.append((modulo.strip(), int(propio), int(acumulado)))
+    return filas
+
+
+def ejecutar():
+    """Un arranque en un proceso nuevo: {'ms', 'modulos', 'importtime'}."""
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CODIGO],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=False
+    )
+    if proceso.returncode != 0:
+        sys.stderr.write(proceso.stderr[-4000:])
+        raise SystemExit(f'create_app() falló (código {proceso.returncode})')
+    datos = json.loads(proceso.stdout.strip().splitlines()[-1])
+    datos['importtime'] = _parsear_importtime(proceso.stderr)
+    return datos
+
+
+def por_paquete(filas):
+    """Tiempo propio de importación sumado por paquete de primer nivel (ms), de mayor a menor."""
+    totales = {}
+    for modulo, propio, _ in filas:
+        paquete = modulo.split('.')[0]
+        totales[paquete] = totales.get(paquete, 0) + propio
+    return sorted(((p, us / 1000) for p, us in totales.items()), key=lambda x: -x[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Presupuesto de tiempo de arranque de create_app()')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Arranques medidos (se usa la mediana)')
+    parser.add_argument('--budget-ms', type=float, default=PRESUPUESTO_MS,
+                        help='Presupuesto en ms (por defecto STARTUP_BUDGET_MS o %(default)s)')
+    parser.add_argument('--top', type=int, default=10, help='Paquetes a listar')
+    parser.add_argument('--json', dest='salida_json', default=None, help='Guardar el resultado en este archivo')
+    args = parser.parse_args(argv)
+
+    corridas = [ejecutar() for _ in range(max(args.repeticiones, 1))]
+    tiempos = sorted(c['ms'] for c in corridas)
+    mediana = statistics.median(tiempos)
+    referencia = min(corridas, key=lambda c: abs(c['ms'] - mediana))
+    paquetes = por_paquete(referencia['importtime'])
+    cargados = [p for p in PROHIBIDOS if p in referencia['modulos']]
+
+    print(f"create_app(): mediana {mediana:.1f} ms (mín {tiempos[0]:.1f}, máx {tiempos[-1]:.1f}) "
+          f"presupuesto {args.budget_ms:.0f} ms")
+    print(f"Módulos cargados: {len(referencia['modulos'])}")
+    for paquete, ms in paquetes[:args.top]:
+        print(f"  {ms:8.1f} ms  {paquete}")
+
+    fallas = []
+    if mediana > args.budget_ms:
+        fallas.append(f'arranque de {mediana:.1f} ms supera el presupuesto de {args.budget_ms:.0f} ms')
+    if cargados:
+        fallas.append(f"create_app() importó librerías de carga diferida: {', '.join(cargados)}")
+
+    if args.salida_json:
+        Path(args.salida_json).write_text(json.dumps({
+            'mediana_ms': mediana,
+            'tiempos_ms': tiempos,
+            'presupuesto_ms': args.budget_ms,
+            'paquetes_ms': dict(paquetes),
+            'prohibidos_cargados': cargados,
+            'fallas': fallas,
+        }, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    for falla in fallas:
+        print(f"FALLA: {falla}")
+    return 1 if fallas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
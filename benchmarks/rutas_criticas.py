@@ -0,0 +1,390 @@
+"""
+Benchmark de extremo a extremo de las rutas críticas de recepción, consulta y reportes.
+
+Trabaja sobre una copia de una base SQLite con datos sintéticos (``flask
+seed-synthetic``), o genera una temporal, y mide con el cliente de pruebas de
+Flask:
+
+- búsqueda de pacientes (``/api/buscar_pacientes``),
+- ``nueva_consulta_ajax``,
+- ``guardar_todo`` sin y con ``finalizar``,
+- cada endpoint ``/api/reportes/*`` que usa el panel (estadísticas, enfermedades,
+  sistemas, detalle por sistema, gráficos),
+- ``descargar_historial_pdf`` y ``exportar_reportes_pdf``.
+
+Por escenario informa latencia p50/p95/p99, número de sentencias SQL por
+petición y el pico de memoria asignada durante una petición (tracemalloc, en una
+pasada aparte para no alterar los tiempos). El resultado se guarda en JSON; con
+``--comparar`` se contrasta con una corrida anterior y se termina con código 1
+si algún escenario empeora más que ``--umbral`` o hace más consultas SQL.
+
+Por defecto las cachés de reportes y gráficos se vacían en cada petición (se
+mide el cálculo completo); ``--cache-caliente`` mide el estado estable.
+
+Uso::
+
+    flask --app run seed-synthetic --patients 50000 --consultas-per-patient 5   # una vez
+    python benchmarks/rutas_criticas.py --db ~/ClinicaData/clinica.db --json base.json
+    python benchmarks/rutas_criticas.py --db ~/ClinicaData/clinica.db --comparar base.json
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config import Config  # noqa: E402
+
+TERMINOS_BUSQUEDA = ['mar', 'jose', 'lópez', 'garc', 'ana mor', 'carlos', 'sofía', 'pérez r', '0000']
+SISTEMAS_DETALLE = ['Respiratorio', 'Gastrointestinal', 'Cardiovascular', 'Neurológico']
+
+
+# ----- Escenarios -----
+# Cada escenario recibe el contexto y el número de iteración y devuelve
+# (método, url, kwargs); ``preparar`` (opcional) se ejecuta fuera del tiempo medido.
+
+def _paciente(ctx, i):
+    return ctx['pacientes'][i % len(ctx['pacientes'])]
+
+
+def _consulta_en_progreso(ctx, i):
+    """Crea (o reutiliza) una consulta en progreso con nueva_consulta_ajax, fuera de la medición."""
+    respuesta = ctx['cliente'].post(f'/consulta/nueva_ajax/{_paciente(ctx, i + 7919)}', json={})
+    return respuesta.get_json()['consulta']['id']
+
+
+def _payload_guardar(i, finalizar):
+    datos = {
+        'motivo_consulta': f'Dolor de cabeza y tos desde hace {i % 10 + 1} días',
+        'historia_enfermedad': 'Inicio progresivo, sin fiebre.',
+        'revision_sistemas': 'Sin otros hallazgos.',
+        'diagnostico': ['Cefalea tensional', 'Resfriado común', 'Gastritis'][i % 3],
+        'laboratorio': '',
+        'medicamento': 'Acetaminofén 500 mg',
+        'dosificacion': '1 tableta cada 8 horas por 3 días',
+        'indicaciones': 'Hidratación y reposo.',
+    }
+    if finalizar:
+        datos['finalizar'] = True
+    return datos
+
+
+ESCENARIOS = {
+    'buscar_pacientes': {
+        'peticion': lambda ctx, i, _: ('get', f'/api/buscar_pacientes?q={TERMINOS_BUSQUEDA[i % len(TERMINOS_BUSQUEDA)]}', {}),
+    },
+    'nueva_consulta_ajax': {
+        'peticion': lambda ctx, i, _: ('post', f'/consulta/nueva_ajax/{_paciente(ctx, i)}', {'json': {}}),
+    },
+    'guardar_todo': {
+        'preparar': _consulta_en_progreso,
+        'peticion': lambda ctx, i, consulta_id: ('post', f'/consulta/{consulta_id}/guardar_todo',
+                                                 {'json': _payload_guardar(i, False)}),
+    },
+    'guardar_todo_finalizar': {
+        'preparar': _consulta_en_progreso,
+        'peticion': lambda ctx, i, consulta_id: ('post', f'/consulta/{consulta_id}/guardar_todo',
+                                                 {'json': _payload_guardar(i, True)}),
+    },
+    'reportes_estadisticas_generales': {
+        'peticion': lambda ctx, i, _: ('get', '/api/reportes/estadisticas_generales', {}),
+    },
+    'reportes_enfermedades_comunes': {
+        'peticion': lambda ctx, i, _: ('get', '/api/reportes/enfermedades_comunes', {}),
+    },
+    'reportes_problemas_por_sistemas': {
+        'peticion': lambda ctx, i, _: ('get', '/api/reportes/problemas_por_sistemas', {}),
+    },
+    'reportes_sistema_detalle': {
+        'peticion': lambda ctx, i, _: ('get', f'/api/reportes/sistema_detalle/{SISTEMAS_DETALLE[i % len(SISTEMAS_DETALLE)]}', {}),
+    },
+    'reportes_grafico': {
+        'peticion': lambda ctx, i, _: ('get', f"/api/reportes/grafico/{ctx['graficos'][i % len(ctx['graficos'])]}.png", {}),
+    },
+    'descargar_historial_pdf': {
+        'peticion': lambda ctx, i, _: ('get', f'/descargar_historial_pdf/{_paciente(ctx, i)}', {}),
+        'factor': 0.3,
+    },
+    'exportar_reportes_pdf': {
+        'peticion': lambda ctx, i, _: ('get', '/exportar_reportes_pdf', {}),
+        'factor': 0.2,
+    },
+}
+
+
+# ----- Preparación -----
+
+def _copiar_sqlite(origen, destino):
+    fuente = sqlite3.connect(f'file:{origen}?mode=ro', uri=True)
+    try:
+        copia = sqlite3.connect(str(destino))
+        try:
+            fuente.backup(copia)
+        finally:
+            copia.close()
+    finally:
+        fuente.close()
+
+
+def crear_app(directorio, ruta_db, cache_caliente):
+    from app import create_app
+
+    class ConfigBenchmark(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{ruta_db}'
+        WTF_CSRF_ENABLED = False
+        TESTING = True
+        REPORT_CACHE_BACKEND = 'memory' if cache_caliente else 'null'
+        PDF_CACHE_DIR = str(directorio / 'pdf_cache')
+        PDF_JOBS_DIR = str(directorio / 'pdf_jobs')
+        BACKUP_DIR = str(directorio / 'backups')
+
+    return create_app(ConfigBenchmark)
+
+
+def preparar_base(app, args):
+    """Genera datos sintéticos si la base está vacía y elige el usuario y los pacientes de prueba."""
+    from sqlalchemy import func, select
+    from app import db
+    from app.models import Consulta, Paciente, Usuario
+    from app.utils import synthetic
+    from app.utils.charts import charts
+    with app.app_context():
+        db.create_all()
+        if db.session.execute(select(func.count(Consulta.id))).scalar() == 0:
+            print(f"Generando {args.pacientes} pacientes x {args.consultas_por_paciente} consultas...")
+            resultado = synthetic.generar(args.pacientes, args.consultas_por_paciente, args.clinicas,
+                                          semilla=args.semilla)
+            synthetic.reconstruir_derivados(resultado['primer_consulta_id'])
+
+        usuario = None
+        if args.rol == 'medico':
+            usuario = Usuario.query.filter(Usuario.rol == 'medico', Usuario.clinica_actual_id.isnot(None)) \
+                .order_by(Usuario.id).first()
+        if usuario is None:
+            usuario = Usuario.query.filter_by(rol='admin').order_by(Usuario.id).first()
+        if usuario is None:
+            usuario = Usuario(nombre_completo='Benchmark', usuario='benchmark', rol='admin')
+            usuario.set_password('benchmark')
+            db.session.add(usuario)
+            db.session.commit()
+
+        consulta_q = select(Consulta.paciente_id).where(Consulta.paciente_id.isnot(None))
+        if usuario.rol == 'medico':
+            # Sin consultas en progreso de otra clínica: nueva_consulta_ajax las reutilizaría
+            # y guardar_todo respondería 403 al médico
+            en_otra_clinica = select(Consulta.paciente_id).where(
+                Consulta.estado == 'en_progreso', Consulta.clinica_id != usuario.clinica_actual_id)
+            consulta_q = consulta_q.where(Consulta.clinica_id == usuario.clinica_actual_id,
+                                          Consulta.paciente_id.not_in(en_otra_clinica))
+        candidatos = [fila[0] for fila in db.session.execute(consulta_q.distinct().limit(5000))]
+        rnd = random.Random(args.semilla)
+        rnd.shuffle(candidatos)
+        return {
+            'usuario_id': usuario.id,
+            'rol': usuario.rol,
+            'pacientes': candidatos[:500],
+            'graficos': charts.tipos,
+            'totales': {
+                'pacientes': db.session.execute(select(func.count(Paciente.id))).scalar(),
+                'consultas': db.session.execute(select(func.count(Consulta.id))).scalar(),
+            },
+        }
+
+
+# ----- Medición -----
+
+class ContadorSQL:
+    def __init__(self, engines):
+        from sqlalchemy import event
+        self.total = 0
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._contar)
+
+    def _contar(self, *_args):
+        self.total += 1
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por rango más cercano."""
+    if not valores_ordenados:
+        return None
+    indice = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
+
+
+def medir(app, ctx, nombre, iteraciones, calentamiento, cache_caliente, contador):
+    from app.utils.charts import charts
+    from app.utils.report_cache import report_cache
+    escenario = ESCENARIOS[nombre]
+    n = max(3, int(iteraciones * escenario.get('factor', 1.0)))
+    cliente = ctx['cliente']
+
+    def una(i, trazar=False):
+        preparado = escenario['preparar'](ctx, i) if 'preparar' in escenario else None
+        metodo, url, kwargs = escenario['peticion'](ctx, i, preparado)
+        if not cache_caliente:
+            charts.limpiar()
+            with app.app_context():  # se cierra antes de la petición (que abre el suyo)
+                report_cache.invalidar()
+        contador.total = 0
+        if trazar:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        inicio = time.perf_counter()
+        respuesta = getattr(cliente, metodo)(url, **kwargs)
+        respuesta.get_data()
+        duracion = time.perf_counter() - inicio
+        pico = tracemalloc.get_traced_memory()[1] if trazar else None
+        if trazar:
+            tracemalloc.stop()
+        return duracion, contador.total, respuesta.status_code, pico
+
+    for i in range(calentamiento):
+        una(i)
+    tiempos, consultas_sql, errores = [], [], []
+    for i in range(calentamiento, calentamiento + n):
+        duracion, sql, estado, _ = una(i)
+        tiempos.append(duracion * 1000)
+        consultas_sql.append(sql)
+        if estado >= 400:
+            errores.append(estado)
+    _, _, _, pico = una(calentamiento + n, trazar=True)
+
+    tiempos.sort()
+    return {
+        'n': n,
+        'p50_ms': round(percentil(tiempos, 50), 2),
+        'p95_ms': round(percentil(tiempos, 95), 2),
+        'p99_ms': round(percentil(tiempos, 99), 2),
+        'media_ms': round(statistics.fmean(tiempos), 2),
+        'min_ms': round(tiempos[0], 2),
+        'max_ms': round(tiempos[-1], 2),
+        'consultas_sql': int(statistics.median(consultas_sql)),
+        'consultas_sql_max': max(consultas_sql),
+        'memoria_pico_kb': round(pico / 1024, 1),
+        'errores': len(errores),
+        'estados_error': sorted(set(errores)),
+    }
+
+
+# ----- Comparación -----
+
+def comparar(actual, anterior, umbral, piso_ms):
+    """Lista de regresiones de ``actual`` respecto de ``anterior``."""
+    regresiones = []
+    for nombre, datos in actual['escenarios'].items():
+        base = anterior.get('escenarios', {}).get(nombre)
+        if not base:
+            continue
+        for metrica in ('p50_ms', 'p95_ms'):
+            limite = base[metrica] * (1 + umbral)
+            if datos[metrica] > limite and datos[metrica] - base[metrica] > piso_ms:
+                regresiones.append(f"{nombre}: {metrica} {base[metrica]:.1f} -> {datos[metrica]:.1f} ms "
+                                   f"(+{(datos[metrica] / base[metrica] - 1) * 100:.0f}%)")
+        if datos['consultas_sql'] > base['consultas_sql']:
+            regresiones.append(f"{nombre}: consultas SQL {base['consultas_sql']} -> {datos['consultas_sql']}")
+    return regresiones
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de las rutas críticas con el cliente de pruebas')
+    parser.add_argument('--db', default=None, help='Base SQLite con datos (se usa una copia); por defecto se genera')
+    parser.add_argument('--pacientes', type=int, default=2000, help='Pacientes a generar si no se indica --db')
+    parser.add_argument('--consultas-por-paciente', type=int, default=5)
+    parser.add_argument('--clinicas', type=int, default=3)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--escenario', dest='escenarios', action='append', choices=list(ESCENARIOS),
+                        help='Escenario a medir (repetible; por defecto todos)')
+    parser.add_argument('--iteraciones', type=int, default=30, help='Peticiones medidas por escenario')
+    parser.add_argument('--calentamiento', type=int, default=2, help='Peticiones sin medir por escenario')
+    parser.add_argument('--rol', choices=['medico', 'admin'], default='medico',
+                        help='Usuario de prueba: médico con clínica (alcance por clínica) o admin (global)')
+    parser.add_argument('--cache-caliente', action='store_true',
+                        help='No vaciar las cachés de reportes y gráficos entre peticiones')
+    parser.add_argument('--json', dest='salida_json', default=None, help='Guardar el resultado en este archivo')
+    parser.add_argument('--comparar', default=None, help='JSON de una corrida anterior')
+    parser.add_argument('--umbral', type=float, default=0.25, help='Empeoramiento relativo tolerado (0.25 = 25%%)')
+    parser.add_argument('--piso-ms', type=float, default=2.0, help='Diferencia absoluta mínima para contar regresión')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directorio = Path(tmp)
+        ruta_db = directorio / 'benchmark.db'
+        if args.db:
+            _copiar_sqlite(Path(args.db).expanduser(), ruta_db)
+        app = crear_app(directorio, ruta_db, args.cache_caliente)
+        ctx = preparar_base(app, args)
+        if not ctx['pacientes']:
+            raise SystemExit('La base no tiene consultas visibles para el usuario de prueba')
+
+        from app import db
+        with app.app_context():
+            contador = ContadorSQL(db.engines.values())
+        cliente = app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['_user_id'] = str(ctx['usuario_id'])
+            sesion['_fresh'] = True
+        ctx['cliente'] = cliente
+
+        print(f"Base: {ctx['totales']['pacientes']} pacientes, {ctx['totales']['consultas']} consultas; "
+              f"usuario {ctx['rol']}; caché {'caliente' if args.cache_caliente else 'fría'}")
+        print(f"{'escenario':34s} {'n':>4s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'SQL':>5s} {'pico KB':>9s}")
+        escenarios = {}
+        for nombre in args.escenarios or ESCENARIOS:
+            r = medir(app, ctx, nombre, args.iteraciones, args.calentamiento, args.cache_caliente, contador)
+            escenarios[nombre] = r
+            print(f"{nombre:34s} {r['n']:4d} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f} "
+                  f"{r['consultas_sql']:5d} {r['memoria_pico_kb']:9.1f}" + (f"  ERRORES {r['estados_error']}" if r['errores'] else ''))
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+    resultado = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit_actual(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'base': ctx['totales'],
+        'parametros': {'rol': ctx['rol'], 'iteraciones': args.iteraciones, 'calentamiento': args.calentamiento,
+                       'cache_caliente': args.cache_caliente, 'db': args.db},
+        'escenarios': escenarios,
+    }
+    if args.salida_json:
+        Path(args.salida_json).write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"Resultado guardado en {args.salida_json}")
+
+    fallas = [f"{nombre}: respuestas con error {r['estados_error']}" for nombre, r in escenarios.items() if r['errores']]
+    if args.comparar:
+        anterior = json.loads(Path(args.comparar).read_text(encoding='utf-8'))
+        if anterior.get('parametros', {}).get('rol') != resultado['parametros']['rol'] \
+                or anterior.get('base') != resultado['base']:
+            print("Aviso: la corrida anterior usó otro usuario u otra base; la comparación es orientativa.")
+        fallas += comparar(resultado, anterior, args.umbral, args.piso_ms)
+    for falla in fallas:
+        print(f"FALLA: {falla}")
+    return 1 if fallas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Prueba de estrés de SQLite con lecturas de reportes y escrituras concurrentes.
+
+Crea una base SQLite temporal, la llena con pacientes y consultas y lanza a la
+vez hilos que registran consultas (cada una en su propio commit, como las
+vistas de consulta) e hilos que piden los endpoints de reportes, búsqueda y
+exportación. Se repite con cada perfil:
+
+- ``delete``: journal clásico (``SQLITE_JOURNAL_MODE=DELETE``), sin pool de lectura.
+- ``wal``: perfil de rendimiento (WAL, busy_timeout, cache_size, mmap_size).
+- ``wal+lectura``: igual, con ``SQLITE_READ_POOL`` (pool aparte con query_only).
+
+Informa errores "database is locked", escrituras por segundo y latencia de las
+lecturas. Termina con código 1 si un perfil WAL tuvo errores.
+
+Uso::
+
+    python benchmarks/sqlite_concurrencia.py
+    python benchmarks/sqlite_concurrencia.py --escritores 4 --lectores 8 --operaciones 50 --json estres.json
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from config import Config  # noqa: E402
+
+PERFILES = {
+    'delete': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_READ_POOL': False},
+    'wal': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_READ_POOL': False},
+    'wal+lectura': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_READ_POOL': True},
+}
+LECTURAS = [
+    '/api/reportes/estadisticas_generales',
+    '/api/reportes/enfermedades_comunes',
+    '/api/reportes/problemas_por_sistemas',
+    '/api/buscar_pacientes?q=paciente',
+    '/reportes/export/consultas.csv',
+]
+DIAGNOSTICOS = ['Hipertensión arterial', 'Gastritis aguda', 'Diabetes mellitus tipo 2',
+                'Infección respiratoria', 'Lumbalgia', 'Cefalea tensional']
+
+
+def crear_app(ruta_db, perfil, busy_timeout):
+    from app import create_app
+
+    class ConfigEstres(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{ruta_db}'
+        WTF_CSRF_ENABLED = False
+        TESTING = True
+        SQLITE_BUSY_TIMEOUT = busy_timeout
+        REPORT_CACHE_BACKEND = 'memory'
+
+    for clave, valor in PERFILES[perfil].items():
+        setattr(ConfigEstres, clave, valor)
+    return create_app(ConfigEstres)
+
+
+def poblar(app, pacientes, consultas_por_paciente):
+    from app import db
+    from app.models import Clinica, Consulta, Paciente, Usuario
+    with app.app_context():
+        db.create_all()
+        clinica = Clinica(nombre='Clínica 1')
+        admin = Usuario(nombre_completo='Admin', usuario='admin', rol='admin')
+        admin.set_password('admin')
+        db.session.add_all([clinica, admin])
+        db.session.commit()
+        rnd = random.Random(1)
+        ahora = datetime.now()
+        for i in range(pacientes):
+            paciente = Paciente(nombre_completo=f'Paciente {i}', edad=rnd.randint(0, 90),
+                                sexo=rnd.choice(['Masculino', 'Femenino']), dni=f'DNI{i:06d}')
+            db.session.add(paciente)
+            db.session.flush()
+            for _ in range(consultas_por_paciente):
+                db.session.add(Consulta(
+                    paciente_id=paciente.id, clinica_id=clinica.id, medico_id=admin.id, estado='completada',
+                    fecha_consulta=ahora - timedelta(days=rnd.randint(0, 365)),
+                    diagnostico=rnd.choice(DIAGNOSTICOS), motivo_consulta='dolor de cabeza y tos'
+                ))
+        db.session.commit()
+        return admin.id, clinica.id
+
+
+def escritor(app, n, admin_id, clinica_id, pacientes, resultado):
+    from app import db
+    from app.models import Consulta
+    rnd = random.Random(threading.get_ident())
+    for _ in range(n):
+        with app.app_context():
+            try:
+                db.session.add(Consulta(paciente_id=rnd.randint(1, pacientes), clinica_id=clinica_id,
+                                        medico_id=admin_id, estado='completada', fecha_consulta=datetime.now(),
+                                        diagnostico=rnd.choice(DIAGNOSTICOS), motivo_consulta='control'))
+                db.session.commit()
+                resultado['escrituras'] += 1
+            except OperationalError as e:
+                db.session.rollback()
+                resultado['errores'].append(str(e.orig))
+            finally:
+                db.session.remove()
+
+
+def lector(app, n, admin_id, resultado):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['_user_id'] = str(admin_id)
+        sesion['_fresh'] = True
+    for i in range(n):
+        url = LECTURAS[i % len(LECTURAS)]
+        inicio = time.perf_counter()
+        try:
+            respuesta = cliente.get(url)
+            respuesta.get_data()
+            if respuesta.status_code >= 500:
+                resultado['errores'].append(f'{url}: HTTP {respuesta.status_code}')
+        except OperationalError as e:
+            resultado['errores'].append(f'{url}: {e.orig}')
+        resultado['latencias'].append(time.perf_counter() - inicio)
+
+
+def ejecutar(perfil, args):
+    with tempfile.TemporaryDirectory() as directorio:
+        app = crear_app(Path(directorio) / 'estres.db', perfil, args.busy_timeout)
+        admin_id, clinica_id = poblar(app, args.pacientes, args.consultas_por_paciente)
+        resultado = {'escrituras': 0, 'errores': [], 'latencias': []}
+        hilos = [threading.Thread(target=escritor, args=(app, args.operaciones, admin_id, clinica_id,
+                                                         args.pacientes, resultado))
+                 for _ in range(args.escritores)]
+        hilos += [threading.Thread(target=lector, args=(app, args.operaciones, admin_id, resultado))
+                  for _ in range(args.lectores)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+        from app import db
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+    latencias = sorted(resultado['latencias'])
+    bloqueos = [e for e in resultado['errores'] if 'locked' in e]
+    return {
+        'perfil': perfil,
+        'segundos': duracion,
+        'escrituras': resultado['escrituras'],
+        'escrituras_por_segundo': resultado['escrituras'] / duracion,
+        'lecturas': len(latencias),
+        'lectura_p50_ms': statistics.median(latencias) * 1000 if latencias else None,
+        'lectura_p95_ms': latencias[int(len(latencias) * 0.95) - 1] * 1000 if latencias else None,
+        'errores': len(resultado['errores']),
+        'bloqueos': len(bloqueos),
+        'ejemplo_error': resultado['errores'][0] if resultado['errores'] else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Estrés de SQLite: reportes y escrituras concurrentes')
+    parser.add_argument('--perfil', dest='perfiles', action='append', choices=list(PERFILES),
+                        help='Perfil a medir (repetible; por defecto todos)')
+    parser.add_argument('--escritores', type=int, default=4, help='Hilos que registran consultas')
+    parser.add_argument('--lectores', type=int, default=4, help='Hilos que piden reportes y búsquedas')
+    parser.add_argument('--operaciones', type=int, default=30, help='Operaciones por hilo')
+    parser.add_argument('--pacientes', type=int, default=500)
+    parser.add_argument('--consultas-por-paciente', type=int, default=4)
+    parser.add_argument('--busy-timeout', type=int, default=Config.SQLITE_BUSY_TIMEOUT, help='ms')
+    parser.add_argument('--json', dest='salida_json', default=None, help='Guardar el resultado en este archivo')
+    args = parser.parse_args(argv)
+
+    resultados = [ejecutar(perfil, args) for perfil in args.perfiles or PERFILES]
+    print(f"{'perfil':12s} {'seg':>6s} {'escr/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'errores':>8s} {'locked':>7s}")
+    for r in resultados:
+        print(f"{r['perfil']:12s} {r['segundos']:6.1f} {r['escrituras_por_segundo']:8.1f} "
+              f"{r['lectura_p50_ms'] or 0:8.1f} {r['lectura_p95_ms'] or 0:8.1f} {r['errores']:8d} {r['bloqueos']:7d}")
+        if r['ejemplo_error']:
+            print(f"  ej.: {r['ejemplo_error']}")
+    if args.salida_json:
+        Path(args.salida_json).write_text(json.dumps(resultados, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    fallas = [r['perfil'] for r in resultados if r['perfil'] != 'delete' and r['errores']]
+    for perfil in fallas:
+        print(f"FALLA: el perfil {perfil} tuvo errores con acceso concurrente")
+    return 1 if fallas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""add composite indexes for consulta, signos_vitales and codigo_verificacion hot filters
+
+Revision ID: a3c5e7f9b1d2
+Revises: 361297cd3305
+Create Date: 2026-10-18 10:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e7f9b1d2'
+down_revision = '361297cd3305'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('consulta', schema=None) as batch_op:
+        batch_op.create_index('ix_consulta_paciente_fecha', ['paciente_id', sa.text('fecha_consulta DESC')], unique=False)
+        batch_op.create_index('ix_consulta_clinica_fecha', ['clinica_id', 'fecha_consulta'], unique=False)
+        batch_op.create_index('ix_consulta_paciente_estado', ['paciente_id', 'estado'], unique=False)
+        batch_op.create_index('ix_consulta_fecha', ['fecha_consulta'], unique=False)
+
+    with op.batch_alter_table('signos_vitales', schema=None) as batch_op:
+        batch_op.create_index('ix_signos_vitales_consulta_id', ['consulta_id'], unique=False)
+        batch_op.create_index('ix_signos_vitales_paciente_fecha', ['paciente_id', 'fecha_registro'], unique=False)
+
+    with op.batch_alter_table('codigo_verificacion', schema=None) as batch_op:
+        batch_op.create_index('ix_codigo_verificacion_usuario_tipo_usado', ['usuario_id', 'tipo', 'usado'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('codigo_verificacion', schema=None) as batch_op:
+        batch_op.drop_index('ix_codigo_verificacion_usuario_tipo_usado')
+
+    with op.batch_alter_table('signos_vitales', schema=None) as batch_op:
+        batch_op.drop_index('ix_signos_vitales_paciente_fecha')
+        batch_op.drop_index('ix_signos_vitales_consulta_id')
+
+    with op.batch_alter_table('consulta', schema=None) as batch_op:
+        batch_op.drop_index('ix_consulta_fecha')
+        batch_op.drop_index('ix_consulta_paciente_estado')
+        batch_op.drop_index('ix_consulta_clinica_fecha')
+        batch_op.drop_index('ix_consulta_paciente_fecha')
@@ -0,0 +1,53 @@
+"""add estadistica_diaria and estadistica_diagnostico rollup tables
+
+Revision ID: b4d6f8a0c2e3
+Revises: a3c5e7f9b1d2
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d6f8a0c2e3'
+down_revision = 'a3c5e7f9b1d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('estadistica_diaria',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('clinica_id', sa.Integer(), nullable=True),
+    sa.Column('total_consultas', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['clinica_id'], ['clinica.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('fecha', 'clinica_id', name='uq_estadistica_diaria_fecha_clinica')
+    )
+    with op.batch_alter_table('estadistica_diaria', schema=None) as batch_op:
+        batch_op.create_index('ix_estadistica_diaria_clinica_fecha', ['clinica_id', 'fecha'], unique=False)
+
+    op.create_table('estadistica_diagnostico',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('clinica_id', sa.Integer(), nullable=True),
+    sa.Column('diagnostico', sa.String(length=255), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['clinica_id'], ['clinica.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('fecha', 'clinica_id', 'diagnostico', name='uq_estadistica_diagnostico')
+    )
+    with op.batch_alter_table('estadistica_diagnostico', schema=None) as batch_op:
+        batch_op.create_index('ix_estadistica_diagnostico_clinica_fecha', ['clinica_id', 'fecha'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('estadistica_diagnostico', schema=None) as batch_op:
+        batch_op.drop_index('ix_estadistica_diagnostico_clinica_fecha')
+    op.drop_table('estadistica_diagnostico')
+
+    with op.batch_alter_table('estadistica_diaria', schema=None) as batch_op:
+        batch_op.drop_index('ix_estadistica_diaria_clinica_fecha')
+    op.drop_table('estadistica_diaria')
@@ -0,0 +1,53 @@
+"""add consulta_tag table with per-consulta classification
+
+Revision ID: c5e7a9b1d3f4
+Revises: b4d6f8a0c2e3
+Create Date: 2026-10-18 13:00:00.000000
+
+Después de aplicar la migración, ``flask backfill-tags`` clasifica las consultas existentes.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e7a9b1d3f4'
+down_revision = 'b4d6f8a0c2e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('consulta_tag',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('consulta_id', sa.Integer(), nullable=False),
+    sa.Column('clinica_id', sa.Integer(), nullable=True),
+    sa.Column('sistema', sa.String(length=50), nullable=True),
+    sa.Column('subcategoria', sa.String(length=50), nullable=True),
+    sa.Column('diagnostico_normalizado', sa.String(length=255), nullable=True),
+    sa.ForeignKeyConstraint(['clinica_id'], ['clinica.id'], ),
+    sa.ForeignKeyConstraint(['consulta_id'], ['consulta.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('consulta_tag', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_consulta_tag_consulta_id'), ['consulta_id'], unique=False)
+        batch_op.create_index('ix_consulta_tag_sistema_subcategoria', ['sistema', 'subcategoria'], unique=False)
+        batch_op.create_index('ix_consulta_tag_clinica_sistema_subcategoria', ['clinica_id', 'sistema', 'subcategoria'], unique=False)
+
+    op.create_table('consulta_tag_backfill',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('hasta_consulta_id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('consulta_tag_backfill')
+
+    with op.batch_alter_table('consulta_tag', schema=None) as batch_op:
+        batch_op.drop_index('ix_consulta_tag_clinica_sistema_subcategoria')
+        batch_op.drop_index('ix_consulta_tag_sistema_subcategoria')
+        batch_op.drop_index(batch_op.f('ix_consulta_tag_consulta_id'))
+
+    op.drop_table('consulta_tag')
@@ -0,0 +1,51 @@
+"""add pdf_job table for background PDF rendering
+
+Revision ID: d6f8b0c2e4a5
+Revises: c5e7a9b1d3f4
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6f8b0c2e4a5'
+down_revision = 'c5e7a9b1d3f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pdf_job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('parametros', sa.Text(), nullable=False),
+    sa.Column('alcance', sa.String(length=30), nullable=False),
+    sa.Column('clave', sa.String(length=40), nullable=False),
+    sa.Column('clave_activa', sa.String(length=40), nullable=True),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=True),
+    sa.Column('intentos', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('nombre_archivo', sa.String(length=255), nullable=True),
+    sa.Column('ruta_archivo', sa.String(length=500), nullable=True),
+    sa.Column('fecha_creacion', sa.DateTime(), nullable=False),
+    sa.Column('fecha_inicio', sa.DateTime(), nullable=True),
+    sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuario.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('pdf_job', schema=None) as batch_op:
+        batch_op.create_index('ix_pdf_job_estado_fecha', ['estado', 'fecha_creacion'], unique=False)
+        batch_op.create_index('uq_pdf_job_clave_activa', ['clave_activa'], unique=True)
+        batch_op.create_index('ix_pdf_job_usuario_estado', ['usuario_id', 'estado'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('pdf_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_pdf_job_usuario_estado')
+        batch_op.drop_index('uq_pdf_job_clave_activa')
+        batch_op.drop_index('ix_pdf_job_estado_fecha')
+
+    op.drop_table('pdf_job')
@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 from app import create_app, db
 from app import models  # Importa modelos para que Flask-Migrate los detecte
 from flask import current_app
@@ -39,5 +40,237 @@ def backup_db_command(no_tar: bool, upload_drive: bool):
         msg += f" | Drive ID: {result['drive_file_id']}"
     print(msg)
 
+
+@app.cli.command('reindex-pacientes')
+def reindex_pacientes_command():
+    """Reconstruir el índice de búsqueda de pacientes."""
+    from app.utils.patient_search import patient_search
+    total = patient_search.rebuild()
+    print(f"Índice de búsqueda reconstruido: {total} pacientes.")
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Reconstruir las estadísticas diarias pre-agregadas de los reportes."""
+    from app.utils.rollups import rollups
+    total = rollups.rebuild()
+    print(f"Estadísticas diarias reconstruidas: {total} filas.")
+
+
+@app.cli.command('backfill-tags')
+@click.option('--batch-size', default=500, show_default=True, help='Consultas por lote')
+@click.option('--desde-id', default=0, show_default=True, help='Reanudar después de este id de consulta')
+def backfill_tags_command(batch_size: int, desde_id: int):
+    """Clasificar por lotes las consultas existentes (tabla consulta_tag)."""
+    from app.utils.consulta_tags import tag_backfill
+    total = tag_backfill.ejecutar(
+        batch_size=batch_size, desde_id=desde_id,
+        progreso=lambda procesadas, ultimo_id: print(f"  {procesadas} consultas (último id {ultimo_id})")
+    )
+    print(f"Etiquetas actualizadas para {total} consultas.")
+
+
+@app.cli.command('seed-synthetic')
+@click.option('--patients', 'pacientes', default=1000, show_default=True, help='Pacientes a crear')
+@click.option('--consultas-per-patient', 'consultas_por_paciente', default=5, show_default=True,
+              help='Consultas por paciente')
+@click.option('--clinics', 'clinicas', default=3, show_default=True, help='Clínicas (con un médico cada una)')
+@click.option('--seed', 'semilla', default=42, show_default=True, help='Semilla del generador')
+@click.option('--years', 'anios', default=3, show_default=True, help='Años de historia hacia atrás')
+@click.option('--until', 'hasta', default=None, help='Fecha final YYYY-MM-DD (por defecto hoy)')
+@click.option('--skip-derived', is_flag=True, default=False,
+              help='No reconstruir rollups, índice de búsqueda ni etiquetas')
+def seed_synthetic_command(pacientes, consultas_por_paciente, clinicas, semilla, anios, hasta, skip_derived):
+    """Cargar datos sintéticos masivos (pacientes, consultas, signos) para pruebas de carga."""
+    import time
+    from datetime import date
+    from app.utils import synthetic
+    from app.utils.report_cache import report_cache
+    if clinicas < 1:
+        raise click.BadParameter('Debe haber al menos una clínica', param_hint='--clinics')
+    try:
+        hoy = date.fromisoformat(hasta) if hasta else None
+    except ValueError:
+        raise click.BadParameter('Use el formato YYYY-MM-DD', param_hint='--until')
+    inicio = time.perf_counter()
+    total_consultas = pacientes * consultas_por_paciente
+    resultado = synthetic.generar(
+        pacientes, consultas_por_paciente, clinicas, semilla=semilla, anios=anios, hoy=hoy,
+        progreso=lambda p, c: print(f"  {p}/{pacientes} pacientes, {c}/{total_consultas} consultas "
+                                    f"({time.perf_counter() - inicio:.0f} s)")
+    )
+    print(f"Insertados: {resultado['clinicas']} clínicas, {resultado['medicos']} médicos, "
+          f"{resultado['pacientes']} pacientes, {resultado['consultas']} consultas "
+          f"en {time.perf_counter() - inicio:.1f} s.")
+    if skip_derived:
+        report_cache.invalidar()
+    else:
+        # Las inserciones masivas no pasan por los eventos del ORM
+        paso = time.perf_counter()
+        derivados = synthetic.reconstruir_derivados(resultado['primer_consulta_id'])
+        print(f"Estadísticas diarias: {derivados['filas_rollup']} filas; índice de búsqueda: "
+              f"{derivados['pacientes_indexados']} pacientes; etiquetas: {derivados['consultas_etiquetadas']} "
+              f"consultas ({time.perf_counter() - paso:.1f} s).")
+    print(f"Listo en {time.perf_counter() - inicio:.1f} s.")
+
+
+@app.cli.command('export')
+@click.argument('entidad', type=click.Choice(['consultas', 'pacientes']))
+@click.option('--formato', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--desde', default=None, help='Fecha inicial YYYY-MM-DD (inclusive)')
+@click.option('--hasta', default=None, help='Fecha final YYYY-MM-DD (inclusive)')
+@click.option('--clinica-id', type=int, default=None, help='Limitar a una clínica')
+@click.option('--output', '-o', default=None, help='Archivo de salida (.gz); por defecto en ClinicaData/exports')
+def export_command(entidad, formato, desde, hasta, clinica_id, output):
+    """Exportar consultas o pacientes a un archivo comprimido con gzip."""
+    import gzip
+    from datetime import datetime
+    from pathlib import Path
+    from app.utils import export as exportador
+    try:
+        inicio, fin = exportador.parse_rango(desde, hasta)
+    except ValueError:
+        raise click.BadParameter('Use el formato YYYY-MM-DD', param_hint='--desde/--hasta')
+    if output:
+        destino = Path(output)
+    else:
+        destino = Path(os.path.expanduser('~')) / 'ClinicaData' / 'exports' / \
+            f"{entidad}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}.gz"
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(destino, 'wt', encoding='utf-8', newline='') as archivo:
+        for bloque in exportador.generar(entidad, formato, inicio, fin, clinica_id):
+            archivo.write(bloque)
+    print(f"Exportación creada: {destino}")
+
+
+@app.cli.command('db-index-report')
+@click.option('--verbose', is_flag=True, default=False, help='Mostrar SQL y plan completo de cada consulta')
+def db_index_report_command(verbose: bool):
+    """Analizar con EXPLAIN las consultas frecuentes y marcar full scans."""
+    from app.utils.index_advisor import index_report
+    reporte = index_report()
+    con_problemas = 0
+    for item in reporte:
+        estado = 'OK' if not item['problemas'] else 'REVISAR'
+        print(f"[{estado}] {item['nombre']}")
+        for problema in item['problemas']:
+            print(f"    - {problema}")
+        if verbose:
+            print(f"    SQL: {item['sql']}")
+            for paso in item['plan']:
+                print(f"    plan: {paso}")
+        con_problemas += bool(item['problemas'])
+    print(f"{len(reporte)} consultas analizadas, {con_problemas} con problemas.")
+
+
+@app.cli.command('serve')
+@click.option('--servidor', type=click.Choice(['auto', 'gunicorn', 'waitress']), default=None,
+              help='Servidor WSGI (por defecto WSGI_SERVER)')
+@click.option('--host', default=None, help='Dirección (por defecto WSGI_HOST)')
+@click.option('--port', type=int, default=None, help='Puerto (por defecto WSGI_PORT)')
+@click.option('--workers', type=int, default=None, help='Procesos, solo gunicorn (por defecto WSGI_WORKERS)')
+@click.option('--threads', type=int, default=None, help='Hilos por proceso (por defecto WSGI_THREADS)')
+def serve_command(servidor, host, port, workers, threads):
+    """Servir la aplicación con un servidor de producción (gunicorn o waitress)."""
+    from app.utils.wsgi_server import elegir, servir
+    config = current_app.config
+    try:
+        servidor = elegir(servidor or config['WSGI_SERVER'])
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    host = host or config['WSGI_HOST']
+    port = port or config['WSGI_PORT']
+    workers = (workers or config['WSGI_WORKERS']) if servidor == 'gunicorn' else 1
+    threads = threads or config['WSGI_THREADS']
+    if servidor == 'gunicorn' and config['REPORT_CACHE_BACKEND'] == 'memory':
+        print(f"Caché de reportes: con gunicorn se usa 'filesystem' ({config['REPORT_CACHE_DIR']}) "
+              "en lugar de 'memory' para compartirla entre procesos.")
+    if servidor == 'gunicorn' and config['METRICS_ENABLED']:
+        # Totales por proceso de la ejecución anterior: los contadores arrancan de cero
+        for archivo in Path(config['METRICS_DIR']).glob('*.json'):
+            archivo.unlink(missing_ok=True)
+    print(f"Servidor {servidor} en http://{host}:{port} ({workers} proceso(s) x {threads} hilo(s))")
+    servir(current_app._get_current_object(), servidor, host, port, workers, threads, config['WSGI_TIMEOUT'])
+
+
+@app.cli.command('pdf-worker')
+@click.option('--concurrencia', type=int, default=None, help='Procesos generadores (por defecto PDF_WORKER_CONCURRENCY)')
+@click.option('--intervalo', default=1.0, show_default=True, help='Segundos de espera cuando la cola está vacía')
+@click.option('--una-vez', is_flag=True, default=False, help='Procesar los trabajos pendientes y salir')
+def pdf_worker_command(concurrencia, intervalo, una_vez):
+    """Generar en segundo plano los PDF solicitados con ?async=1."""
+    from app.utils.pdf_jobs import pdf_jobs
+    concurrencia = concurrencia or current_app.config['PDF_WORKER_CONCURRENCY']
+    print(f"Worker de PDF: {concurrencia} proceso(s), tipos: {', '.join(pdf_jobs.tipos)}")
+    procesados = pdf_jobs.lanzar_workers(concurrencia, intervalo=intervalo, una_vez=una_vez)
+    if procesados is not None:
+        print(f"PDF generados: {procesados}")
+
+
+@app.cli.command('bench-pdf')
+@click.option('--tipo', 'tipos', multiple=True, type=click.Choice(['historial', 'receta', 'consulta', 'reportes']),
+              help='Tipo de documento a medir (repetible; por defecto todos)')
+@click.option('--repeticiones', default=10, show_default=True, help='Documentos generados por tipo')
+def bench_pdf_command(tipos, repeticiones):
+    """Medir cuántos PDF por segundo se generan de cada tipo (sin caché de PDF)."""
+    import time
+    from app.models import Consulta
+    from app.main.routes import generar_pdf_historial
+    from app.main.pdf_reports import _construir_receta, _construir_consulta, generar_pdf_reportes
+    consulta = Consulta.query.filter(Consulta.paciente_id.isnot(None)).order_by(Consulta.id).first()
+    if consulta is None:
+        print("No hay consultas registradas.")
+        return
+    generadores = {
+        'historial': lambda: generar_pdf_historial(consulta.paciente_id),
+        'receta': lambda: _construir_receta(consulta),
+        'consulta': lambda: _construir_consulta(consulta),
+        'reportes': lambda: generar_pdf_reportes(),
+    }
+    for tipo in tipos or generadores:
+        generadores[tipo]()  # calentamiento
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            contenido, _nombre = generadores[tipo]()
+            tiempos.append(time.perf_counter() - inicio)
+        total = sum(tiempos)
+        print(f"{tipo:10s} {repeticiones / total:7.2f} PDF/s  media {total / repeticiones * 1000:7.1f} ms  "
+              f"mín {min(tiempos) * 1000:7.1f} ms  {len(contenido) // 1024} KB")
+
+
+@app.cli.command('bench-reportes-pdf')
+@click.option('--repeticiones', default=5, show_default=True, help='PDF generados por modo')
+@click.option('--procesos', type=int, default=None, help='Procesos del pool (por defecto CHART_POOL_WORKERS)')
+@click.option('--clinica-id', type=int, default=None, help='Alcance de una clínica (por defecto global)')
+def bench_reportes_pdf_command(repeticiones, procesos, clinica_id):
+    """Comparar el PDF de reportes con los gráficos dibujados en serie y en el pool de procesos."""
+    import time
+    from app.utils.charts import charts
+    from app.main.pdf_reports import generar_pdf_reportes
+    procesos = procesos or current_app.config['CHART_POOL_WORKERS']
+    original = charts.procesos
+    resultados = {}
+    try:
+        for modo, n in (('secuencial', 0), (f'pool x{procesos}', procesos)):
+            charts.procesos = n
+            charts.limpiar()
+            generar_pdf_reportes(clinica_id)  # calentamiento (arranque del pool)
+            tiempos = []
+            for _ in range(repeticiones):
+                charts.limpiar()  # sin gráficos memorizados: se mide el dibujo completo
+                inicio = time.perf_counter()
+                generar_pdf_reportes(clinica_id)
+                tiempos.append(time.perf_counter() - inicio)
+            tiempos.sort()
+            resultados[modo] = tiempos[len(tiempos) // 2]
+            print(f"{modo:12s} mediana {resultados[modo] * 1000:7.1f} ms  mín {tiempos[0] * 1000:7.1f} ms  "
+                  f"máx {tiempos[-1] * 1000:7.1f} ms")
+    finally:
+        charts.procesos = original
+        charts.cerrar_pool()
+    secuencial, paralelo = resultados.values()
+    print(f"Aceleración: {secuencial / paralelo:.2f}x")
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', load_dotenv=True)
@@ -0,0 +1,70 @@
+import pytest
+
+from config import Config
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        REPORT_CACHE_DIR = str(tmp_path / 'cache' / 'reportes')
+        PDF_CACHE_DIR = str(tmp_path / 'cache' / 'pdf')
+        PDF_JOBS_DIR = str(tmp_path / 'pdf_jobs')
+        PERF_LOG_FILE = ''
+
+    from app import create_app, db
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def app_archivo(tmp_path):
+    # SQLite en archivo temporal: ``sqlite://`` en memoria no ejercita WAL ni bloqueos
+    class ConfigArchivo(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'concurrencia.db'}"
+        SQLITE_JOURNAL_MODE = 'WAL'
+        REPORT_CACHE_BACKEND = 'memory'
+        REPORT_CACHE_DIR = str(tmp_path / 'cache' / 'reportes')
+        PDF_CACHE_DIR = str(tmp_path / 'cache' / 'pdf')
+        PDF_JOBS_DIR = str(tmp_path / 'pdf_jobs')
+        PERF_LOG_FILE = ''
+
+    from app import create_app, db
+    app = create_app(ConfigArchivo)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def admin_id(app):
+    from app import db
+    from app.models import Usuario
+    with app.app_context():
+        usuario = Usuario(nombre_completo='Admin Pruebas', usuario='admin_pruebas', rol='admin')
+        usuario.set_password('x')
+        db.session.add(usuario)
+        db.session.commit()
+        return usuario.id
+
+
+@pytest.fixture
+def client(app, admin_id):
+    # Sin un app context activo: cada petición usa el suyo (sesión de BD y usuario nuevos)
+    client = app.test_client()
+    with client.session_transaction() as sesion:
+        sesion['_user_id'] = str(admin_id)
+        sesion['_fresh'] = True
+    return client
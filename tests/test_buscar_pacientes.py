@@ -0,0 +1,183 @@
+"""Las búsquedas de pacientes hacen un número fijo de consultas SQL, sin importar
+cuántos pacientes coinciden ni cuántas consultas o signos vitales tiene cada uno."""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.main.routes import ultimos_signos_vitales
+from app.models import Clinica, Consulta, Paciente, SignosVitales
+
+
+@contextmanager
+def contar_consultas(app):
+    with app.app_context():
+        engine = db.engine
+    sentencias = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', registrar)
+    try:
+        yield sentencias
+    finally:
+        event.remove(engine, 'before_cursor_execute', registrar)
+
+
+def pedir(client, url, **parametros):
+    with contar_consultas(client.application) as sentencias:
+        respuesta = client.get(url, query_string=parametros)
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)[:500]
+    return respuesta.get_json(), len(sentencias)
+
+
+def buscar(client, texto):
+    return pedir(client, '/api/buscar_pacientes', q=texto)
+
+
+@pytest.fixture
+def datos(app, admin_id):
+    ctx = app.app_context()
+    ctx.push()
+    clinica = Clinica(nombre='Clínica Pruebas')
+    db.session.add(clinica)
+    db.session.flush()
+
+    def crear(nombre, dni, consultas):
+        paciente = Paciente(nombre_completo=nombre, edad=30, sexo='Femenino', dni=dni)
+        db.session.add(paciente)
+        db.session.flush()
+        for i in range(consultas):
+            db.session.add(Consulta(paciente_id=paciente.id, clinica_id=clinica.id, medico_id=admin_id,
+                                    fecha_consulta=datetime(2024, 1, 1) + timedelta(days=i),
+                                    motivo_consulta='control', estado='completada'))
+
+    crear('Wilfredo Unico', '2000000000001', 2)
+    for i in range(12):
+        crear(f'Herminia Repetida {i}', f'30000000000{i:02d}', 2)
+    crear('Teodoro Pocas', '4000000000001', 1)
+    crear('Casimira Muchas', '5000000000001', 40)
+    db.session.commit()
+    ctx.pop()
+
+
+def test_consultas_constantes_con_mas_pacientes(client, datos):
+    uno, consultas_uno = buscar(client, 'Wilfredo')
+    diez, consultas_diez = buscar(client, 'Herminia')
+
+    assert len(uno) == 1
+    assert len(diez) == 10
+    assert consultas_uno == consultas_diez
+
+
+def test_consultas_constantes_con_mas_historial(client, datos):
+    pocas, consultas_pocas = buscar(client, 'Teodoro')
+    muchas, consultas_muchas = buscar(client, 'Casimira')
+
+    assert pocas[0]['total_consultas'] == 1
+    assert muchas[0]['total_consultas'] == 40
+    assert consultas_pocas == consultas_muchas
+
+
+# ----- /api/search_patients y /get_vitals (carga por lotes de consultas y signos vitales) -----
+INICIO = datetime(2024, 3, 1, 8, 0)
+
+
+@pytest.fixture
+def con_signos(app, admin_id):
+    """Pacientes "Eulalia ..." con y sin consultas o signos vitales. Devuelve {apellido: id}."""
+    ctx = app.app_context()
+    ctx.push()
+    clinica = Clinica(nombre='Clínica Pruebas')
+    db.session.add(clinica)
+    db.session.flush()
+    ids = {}
+
+    def paciente(apellido):
+        p = Paciente(nombre_completo=f'Eulalia {apellido}', edad=50, sexo='Femenino')
+        db.session.add(p)
+        db.session.flush()
+        ids[apellido] = p.id
+        return p
+
+    def consulta(p, dias, fc=None):
+        c = Consulta(paciente_id=p.id, clinica_id=clinica.id, medico_id=admin_id,
+                     fecha_consulta=INICIO + timedelta(days=dias), diagnostico=f'dx {dias}')
+        db.session.add(c)
+        db.session.flush()
+        if fc is not None:
+            db.session.add(SignosVitales(consulta_id=c.id, frecuencia_cardiaca=fc,
+                                         fecha_registro=INICIO + timedelta(days=dias)))
+        return c
+
+    def iniciales(p, fc, dias=0):
+        db.session.add(SignosVitales(paciente_id=p.id, frecuencia_cardiaca=fc,
+                                     fecha_registro=INICIO + timedelta(days=dias)))
+
+    alfa = paciente('Alfa')  # tres consultas con signos: vale la más reciente
+    for dias, fc in ((0, 70), (10, 90), (5, 80)):
+        consulta(alfa, dias, fc)
+    iniciales(alfa, 50, dias=20)  # los de una consulta tienen prioridad sobre los iniciales
+    beta = paciente('Beta')  # consulta sin signos y signos iniciales
+    consulta(beta, 3)
+    iniciales(beta, 60)
+    paciente('Gamma')  # sin consultas ni signos
+    iniciales(paciente('Delta'), 75)  # solo signos iniciales
+    epsilon = paciente('Epsilon')  # muchas consultas con signos; la más reciente sin ellos
+    for dias in range(15):
+        consulta(epsilon, dias, 100 + dias)
+    consulta(epsilon, 30)
+    db.session.commit()
+    ctx.pop()
+    return ids
+
+
+def test_search_patients_resultados(client, con_signos):
+    resultados, _ = pedir(client, '/api/search_patients', query='eulalia')
+    por_nombre = {r['nombre_completo']: r for r in resultados}
+    assert set(por_nombre) == {f'Eulalia {a}' for a in con_signos}
+
+    alfa = por_nombre['Eulalia Alfa']['historial_consultas']
+    assert [c['signos_vitales']['frecuencia_cardiaca'] for c in alfa] == [90, 80, 70]
+    assert all(c['medico'] == 'Admin Pruebas' for c in alfa)
+    beta = por_nombre['Eulalia Beta']['historial_consultas']
+    assert len(beta) == 1 and beta[0]['signos_vitales'] is None
+    assert por_nombre['Eulalia Gamma']['historial_consultas'] == []
+    assert por_nombre['Eulalia Delta']['historial_consultas'] == []
+    assert len(por_nombre['Eulalia Epsilon']['historial_consultas']) == 16
+
+
+def test_search_patients_consultas_constantes(client, con_signos):
+    uno, consultas_uno = pedir(client, '/api/search_patients', query='gamma')
+    todos, consultas_todos = pedir(client, '/api/search_patients', query='eulalia')
+    muchas, consultas_muchas = pedir(client, '/api/search_patients', query='epsilon')
+
+    assert len(uno) == 1 and len(todos) == 5 and len(muchas) == 1
+    assert consultas_uno == consultas_todos == consultas_muchas
+
+
+def test_get_vitals_resultados(client, con_signos):
+    esperados = {'Alfa': 90, 'Beta': 60, 'Delta': 75, 'Epsilon': 114}
+    for apellido, fc in esperados.items():
+        datos, _ = pedir(client, f"/get_vitals/{con_signos[apellido]}")
+        assert datos['frecuencia_cardiaca'] == fc, apellido
+    datos, _ = pedir(client, f"/get_vitals/{con_signos['Gamma']}")
+    assert datos == {}
+
+
+def test_get_vitals_consultas_constantes(client, con_signos):
+    # Ambos caen al respaldo por lotes: 1 registro de signos frente a 15
+    _, pocas = pedir(client, f"/get_vitals/{con_signos['Beta']}")
+    _, muchas = pedir(client, f"/get_vitals/{con_signos['Epsilon']}")
+    assert pocas == muchas
+
+
+def test_ultimos_signos_vitales_por_lotes(app, con_signos):
+    with app.app_context(), contar_consultas(app) as sentencias:
+        ultimos = ultimos_signos_vitales(list(con_signos.values()))
+        fc = {apellido: ultimos[pid].frecuencia_cardiaca for apellido, pid in con_signos.items() if pid in ultimos}
+    assert fc == {'Alfa': 90, 'Beta': 60, 'Delta': 75, 'Epsilon': 114}
+    assert len(sentencias) == 1
@@ -0,0 +1,44 @@
+"""Backfill de etiquetas para consultas que no pasaron por el ORM."""
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import db
+from app.models import Clinica, Consulta
+from app.utils.consulta_tags import conteo_por_sistema, leer_avance, tag_backfill
+
+
+def esperar_backfill():
+    if tag_backfill._hilo is not None:
+        tag_backfill._hilo.join(timeout=30)
+
+
+def test_backfill_aunque_haya_etiquetas_nuevas(app):
+    with app.app_context():
+        clinica = Clinica(nombre='Clínica Pruebas')
+        db.session.add(clinica)
+        db.session.commit()
+        # Consultas históricas cargadas sin el ORM (sin etiquetas)
+        db.session.execute(insert(Consulta.__table__), [
+            {'clinica_id': clinica.id, 'fecha_consulta': datetime(2023, 1, 1), 'diagnostico': 'Neumonía',
+             'estado': 'completada'} for _ in range(50)
+        ])
+        db.session.commit()
+        # Una consulta nueva guardada por el ORM sí se etiqueta al guardarse
+        db.session.add(Consulta(clinica_id=clinica.id, fecha_consulta=datetime(2024, 1, 1), diagnostico='Neumonía'))
+        db.session.commit()
+
+        conteo_por_sistema()
+        esperar_backfill()
+        sistemas = conteo_por_sistema()
+        assert sum(sistemas.values()) == 51
+        assert leer_avance(db.session.connection()) == 51
+
+
+def test_no_relanza_sin_consultas_pendientes(app):
+    with app.app_context():
+        db.session.add(Consulta(fecha_consulta=datetime(2024, 1, 1), diagnostico='Neumonía'))
+        db.session.commit()
+        hilo_anterior = tag_backfill._hilo
+        conteo_por_sistema()
+        assert tag_backfill._hilo is hilo_anterior
@@ -0,0 +1,37 @@
+"""Redacción de datos de pacientes en los registros."""
+import json
+import logging
+import sys
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.utils.log_pipeline import FormatoJSON, RedactorPHI
+
+
+def registrar_excepcion(excepcion):
+    try:
+        raise excepcion
+    except Exception:
+        registro = logging.LogRecord('app.pruebas', logging.ERROR, __file__, 1,
+                                     'Error al guardar juan@x.com', (), sys.exc_info())
+    RedactorPHI().filter(registro)
+    return json.loads(FormatoJSON().format(registro))
+
+
+def test_traza_enmascarada():
+    datos = registrar_excepcion(ValueError("parametros ('Juan', '1234567890123', 'juan@x.com')"))
+    assert 'juan@x.com' not in datos['mensaje']
+    assert 'ValueError' in datos['excepcion']
+    assert '1234567890123' not in datos['excepcion']
+    assert 'juan@x.com' not in datos['excepcion']
+
+
+def test_errores_sql_sin_parametros(app):
+    with app.app_context():
+        with pytest.raises(SQLAlchemyError) as error:
+            db.session.execute(text('SELECT * FROM tabla_inexistente WHERE nombre = :n'), {'n': 'Juan Secreto'})
+        db.session.rollback()
+    assert 'Juan Secreto' not in str(error.value)
@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+def _tiempo_sql(metrics):
+    return sum(metrics.registro.sumar().get(metrics.sql_segundos, {}).values())
+
+
+def test_sentencias_fallidas_no_dejan_inicios_en_la_conexion(app):
+    from app import db
+    from app.utils.metrics import metrics
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for _ in range(5):
+                with pytest.raises(OperationalError):
+                    conn.execute(text('SELECT * FROM tabla_que_no_existe'))
+                conn.rollback()
+            antes = _tiempo_sql(metrics)
+            conn.execute(text('SELECT 1'))
+            assert _tiempo_sql(metrics) > antes
+            assert not [valor for valor in conn.info.values() if isinstance(valor, list) and valor]
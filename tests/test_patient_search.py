@@ -0,0 +1,45 @@
+"""Búsqueda de pacientes sobre el índice FTS5 trigram de SQLite."""
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.models import Paciente
+from app.utils.patient_search import patient_search
+
+
+@pytest.fixture
+def pacientes(app):
+    with app.app_context():
+        for nombre, dni in (('Juan Pérez', '1234567890101'), ('Juana de Arco', '2234567890101'),
+                            ('Pedro Ortiz', '3234567890101'), ('Ana 50% Ruiz', '4234567890101')):
+            db.session.add(Paciente(nombre_completo=nombre, edad=30, sexo='Femenino', dni=dni))
+        db.session.commit()
+        yield
+
+
+def nombres(termino):
+    return sorted(p.nombre_completo for p in patient_search.search(Paciente.query, termino))
+
+
+@pytest.mark.parametrize('termino, esperados', [
+    ('perez', ['Juan Pérez']),
+    ('JUAN', ['Juan Pérez', 'Juana de Arco']),
+    ('juan pe', ['Juan Pérez']),  # término corto: inicio de palabra
+    ('de', ['Juana de Arco']),
+    ('rtiz', ['Pedro Ortiz']),
+    ('3234567', ['Pedro Ortiz']),
+    ('50%', ['Ana 50% Ruiz']),
+    ('ju_n', []),  # los comodines de LIKE no se interpretan
+])
+def test_resultados(app, pacientes, termino, esperados):
+    with app.app_context():
+        assert nombres(termino) == esperados
+
+
+def test_terminos_largos_usan_el_indice(app, pacientes):
+    with app.app_context():
+        consulta = patient_search.search(Paciente.query, 'juan pe').with_entities(Paciente.id)
+        compilada = consulta.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {compilada}')).fetchall()
+        detalle = ' '.join(fila[-1] for fila in plan)
+        assert 'VIRTUAL TABLE INDEX 0:M' in detalle
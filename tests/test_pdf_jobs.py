@@ -0,0 +1,71 @@
+import threading
+from types import SimpleNamespace
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+def _usuario(usuario_id):
+    return SimpleNamespace(id=usuario_id, rol='admin', clinica_actual_id=None)
+
+
+def test_encolar_deduplica_mientras_el_trabajo_esta_activo(app, admin_id):
+    from app import db
+    from app.models import PdfJob
+    from app.utils.pdf_jobs import pdf_jobs
+    with app.app_context():
+        job, nuevo = pdf_jobs.encolar('historial', {'paciente_id': 999}, _usuario(admin_id))
+        repetido, nuevo_repetido = pdf_jobs.encolar('historial', {'paciente_id': 999}, _usuario(admin_id))
+        assert nuevo and not nuevo_repetido
+        assert repetido.id == job.id
+
+        # Al terminar (aquí con error: el paciente no existe) la clave queda libre
+        pdf_jobs.ejecutar(pdf_jobs.reclamar())
+        assert db.session.get(PdfJob, job.id).clave_activa is None
+        otro, nuevo_otro = pdf_jobs.encolar('historial', {'paciente_id': 999}, _usuario(admin_id))
+        assert nuevo_otro and otro.id != job.id
+
+
+def test_solicitudes_simultaneas_comparten_un_trabajo(app_archivo):
+    from app import db
+    from app.models import PdfJob, Usuario
+    from app.utils.pdf_jobs import pdf_jobs
+    with app_archivo.app_context():
+        usuario = Usuario(nombre_completo='Admin Pruebas', usuario='admin_pruebas', rol='admin')
+        usuario.set_password('x')
+        db.session.add(usuario)
+        db.session.commit()
+        usuario_id = usuario.id
+
+    # Ambas solicitudes pasan la consulta previa antes de que alguna inserte
+    barrera = threading.Barrier(2, timeout=10)
+
+    def esperar_al_otro(session, flush_context, instances):
+        if any(isinstance(obj, PdfJob) for obj in session.new):
+            barrera.wait()
+
+    resultados = []
+
+    def solicitar():
+        with app_archivo.app_context():
+            try:
+                job, nuevo = pdf_jobs.encolar('historial', {'paciente_id': 1}, _usuario(usuario_id))
+                resultados.append((job.id, nuevo))
+            finally:
+                db.session.remove()
+
+    event.listen(Session, 'before_flush', esperar_al_otro)
+    try:
+        hilos = [threading.Thread(target=solicitar) for _ in range(2)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+    finally:
+        event.remove(Session, 'before_flush', esperar_al_otro)
+
+    assert len(resultados) == 2
+    assert len({job_id for job_id, _ in resultados}) == 1
+    assert sorted(nuevo for _, nuevo in resultados) == [False, True]
+    with app_archivo.app_context():
+        assert PdfJob.query.count() == 1
@@ -0,0 +1,23 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+def test_sentencias_fallidas_no_dejan_inicios_en_la_conexion(app):
+    from app import db
+    from app.utils.perf import EstadoPeticion, _peticion_actual
+    estado = EstadoPeticion()
+    token = _peticion_actual.set(estado)
+    try:
+        with app.app_context():
+            with db.engine.connect() as conn:
+                for _ in range(5):
+                    with pytest.raises(OperationalError):
+                        conn.execute(text('SELECT * FROM tabla_que_no_existe'))
+                    conn.rollback()
+                conn.execute(text('SELECT 1'))
+                assert not [valor for valor in conn.info.values() if isinstance(valor, list) and valor]
+    finally:
+        _peticion_actual.reset(token)
+    assert estado.consultas == 1
+    assert estado.tiempo_db > 0
@@ -0,0 +1,35 @@
+"""Invalidación de la caché de reportes al guardar datos."""
+from datetime import datetime
+
+from app import db
+from app.models import Consulta
+from app.utils.report_cache import report_cache
+
+
+def test_una_invalidacion_por_commit(app, monkeypatch):
+    llamadas = []
+    original = report_cache.invalidar
+    monkeypatch.setattr(report_cache, 'invalidar', lambda: (llamadas.append(1), original())[1])
+    with app.app_context():
+        version = report_cache.backend().version()
+        consulta = Consulta(fecha_consulta=datetime(2024, 1, 1), diagnostico='Gripe')
+        db.session.add(consulta)
+        db.session.flush()
+        assert llamadas == []
+        consulta.diagnostico = 'Asma'
+        db.session.flush()
+        db.session.commit()
+        assert len(llamadas) == 1
+        assert report_cache.backend().version() != version
+
+
+def test_rollback_sin_cambios_no_invalida(app, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(report_cache, 'invalidar', lambda: llamadas.append(1))
+    with app.app_context():
+        db.session.add(Consulta(fecha_consulta=datetime(2024, 1, 1)))
+        db.session.flush()
+        db.session.rollback()
+        db.session.rollback()
+        db.session.commit()
+    assert len(llamadas) == 1
@@ -0,0 +1,59 @@
+"""Los contadores incrementales coinciden con una reconstrucción completa."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import db
+from app.models import Clinica, Consulta, EstadisticaDiagnostico, EstadisticaDiaria, Paciente
+from app.utils.rollups import rollups
+
+
+def contenido():
+    diaria = sorted((e.fecha, e.clinica_id or 0, e.total_consultas)
+                    for e in EstadisticaDiaria.query.all() if e.total_consultas)
+    diagnosticos = sorted((e.fecha, e.clinica_id or 0, e.diagnostico, e.total)
+                          for e in EstadisticaDiagnostico.query.all() if e.total)
+    return diaria, diagnosticos
+
+
+def test_incremental_igual_a_reconstruccion(app):
+    with app.app_context():
+        clinica = Clinica(nombre='Clínica Pruebas')
+        paciente = Paciente(nombre_completo='Rosa Pruebas', edad=40, sexo='Femenino')
+        db.session.add_all([clinica, paciente])
+        db.session.commit()
+        hoy = datetime(2024, 5, 10, 9, 0)
+        consultas = [Consulta(paciente_id=paciente.id, clinica_id=clinica.id if i % 3 else None,
+                              fecha_consulta=hoy - timedelta(days=i % 4), diagnostico=' Gripe ' if i % 2 else 'Asma')
+                     for i in range(12)]
+        db.session.add_all(consultas)
+        db.session.commit()
+        consultas[0].diagnostico = 'Migraña'
+        consultas[1].fecha_consulta = hoy - timedelta(days=30)
+        consultas[2].clinica_id = None
+        db.session.delete(consultas[3])
+        db.session.commit()
+
+        incremental = contenido()
+        rollups.rebuild()
+        db.session.expire_all()
+        assert incremental == contenido()
+
+
+def test_una_sentencia_por_contador(app):
+    with app.app_context():
+        clinica = Clinica(nombre='Clínica Pruebas')
+        db.session.add(clinica)
+        db.session.commit()
+        db.session.add(Consulta(clinica_id=clinica.id, fecha_consulta=datetime(2024, 5, 10), diagnostico='Gripe'))
+        db.session.commit()
+
+        sentencias = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: sentencias.append(args[2]))
+        db.session.add(Consulta(clinica_id=clinica.id, fecha_consulta=datetime(2024, 5, 10), diagnostico='gripe'))
+        db.session.commit()
+        rollup = [s for s in sentencias if 'estadistica_' in s and not s.startswith('SELECT')]
+        assert len(rollup) == 2 and all('ON CONFLICT' in s for s in rollup)
+        fila = EstadisticaDiaria.query.one()
+        assert fila.total_consultas == 2
+        assert EstadisticaDiagnostico.query.one().total == 2
@@ -0,0 +1,84 @@
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+ESCRITORES = 3
+LECTORES = 3
+OPERACIONES = 20
+
+
+@pytest.fixture
+def datos(app_archivo):
+    from app import db
+    from app.models import Clinica, Paciente, Usuario
+    with app_archivo.app_context():
+        clinica = Clinica(nombre='Clínica Concurrencia')
+        medico = Usuario(nombre_completo='Médico Concurrencia', usuario='medico_conc', rol='admin')
+        medico.set_password('x')
+        paciente = Paciente(nombre_completo='Paciente Concurrencia', edad=40, sexo='Femenino', dni='CONC01')
+        db.session.add_all([clinica, medico, paciente])
+        db.session.commit()
+        return {'clinica_id': clinica.id, 'medico_id': medico.id, 'paciente_id': paciente.id}
+
+
+def _escritor(app, datos, errores):
+    from app import db
+    from app.models import Consulta
+    for _ in range(OPERACIONES):
+        with app.app_context():
+            try:
+                db.session.add(Consulta(paciente_id=datos['paciente_id'], clinica_id=datos['clinica_id'],
+                                        medico_id=datos['medico_id'], estado='completada',
+                                        fecha_consulta=datetime.now(), diagnostico='Gastritis aguda',
+                                        motivo_consulta='control'))
+                db.session.commit()
+            except OperationalError as e:
+                db.session.rollback()
+                errores.append(str(e.orig))
+            finally:
+                db.session.remove()
+
+
+def _lector(app, datos, errores):
+    from app import db
+    from app.models import Consulta
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['_user_id'] = str(datos['medico_id'])
+        sesion['_fresh'] = True
+    for i in range(OPERACIONES):
+        try:
+            if i % 2:
+                respuesta = cliente.get('/api/reportes/estadisticas_generales')
+                if respuesta.status_code >= 500:
+                    errores.append(f'HTTP {respuesta.status_code}')
+            else:
+                with app.app_context():
+                    db.session.query(Consulta).filter_by(paciente_id=datos['paciente_id']).count()
+                    db.session.remove()
+        except OperationalError as e:
+            errores.append(str(e.orig))
+
+
+def test_escritores_y_lectores_concurrentes_sin_bloqueos(app_archivo, datos):
+    from app import db
+    from app.models import Consulta
+
+    with app_archivo.app_context():
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar().lower() == 'wal'
+
+    errores = []
+    hilos = [threading.Thread(target=_escritor, args=(app_archivo, datos, errores)) for _ in range(ESCRITORES)]
+    hilos += [threading.Thread(target=_lector, args=(app_archivo, datos, errores)) for _ in range(LECTORES)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert not [e for e in errores if 'locked' in e]
+    assert errores == []
+    with app_archivo.app_context():
+        assert db.session.query(Consulta).count() == ESCRITORES * OPERACIONES
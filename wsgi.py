@@ -0,0 +1,14 @@
+"""
+Punto de entrada WSGI de producción (sin servidor de desarrollo ni debug).
+
+    flask --app run serve                      # gunicorn o waitress según WSGI_SERVER
+    gunicorn -w 4 --threads 8 -k gthread wsgi:app
+    waitress-serve --threads=8 wsgi:app
+
+Bajo gunicorn la caché de reportes pasa sola a ``filesystem`` (compartida entre
+workers). Con otro servidor de varios procesos defina ``WSGI_MULTIPROCESS=true``.
+"""
+from app import create_app
+from app import models  # noqa: F401
+
+app = create_app()